@@ -3,345 +3,970 @@
 Flask Multi Store - Railway Deploy Version
 """
 
+import asyncio
+import base64
+import functools
+import hashlib
+import json
 import os
-from flask import Flask, session, request, redirect, url_for
+import threading
+
+import click
+from flask import (Flask, session, request, redirect, url_for, abort, g, render_template, jsonify, make_response,
+                   copy_current_request_context)
+from flask.globals import request_ctx
+from jinja2 import FileSystemBytecodeCache
+from markupsafe import Markup
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+import models
+import orders
+from assets import Assets
+from async_io import AsyncCartStore, EventLoopThread, IOPool
+from cache import Cache, create_shared_cache
+from cart_store import create_cart_store
+from compression import CompressionMiddleware, CACHEABLE
+from edge import EdgeCache
+from catalog import SORT_KEYS
+from catalog_source import CatalogSource, export_products
+from images import ImageProxy
+from inventory import Inventory, OutOfStock
+from jobs import JobQueue
+from metrics import Metrics
+from ratelimit import Limit, RateLimiter, parse_limits
+from models import db
+from models.order import Order
+from render_cache import FragmentCache, RenderedPage, SLOT
+from search import tokenize
+from tenants import StoreResolver, tenant_slug
+from warmup import Warmup
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'railway-secret-2024')
+models.init_app(app)
+
+# Metrics Prometheus; METRICS_DIR để gộp số liệu khi chạy nhiều worker
+metrics = Metrics(directory=os.environ.get('METRICS_DIR'),
+                  flush_interval=float(os.environ.get('METRICS_FLUSH_INTERVAL', 5)))
+metrics.init_app(app)
+
+# Chạy sau reverse proxy (Railway...): PROXY_COUNT=1 để lấy IP client từ X-Forwarded-For
+if int(os.environ.get('PROXY_COUNT', 0)):
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=int(os.environ['PROXY_COUNT']), x_proto=1)
+
+# Nén response theo Accept-Encoding (br/zstd/gzip)
+app.wsgi_app = CompressionMiddleware(
+    app.wsgi_app,
+    min_size=int(os.environ.get('COMPRESS_MIN_SIZE', 1024)),
+    levels={
+        'gzip': int(os.environ.get('COMPRESS_GZIP_LEVEL', 6)),
+        'br': int(os.environ.get('COMPRESS_BR_QUALITY', 4)),
+        'zstd': int(os.environ.get('COMPRESS_ZSTD_LEVEL', 3)),
+    },
+    cache_bytes=int(os.environ.get('COMPRESS_CACHE_MB', 32)) * 1024 * 1024,
+)
 
-# Dữ liệu sản phẩm trong memory
+# CSS/JS tự host, tên file theo hash nội dung (static/ -> /assets/...)
+assets = Assets(app)
+
+# Template Jinja: tùy chọn lưu bytecode ra đĩa để worker mới khởi động không phải biên dịch lại
+if os.environ.get('JINJA_BYTECODE_CACHE_DIR'):
+    os.makedirs(os.environ['JINJA_BYTECODE_CACHE_DIR'], exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(os.environ['JINJA_BYTECODE_CACHE_DIR'])
+
+# Catalog mặc định khi chưa có CATALOG_PATH
 products = [
-    {'id': 1, 'name': 'Bánh mì thịt nướng', 'price': 25000, 'image': 'https://images.unsplash.com/photo-1565299624946-b28f40a0ca4b?w=300&h=200&fit=crop', 'description': 'Bánh mì thịt nướng thơm ngon'},
-    {'id': 2, 'name': 'Phở bò đặc biệt', 'price': 45000, 'image': 'https://images.unsplash.com/photo-1567620905732-2d1ec7ab7445?w=300&h=200&fit=crop', 'description': 'Phở bò nước trong, thịt mềm'},
-    {'id': 3, 'name': 'Cơm tấm sườn nướng', 'price': 35000, 'image': 'https://images.unsplash.com/photo-1540189549336-e6e99c3679fe?w=300&h=200&fit=crop', 'description': 'Cơm tấm sườn nướng đậm đà'},
-    {'id': 4, 'name': 'Cà phê sữa đá', 'price': 20000, 'image': 'https://images.unsplash.com/photo-1544145945-f90425340c7e?w=300&h=200&fit=crop', 'description': 'Cà phê sữa đá truyền thống'},
+    {'id': 1, 'name': 'Bánh mì thịt nướng', 'price': 25000, 'image': 'https://images.unsplash.com/photo-1565299624946-b28f40a0ca4b?w=300&h=200&fit=crop', 'description': 'Bánh mì thịt nướng thơm ngon', 'category': 'do-an'},
+    {'id': 2, 'name': 'Phở bò đặc biệt', 'price': 45000, 'image': 'https://images.unsplash.com/photo-1567620905732-2d1ec7ab7445?w=300&h=200&fit=crop', 'description': 'Phở bò nước trong, thịt mềm', 'category': 'do-an'},
+    {'id': 3, 'name': 'Cơm tấm sườn nướng', 'price': 35000, 'image': 'https://images.unsplash.com/photo-1540189549336-e6e99c3679fe?w=300&h=200&fit=crop', 'description': 'Cơm tấm sườn nướng đậm đà', 'category': 'do-an'},
+    {'id': 4, 'name': 'Cà phê sữa đá', 'price': 20000, 'image': 'https://images.unsplash.com/photo-1544145945-f90425340c7e?w=300&h=200&fit=crop', 'description': 'Cà phê sữa đá truyền thống', 'category': 'do-uong'},
 ]
 
+# Thông tin hiển thị khi không chọn store (?store=slug)
+DEFAULT_STORE = {
+    'slug': None,
+    'name': 'Cửa hàng Online',
+    'description': 'Đồ ăn ngon, giá rẻ, giao hàng nhanh chóng',
+    'phone': '0123456789',
+    'email': 'contact@store.com',
+}
+
+# CATALOG_PATH (.json/.csv/.bin): sửa file là catalog được nạp lại nền, không cần restart worker.
+# CATALOG_SNAPSHOT: catalog đã dựng index được lưu lại, worker khởi động sau nạp thẳng (để trống là tắt)
+catalog_source = CatalogSource(os.environ.get('CATALOG_PATH'), fallback=products,
+                               poll_interval=float(os.environ.get('CATALOG_POLL_INTERVAL', 2)),
+                               snapshot_path=os.environ.get('CATALOG_SNAPSHOT',
+                                                            os.path.join(app.instance_path, 'catalog.snapshot')))
+fragments = FragmentCache()
+# Store (tenant) theo subdomain của STORE_DOMAIN (demo.shop.vn) hoặc ?store=demo; mỗi store một catalog,
+# tổng bộ nhớ catalog giới hạn CATALOG_CACHE_MB, mỗi store tối đa TENANT_CATALOG_MB khi đã hết chỗ;
+# TENANT_OVERFLOW_CATALOGS catalog vượt quota được giữ thêm ngoài ngân sách
+STORE_DOMAIN = os.environ.get('STORE_DOMAIN', '')
+stores = StoreResolver(ttl=int(os.environ.get('STORE_CACHE_TTL', 60)),
+                       max_stores=int(os.environ.get('STORE_CACHE_SIZE', 10000)),
+                       catalog_bytes=int(os.environ.get('CATALOG_CACHE_MB', 256)) * 1024 * 1024,
+                       tenant_catalog_bytes=int(os.environ.get('TENANT_CATALOG_MB', 32)) * 1024 * 1024,
+                       overflow_catalogs=int(os.environ.get('TENANT_OVERFLOW_CATALOGS', 4)))
+
+# Stream HTML theo chunk: 'auto' khi số dòng vượt STREAM_THRESHOLD, '1' luôn stream, '0' không bao giờ
+STREAM_PAGES = os.environ.get('STREAM_PAGES', 'auto')
+STREAM_THRESHOLD = int(os.environ.get('STREAM_THRESHOLD', 1000))
+STREAM_CHUNK_SIZE = int(os.environ.get('STREAM_CHUNK_SIZE', 100))
+# Trang chủ stream từ bản render sẵn trong cache, theo chunk bytes
+STREAM_CHUNK_BYTES = int(os.environ.get('STREAM_CHUNK_BYTES', 64 * 1024))
+
+# Giỏ hàng lưu phía server, cookie session chỉ chứa cart_id
+cart_store = create_cart_store(os.environ.get(
+    'CART_STORE_URL', 'sqlite:///' + os.path.join(app.instance_path, 'carts.sqlite3')))
+
+# View async (ASYNC_VIEWS=1, bật sẵn khi chạy qua asgi.py): chờ catalog và giỏ hàng song song
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS') == '1'
+# Mọi view async chạy chung một event loop thay vì mỗi request một loop mới
+app.async_to_sync = EventLoopThread().async_to_sync
+io_pool = IOPool(app, max_workers=int(os.environ.get('ASYNC_IO_POOL_SIZE', 32)))
+async_cart_store = AsyncCartStore(cart_store, io_pool)
+
+# Giữ hàng khi thêm vào giỏ, cho sản phẩm có quản lý tồn kho (sản phẩm của store trong database)
+inventory = Inventory(os.environ.get('INVENTORY_PATH', os.path.join(app.instance_path, 'inventory.sqlite3')),
+                      ttl=int(os.environ.get('RESERVATION_TTL', 900)), settle_ttl=stores.ttl)
+
+# Hàng đợi job nền (email, tồn kho, hóa đơn...); JOB_WORKERS=0 thì chạy riêng bằng `flask worker`.
+# Thread worker khởi động ở request đầu tiên của mỗi process (xem resolve_store), không chạy trong master gunicorn
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+jobs = JobQueue(os.environ.get('JOB_QUEUE_PATH', os.path.join(app.instance_path, 'jobs.sqlite3')),
+                max_attempts=int(os.environ.get('JOB_MAX_ATTEMPTS', 5)))
+jobs.init_app(app)
+orders.init_jobs(jobs, inventory)
+
+# Giới hạn tần suất các route ghi giỏ hàng/đơn hàng, theo phiên và theo IP (gấp RATE_LIMIT_CLIENT_FACTOR lần)
+RATE_LIMITS = parse_limits(os.environ.get(
+    'RATE_LIMITS', 'add_to_cart=30/10s, remove_from_cart=30/10s, api_update_cart=30/10s, checkout=5/m'))
+limiter = RateLimiter(os.environ.get('RATE_LIMIT_PATH', os.path.join(app.instance_path, 'ratelimit.bin')),
+                      RATE_LIMITS, client_factor=int(os.environ.get('RATE_LIMIT_CLIENT_FACTOR', 4)))
+limiter.init_app(app)
+# Quota request của mỗi store (mọi route, mọi worker cộng lại); để trống là tắt
+TENANT_RATE_LIMIT = os.environ.get('TENANT_RATE_LIMIT', '6000/m')
+TENANT_LIMIT = Limit.parse(TENANT_RATE_LIMIT) if TENANT_RATE_LIMIT.strip() else None
+
+def interface_stamp():
+    """Dấu của template và asset: deploy giao diện mới thì trang render sẵn trong cache dùng chung cũng mới"""
+    digest = hashlib.blake2b(assets.digest.encode('utf-8'), digest_size=8)
+    for name in sorted(app.jinja_env.list_templates()):
+        digest.update(app.jinja_env.loader.get_source(app.jinja_env, name)[0].encode('utf-8'))
+    return digest.hexdigest()
+
+# Cache hai tầng (LRU mỗi worker + cache dùng chung) cho trang render sẵn, kết quả tìm kiếm, tổng giỏ hàng
+cache = Cache(create_shared_cache(os.environ.get(
+                  'CACHE_URL', 'sqlite:///' + os.path.join(app.instance_path, 'cache.sqlite3'))),
+              local_size=int(os.environ.get('CACHE_LOCAL_SIZE', 1024)),
+              local_bytes=int(os.environ.get('CACHE_LOCAL_MB', 64)) * 1024 * 1024,
+              namespace_size=int(os.environ.get('CACHE_TENANT_SIZE', 128)),
+              namespace_bytes=int(os.environ.get('CACHE_TENANT_MB', 8)) * 1024 * 1024,
+              prefix=f'shop:{interface_stamp()}')
+# Tổng giỏ hàng được ghi đè sau mỗi lần sửa giỏ; TTL chỉ để dọn giỏ bỏ dở
+CART_SUMMARY_TTL = int(os.environ.get('CART_SUMMARY_TTL', 3600))
+
+# Trang chủ dạng shell cho CDN/reverse proxy (public, s-maxage=EDGE_CACHE_TTL; 0 là tắt, trang theo phiên);
+# catalog đổi thì job nền purge theo surrogate key qua EDGE_PURGE_URL (chứa {key})
+edge = EdgeCache(ttl=int(os.environ.get('EDGE_CACHE_TTL', 60)),
+                 purge_url=os.environ.get('EDGE_PURGE_URL', ''),
+                 purge_method=os.environ.get('EDGE_PURGE_METHOD', 'POST'),
+                 purge_headers=json.loads(os.environ.get('EDGE_PURGE_HEADERS') or '{}'))
+
+@jobs.task()
+def purge_edge(keys):
+    edge.purge(keys)
+
+def catalog_changed(store, old, new):
+    """Purge trang dựng từ catalog cũ trên CDN, một lần dù mọi worker đều thấy catalog đổi"""
+    if not edge.purge_url:
+        return
+    namespace = cache_namespace(store)
+    if cache.add(namespace, 'edge-purge', True, version=f'{old.stamp}:{new.stamp}'):
+        jobs.enqueue('purge_edge', {'keys': edge.changed_keys(namespace, old, new)})
+
+catalog_source.on_change = functools.partial(catalog_changed, DEFAULT_STORE)
+stores.on_change = catalog_changed
+
+# Ảnh sản phẩm đã resize/chuyển WebP-AVIF, cache trên đĩa
+images = ImageProxy(
+    lambda product_id: current_catalog().get(product_id),
+    cache_dir=os.environ.get('IMAGE_CACHE_DIR', os.path.join(app.instance_path, 'images')),
+    max_bytes=int(os.environ.get('IMAGE_CACHE_MAX_MB', 512)) * 1024 * 1024,
+)
+
+# Nạp catalog, biên dịch template, render trang chủ nền khi worker khởi động; /health báo sẵn sàng khi xong
+warmup = Warmup()
+warmup.init_app(app)
+
+def get_cart_id(create=False):
+    cart_id = session.get('cart_id')
+    if cart_id is None and create:
+        cart_id = session['cart_id'] = cart_store.new_id()
+    if cart_id and g.store:
+        # Mỗi store một giỏ hàng riêng vì id sản phẩm khác nhau
+        cart_id = f"{cart_id}:{g.store['slug']}"
+    return cart_id
+
+def load_cart():
+    cart_id = get_cart_id()
+    return cart_store.get(cart_id) if cart_id else {}
+
+def current_store():
+    return g.store or DEFAULT_STORE
+
+def cache_namespace(store):
+    """Namespace cache của store, khóa của các store không bao giờ trùng nhau"""
+    return f"store:{store['slug'] or ''}"
+
+def fetch_catalog(store):
+    return stores.catalog(store) if store else catalog_source.catalog
+
+def current_catalog():
+    """Catalog của store đang chọn, lấy một lần mỗi request để cả request dùng cùng một bản"""
+    if 'catalog' not in g:
+        g.catalog = fetch_catalog(g.store)
+    return g.catalog
+
+async def async_value(value):
+    return value
+
+async def async_catalog():
+    if 'catalog' not in g:
+        g.catalog = fetch_catalog(None) if g.store is None else await io_pool.run(fetch_catalog, g.store)
+    return g.catalog
+
+async def async_cart_count(cart_id):
+    return await async_cart_store.count(cart_id) if cart_id else 0
+
+async def in_request(fn, *args):
+    """Chạy fn trong io_pool với request context và g của request hiện tại: cache, render
+    (có thể chờ lease tới LEASE_TTL) không được chặn event loop dùng chung"""
+    values = dict(vars(g))
+
+    @copy_current_request_context
+    def call():
+        vars(g).update(values)
+        return fn(*args)
+    return await io_pool.run(call)
+
+# Endpoint không thuộc store nào: không xác định store
+UNSCOPED_ENDPOINTS = {'static', 'asset', 'health', 'prometheus_metrics'}
+# Endpoint của giỏ hàng (đằng nào cũng đọc session): store nhớ trong session khi URL không ghi rõ
+SESSION_ENDPOINTS = {'home', 'cart', 'add_to_cart', 'remove_from_cart', 'checkout', 'api_cart', 'api_cart_summary',
+                     'api_update_cart'}
+
+@app.before_request
+def resolve_store():
+    """Xác định store từ subdomain, hoặc từ ?store=slug (route giỏ hàng nhớ lại trong session cho các request sau)
+
+    `?store=` rỗng là store mặc định: trang shell và form/JS của nó luôn ghi rõ store,
+    không bao giờ rơi về store đã lưu trong session của lần xem store khác. Route khác (API
+    catalog, ảnh, shell trên CDN) không đọc session để Flask không thêm Vary: Cookie.
+    """
+    catalog_source.start()
+    jobs.start(JOB_WORKERS)
+    g.store = None
+    if request.endpoint in UNSCOPED_ENDPOINTS:
+        return
+    slug = tenant_slug(request.host, STORE_DOMAIN)
+    if slug is not None:
+        # Subdomain cố định store, ?store= không đổi được sang store khác
+        g.store = stores.store(slug)
+        if g.store is None:
+            abort(404)
+    elif request.endpoint not in SESSION_ENDPOINTS or (request.endpoint == 'home' and edge.enabled):
+        # API catalog, ảnh, shell dùng chung trên CDN: store chỉ lấy từ URL, không đọc/ghi session
+        # (không Vary: Cookie, Set-Cookie)
+        slug = request.args.get('store')
+        g.store = stores.store(slug) if slug else None
+    else:
+        slug = request.args.get('store')
+        if slug is None:
+            slug = session.get('store')
+        g.store = stores.store(slug) if slug else None
+        if g.store is None:
+            session.pop('store', None)
+        elif session.get('store') != slug:
+            session['store'] = slug
+    if g.store is not None and TENANT_LIMIT is not None:
+        limiter.enforce(f"tenant:{g.store['id']}", TENANT_LIMIT)
+
+# Context processors để inject biến vào templates
+@app.context_processor
+def inject_store():
+    """Inject store info vào tất cả templates"""
+    store = getattr(g, 'store', None)
+    return dict(current_store=store)
+
+# Error handlers
+@app.errorhandler(404)
+def not_found_error(error):
+    return render_template('errors/404.html'), 404
+
+@app.errorhandler(409)
+def conflict_error(error):
+    return render_template('errors/409.html'), 409
+
+@app.errorhandler(429)
+def too_many_requests_error(error):
+    headers = {'Retry-After': str(error.retry_after)}
+    if request.path.startswith('/api/'):
+        return jsonify(error='quá nhiều request, thử lại sau', retry_after=error.retry_after), 429, headers
+    return render_template('errors/429.html', retry_after=error.retry_after), 429, headers
+
+@app.errorhandler(500)
+def internal_error(error):
+    db.session.rollback()
+    return render_template('errors/500.html'), 500
+
+def should_stream(size):
+    if STREAM_PAGES == 'auto':
+        return size > STREAM_THRESHOLD
+    return STREAM_PAGES == '1'
+
+@app.template_filter('vnd')
+def format_vnd(amount):
+    return f'{amount:,}đ'
+
+@app.template_global()
+def picture(product, variant, img_attrs):
+    store = g.get('store')
+    return Markup(images.picture(product, variant, img_attrs, store=store['slug'] if store else ''))
+
+@app.template_global()
+def store_url(endpoint, **values):
+    """URL trong store đang xem, kèm ?store=slug (rỗng là store mặc định): trang lấy từ CDN
+    không qua session vẫn giữ đúng store"""
+    store = g.get('store')
+    values['store'] = store['slug'] if store else ''
+    return url_for(endpoint, **values)
+
+@app.template_global()
+def product_card(product):
+    """Thẻ sản phẩm, render một lần cho mỗi bộ dữ liệu hiển thị của sản phẩm (và store)"""
+    store = g.get('store')
+    key = (store and store['slug'], product['id'], product['name'], product['description'], product['price'],
+           product['image'])
+    return fragments.get(key, lambda: Markup(
+        app.jinja_env.get_template('partials/product_card.html').render(product=product)))
+
+def stream_page(template_name, **context):
+    """Render template thành từng chunk (mỗi chunk khoảng STREAM_CHUNK_SIZE mảnh) thay vì cả trang
+
+    Body được đọc sau khi view trả về, có thể ở thread khác (view async render trong io_pool):
+    generator tự đẩy bản sao request context và g khi bắt đầu đọc, gỡ khi đọc xong, để template
+    vẫn dùng được g, url_for (store_url, product_card).
+    """
+    app.update_template_context(context)
+    stream = app.jinja_env.get_template(template_name).stream(context)
+    stream.enable_buffering(STREAM_CHUNK_SIZE)
+    ctx = request_ctx.copy()
+    values = dict(vars(g))
+
+    def chunks():
+        with ctx:
+            vars(g).update(values)
+            yield from stream
+    return chunks()
+
+def home_page(store, catalog):
+    """Phần tĩnh của trang chủ, render một lần cho mỗi bộ dữ liệu catalog (dùng chung giữa các worker),
+    chừa SLOT cho số lượng giỏ hàng"""
+    return cache.get_or_set(cache_namespace(store), 'home', version=catalog.stamp, build=lambda: RenderedPage(
+        catalog.stamp, render_template('home.html', store=store, products=catalog, cart_count=SLOT)))
+
+def home_response(store, catalog, cart_count=None):
+    """Trang chủ; cart_count None là bản shell giống nhau cho mọi người dùng (cart.js điền số món), CDN giữ được"""
+    badge = '' if cart_count is None else cart_count
+    page = home_page(store, catalog)
+    if should_stream(len(catalog)):
+        # Trang lớn: gửi dần bản render sẵn theo chunk; make_conditional không gom generator để tính Content-Length
+        response = app.response_class(page.stream(badge, size=STREAM_CHUNK_BYTES), mimetype='text/html')
+        response.implicit_sequence_conversion = False
+    else:
+        response = app.response_class(page.render(badge), mimetype='text/html')
+    response.set_etag(page.etag(badge))
+    # Body chỉ phụ thuộc ETag nên bản nén được dùng lại cho mọi request cùng ETag
+    request.environ[CACHEABLE] = True
+    if cart_count is None:
+        response.last_modified = page.last_modified
+        edge.cacheable(response, cache_namespace(store), catalog)
+    else:
+        # Số món trong giỏ đổi mà thời điểm render không đổi: chỉ ETag mới xác thực được bản theo phiên
+        response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
 @app.route('/')
 def home():
-    cart_count = sum(session.get('cart', {}).values())
-
-    html = f'''<!DOCTYPE html>
-<html lang="vi">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>🏪 Cửa hàng Online</title>
-    <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/css/bootstrap.min.css" rel="stylesheet">
-    <style>
-        .product-card {{ transition: transform 0.2s; border: none; box-shadow: 0 2px 8px rgba(0,0,0,0.1); }}
-        .product-card:hover {{ transform: translateY(-5px); box-shadow: 0 4px 15px rgba(0,0,0,0.2); }}
-        .hero {{ background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 60px 0; }}
-    </style>
-</head>
-<body>
-    <nav class="navbar navbar-expand-lg navbar-light bg-white shadow-sm">
-        <div class="container">
-            <a class="navbar-brand fw-bold text-primary" href="/">🏪 Cửa hàng Online</a>
-            <div class="navbar-nav ms-auto">
-                <a href="/cart" class="btn btn-outline-primary position-relative">
-                    🛒 Giỏ hàng <span class="position-absolute top-0 start-100 translate-middle badge rounded-pill bg-danger">{cart_count}</span>
-                </a>
-            </div>
-        </div>
-    </nav>
-
-    <section class="hero">
-        <div class="container text-center">
-            <h1 class="display-4 fw-bold mb-3">🏪 Cửa hàng Online</h1>
-            <p class="lead">Đồ ăn ngon, giá rẻ, giao hàng nhanh chóng</p>
-            <p>📞 0123456789 | 📧 contact@store.com</p>
-        </div>
-    </section>
-
-    <div class="container my-5">
-        <h2 class="text-center mb-5">🍽️ Sản phẩm của chúng tôi</h2>
-        <div class="row">'''
-
-    for product in products:
-        html += f'''
-            <div class="col-lg-3 col-md-6 mb-4">
-                <div class="card product-card h-100">
-                    <img src="{product['image']}" class="card-img-top" style="height: 200px; object-fit: cover;">
-                    <div class="card-body d-flex flex-column">
-                        <h5 class="card-title">{product['name']}</h5>
-                        <p class="card-text text-muted flex-grow-1">{product['description']}</p>
-                        <p class="text-primary fw-bold fs-5">{product['price']:,}đ</p>
-                        <form method="POST" action="/add-to-cart" class="mt-auto">
-                            <input type="hidden" name="product_id" value="{product['id']}">
-                            <button type="submit" class="btn btn-primary w-100">🛒 Thêm vào giỏ</button>
-                        </form>
-                    </div>
-                </div>
-            </div>'''
-
-    html += '''
-        </div>
-    </div>
-
-    <footer class="bg-dark text-white text-center py-4">
-        <div class="container"><p>&copy; 2024 Cửa hàng Online. Powered by Flask</p></div>
-    </footer>
-
-    <script src="https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/js/bootstrap.bundle.min.js"></script>
-</body>
-</html>'''
-    return html
-    
-    # Context processors để inject biến vào templates
-    @app.context_processor
-    def inject_store():
-        """Inject store info vào tất cả templates"""
-        store = getattr(g, 'store', None)
-        return dict(current_store=store)
-    
-    # Error handlers
-    @app.errorhandler(404)
-    def not_found_error(error):
-        return render_template('errors/404.html'), 404
-    
-    @app.errorhandler(500)
-    def internal_error(error):
-        return render_template('errors/500.html'), 500
-    
-    # CLI commands
-    @app.cli.command()
-    def init_db_command():
-        """Khởi tạo database với dữ liệu mẫu"""
-        from models import db
-        from models.store import Store
-        from models.product import ProductCategory, Product
-        from models.user import User
-        
-        # Tạo tables
-        db.create_all()
-        
-        # Tạo store mẫu
-        demo_store = Store.query.filter_by(slug='demo').first()
-        if not demo_store:
-            demo_store = Store(
-                name='Cửa hàng Demo',
-                slug='demo',
-                description='Cửa hàng demo cho hệ thống bán hàng đa tenant',
-                phone='0123456789',
-                email='demo@example.com',
-                address='123 Đường ABC, Quận XYZ, TP.HCM',
-                primary_color='#007bff',
-                secondary_color='#6c757d'
-            )
-            db.session.add(demo_store)
-            db.session.flush()
-            
-            # Tạo admin user
-            admin_user = User(
-                store_id=demo_store.id,
-                username='admin',
-                email='admin@demo.com',
-                full_name='Quản trị viên',
-                role='admin'
-            )
-            admin_user.set_password('admin123')
-            db.session.add(admin_user)
-            
-            # Tạo danh mục mẫu
-            categories = [
-                {'name': 'Đồ ăn', 'slug': 'do-an', 'description': 'Các món ăn ngon'},
-                {'name': 'Đồ uống', 'slug': 'do-uong', 'description': 'Các loại đồ uống'},
-                {'name': 'Tráng miệng', 'slug': 'trang-mieng', 'description': 'Món tráng miệng'}
-            ]
-            
-            for i, cat_data in enumerate(categories):
-                category = ProductCategory(
-                    store_id=demo_store.id,
-                    name=cat_data['name'],
-                    slug=cat_data['slug'],
-                    description=cat_data['description'],
-                    sort_order=i
-                )
-                db.session.add(category)
-                db.session.flush()
-                
-                # Tạo sản phẩm mẫu cho mỗi danh mục
-                products = [
-                    {'name': f'{cat_data["name"]} 1', 'price': 50000},
-                    {'name': f'{cat_data["name"]} 2', 'price': 75000},
-                    {'name': f'{cat_data["name"]} 3', 'price': 100000}
-                ]
-                
-                for j, prod_data in enumerate(products):
-                    product = Product(
-                        store_id=demo_store.id,
-                        category_id=category.id,
-                        name=prod_data['name'],
-                        slug=f"{cat_data['slug']}-{j+1}",
-                        description=f'Mô tả chi tiết cho {prod_data["name"]}',
-                        short_description=f'Mô tả ngắn cho {prod_data["name"]}',
-                        price=prod_data['price'],
-                        stock_quantity=100,
-                        sort_order=j,
-                        is_featured=(j == 0)  # Sản phẩm đầu tiên là featured
-                    )
-                    db.session.add(product)
-            
-            db.session.commit()
-            print('✅ Đã khởi tạo database với dữ liệu mẫu')
-            print('🔑 Tài khoản admin: admin / admin123')
-            print('🏪 Store demo: http://localhost:5000?store=demo')
-        else:
-            print('⚠️  Database đã được khởi tạo trước đó')
-    
-    @app.cli.command()
-    def create_store():
-        """Tạo store mới"""
-        from models import db
-        from models.store import Store
-        from models.user import User
-        
-        name = input('Tên cửa hàng: ')
-        slug = input('Slug (URL): ')
-        email = input('Email: ')
-        phone = input('Số điện thoại: ')
-        address = input('Địa chỉ: ')
-        
-        # Kiểm tra slug trùng
-        existing = Store.query.filter_by(slug=slug).first()
-        if existing:
-            print('❌ Slug đã tồn tại')
-            return
-        
-        store = Store(
-            name=name,
-            slug=slug,
-            email=email,
-            phone=phone,
-            address=address
-        )
-        db.session.add(store)
-        db.session.flush()
-        
-        # Tạo admin user cho store
-        admin_username = input('Username admin: ')
-        admin_password = input('Password admin: ')
-        admin_email = input('Email admin: ')
-        
-        admin_user = User(
-            store_id=store.id,
-            username=admin_username,
-            email=admin_email,
-            full_name='Quản trị viên',
-            role='admin'
-        )
-        admin_user.set_password(admin_password)
-        db.session.add(admin_user)
-        
-        db.session.commit()
-        print(f'✅ Đã tạo store: {name}')
-        print(f'🔗 URL: http://localhost:5000?store={slug}')
-        print(f'👤 Admin: {admin_username} / {admin_password}')
-    
-@app.route('/cart')
-def cart():
-    cart = session.get('cart', {})
-    cart_items = []
-    total = 0
+    if edge.enabled:
+        return home_response(current_store(), current_catalog())
+    cart_id = get_cart_id()
+    cart_count = cart_store.count(cart_id) if cart_id else 0
+    return home_response(current_store(), current_catalog(), cart_count)
+
+async def async_home():
+    if edge.enabled:
+        return await in_request(home_response, current_store(), await async_catalog())
+    cart_id = get_cart_id()
+    catalog, cart_count = await asyncio.gather(async_catalog(), async_cart_count(cart_id))
+    return await in_request(home_response, current_store(), catalog, cart_count)
 
+def cart_lines(cart, catalog):
+    """(product, quantity, thành tiền) cho các sản phẩm còn trong catalog"""
     for product_id, quantity in cart.items():
-        product = next((p for p in products if p['id'] == int(product_id)), None)
+        product = catalog.get(product_id)
         if product:
-            item_total = product['price'] * quantity
-            cart_items.append({'product': product, 'quantity': quantity, 'total': item_total})
-            total += item_total
-
-    html = f'''<!DOCTYPE html>
-<html lang="vi">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>🛒 Giỏ hàng</title>
-    <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/css/bootstrap.min.css" rel="stylesheet">
-</head>
-<body>
-    <nav class="navbar navbar-light bg-light">
-        <div class="container">
-            <a class="navbar-brand fw-bold" href="/">🏪 Cửa hàng Online</a>
-            <a href="/" class="btn btn-outline-secondary">← Quay lại</a>
-        </div>
-    </nav>
-
-    <div class="container mt-4">
-        <h2>🛒 Giỏ hàng của bạn</h2>'''
-
-    if cart_items:
-        html += '''<div class="table-responsive">
-            <table class="table table-hover">
-                <thead class="table-light">
-                    <tr><th>Sản phẩm</th><th>Hình ảnh</th><th>Số lượng</th><th>Đơn giá</th><th>Thành tiền</th><th>Thao tác</th></tr>
-                </thead>
-                <tbody>'''
-
-        for item in cart_items:
-            html += f'''<tr>
-                <td><strong>{item['product']['name']}</strong><br><small class="text-muted">{item['product']['description']}</small></td>
-                <td><img src="{item['product']['image']}" style="width: 50px; height: 50px; object-fit: cover;" class="rounded"></td>
-                <td>{item['quantity']}</td>
-                <td>{item['product']['price']:,}đ</td>
-                <td class="fw-bold text-primary">{item['total']:,}đ</td>
-                <td><a href="/remove/{item['product']['id']}" class="btn btn-sm btn-outline-danger" onclick="return confirm('Xóa sản phẩm này?')">🗑️</a></td>
-            </tr>'''
-
-        html += f'''</tbody>
-                <tfoot>
-                    <tr class="table-success">
-                        <th colspan="4">Tổng cộng:</th>
-                        <th class="text-primary">{total:,}đ</th>
-                        <th></th>
-                    </tr>
-                </tfoot>
-            </table>
-        </div>
-
-        <div class="row mt-4">
-            <div class="col-md-6">
-                <a href="/" class="btn btn-outline-secondary btn-lg">← Tiếp tục mua hàng</a>
-            </div>
-            <div class="col-md-6 text-end">
-                <button class="btn btn-success btn-lg">💳 Thanh toán ({total:,}đ)</button>
-            </div>
-        </div>'''
-    else:
-        html += '''<div class="text-center py-5">
-            <h3>🛒 Giỏ hàng trống</h3>
-            <p class="text-muted">Bạn chưa có sản phẩm nào trong giỏ hàng</p>
-            <a href="/" class="btn btn-primary btn-lg">🛍️ Bắt đầu mua sắm</a>
-        </div>'''
-
-    html += '''</div>
-    <script src="https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/js/bootstrap.bundle.min.js"></script>
-</body>
-</html>'''
-    return html
+            yield product, quantity, product['price'] * quantity
+
+def cart_response(store, catalog, cart, notice=None):
+    lines = list(cart_lines(cart, catalog))
+    context = dict(store=store, lines=lines, total=sum(line[2] for line in lines), notice=notice)
+    if should_stream(len(lines)):
+        return app.response_class(stream_page('cart.html', **context), mimetype='text/html')
+    return render_template('cart.html', **context)
+
+@app.route('/cart')
+def cart():
+    return cart_response(current_store(), current_catalog(), load_cart())
+
+async def async_cart():
+    cart_id = get_cart_id()
+    catalog, cart = await asyncio.gather(
+        async_catalog(), async_cart_store.get(cart_id) if cart_id else async_value({}))
+    return await in_request(cart_response, current_store(), catalog, cart)
 
 @app.route('/add-to-cart', methods=['POST'])
 def add_to_cart():
-    product_id = request.form.get('product_id')
-    if product_id:
-        cart = session.get('cart', {})
-        cart[product_id] = cart.get(product_id, 0) + 1
-        session['cart'] = cart
-    return redirect(url_for('home'))
-
-@app.route('/remove/<int:product_id>')
+    product = current_catalog().get(request.form.get('product_id'))
+    if product is None:
+        abort(400)
+    cart_id = get_cart_id(create=True)
+    if over_limit(cart_store.get(cart_id), product):
+        abort(400)
+    if not reserve(cart_id, product):
+        abort(409)
+    cart_store.incr(cart_id, product['id'], price=product['price'], stamp=current_catalog().price_stamp)
+    cart_changed(cart_id, current_catalog(), cart_namespace())
+    return redirect(store_url('home'))
+
+async def async_add_to_cart():
+    catalog = await async_catalog()
+    product = catalog.get(request.form.get('product_id'))
+    if product is None:
+        abort(400)
+    cart_id = get_cart_id(create=True)
+    if over_limit(await async_cart_store.get(cart_id), product):
+        abort(400)
+    if not await io_pool.run(reserve, cart_id, product):
+        abort(409)
+    await async_cart_store.incr(cart_id, product['id'], price=product['price'], stamp=catalog.price_stamp)
+    await io_pool.run(cart_changed, cart_id, catalog, cart_namespace())
+    return redirect(store_url('home'))
+
+def reserve(cart_id, product, quantity=1):
+    """Giữ hàng cho giỏ; sản phẩm không có stock_quantity thì không giới hạn"""
+    if product.get('stock_quantity') is None:
+        return True
+    return inventory.reserve(cart_id, str(product['id']), quantity, product['stock_quantity'])
+
+def over_limit(cart, product, quantity=1):
+    """True nếu thêm `quantity` vượt MAX_QUANTITY của dòng hoặc MAX_CART_QUANTITY của giỏ"""
+    return (cart.get(str(product['id']), 0) + quantity > MAX_QUANTITY
+            or sum(cart.values()) + quantity > MAX_CART_QUANTITY)
+
+# Chỉ POST: link GET bị bot và trình duyệt prefetch gọi tùy ý
+@app.route('/remove/<int:product_id>', methods=['POST'])
 def remove_from_cart(product_id):
-    cart = session.get('cart', {})
-    if str(product_id) in cart:
-        del cart[str(product_id)]
-        session['cart'] = cart
-    return redirect(url_for('cart'))
+    cart_id = get_cart_id()
+    if cart_id:
+        cart_store.remove(cart_id, product_id)
+        inventory.release(cart_id, str(product_id))
+        cart_changed(cart_id, current_catalog(), cart_namespace())
+    return redirect(store_url('cart'))
+
+async def async_remove_from_cart(product_id):
+    cart_id = get_cart_id()
+    if cart_id:
+        await asyncio.gather(async_cart_store.remove(cart_id, product_id),
+                             io_pool.run(inventory.release, cart_id, str(product_id)))
+        await io_pool.run(cart_changed, cart_id, await async_catalog(), cart_namespace())
+    return redirect(store_url('cart'))
+
+def use_async_views(enabled=True):
+    """Đổi các route trang/giỏ hàng sang bản async (chờ catalog và giỏ hàng song song) hoặc ngược lại"""
+    views = (home, cart, add_to_cart, remove_from_cart)
+    if enabled:
+        views = (async_home, async_cart, async_add_to_cart, async_remove_from_cart)
+    app.view_functions.update(zip(('home', 'cart', 'add_to_cart', 'remove_from_cart'), views))
+
+if ASYNC_VIEWS:
+    use_async_views()
+
+@app.route('/checkout', methods=['POST'])
+def checkout():
+    """Chụp giỏ hàng, tính lại giá theo catalog, ghi đơn; các bước chậm chạy bằng job nền"""
+    cart_id = get_cart_id()
+    cart = cart_store.get(cart_id) if cart_id else {}
+    catalog = current_catalog()
+    lines = list(cart_lines(cart, catalog))
+    if not lines:
+        return redirect(store_url('cart'))
+    if request.form.get('total', type=int) != sum(line[2] for line in lines):
+        # Giá hoặc giỏ hàng đã đổi kể từ lúc khách mở trang giỏ hàng
+        notice = 'Giá hoặc giỏ hàng vừa thay đổi, vui lòng kiểm tra lại trước khi thanh toán.'
+        return cart_response(current_store(), catalog, cart, notice), 409
+    customer = {key: request.form.get(key, '').strip() for key in ('name', 'phone', 'email')}
+    if not customer['name'] or not customer['phone']:
+        abort(400)
+
+    # Trừ hẳn phần hàng đang giữ (giữ lại nếu đã hết hạn mà vẫn còn hàng)
+    tracked = [(str(product['id']), quantity, product['stock_quantity'])
+               for product, quantity, _ in lines if product.get('stock_quantity') is not None]
+    code = orders.new_code()
+    try:
+        inventory.commit(cart_id, {sku: quantity for sku, quantity, _ in tracked},
+                         {sku: on_hand for sku, _, on_hand in tracked}, code)
+    except OutOfStock:
+        notice = 'Một số sản phẩm trong giỏ vừa hết hàng, vui lòng giảm số lượng rồi thanh toán lại.'
+        return cart_response(current_store(), catalog, cart, notice), 409
+    try:
+        order_id, code = orders.place_order(current_store(), lines, customer, code)
+    except Exception:
+        inventory.cancel(code)
+        raise
+    cart_store.clear(cart_id)
+    cart_changed(cart_id, catalog, cart_namespace())
+    jobs.enqueue('order_placed', {'order_id': order_id})
+    return redirect(store_url('order_detail', code=code))
+
+@app.route('/orders/<code>')
+def order_detail(code):
+    orders.ensure_tables()
+    order = Order.query.filter_by(code=code).first_or_404()
+    return render_template('order.html', store=current_store(), order=order)
+
+# API giỏ hàng: một request áp cả lô thao tác, trả về giỏ hàng mới kèm tổng tiền (không redirect, không render trang)
+CART_OPERATIONS = ('set', 'increment', 'remove')
+MAX_CART_OPERATIONS = 100
+# Số lượng tối đa mỗi dòng và cả giỏ (số quá lớn làm tràn cột INTEGER của SQLite)
+MAX_QUANTITY = 999
+MAX_CART_QUANTITY = 9999
+
+def read_cart_summary(cart_id, catalog):
+    """(số món, tạm tính) đọc sẵn từ cart store; chỉ duyệt lại giỏ một lần sau khi bảng giá đổi"""
+    summary = cart_store.summary(cart_id, catalog.price_stamp)
+    if summary is None:
+        summary = cart_store.reprice(cart_id, lambda product_id: (catalog.get(product_id) or {}).get('price'),
+                                     catalog.price_stamp)
+    return summary
+
+def cart_namespace():
+    """Namespace cache tổng giỏ của store đang xem; lấy trong thread của request
+    (thread của io_pool không có g.store) rồi truyền vào cart_summary/cart_changed"""
+    return f'{cache_namespace(current_store())}:cart'
+
+def cart_summary(cart_id, catalog, namespace):
+    """(số món, tạm tính) qua cache dùng chung
+
+    Không qua LRU của worker vì worker khác có thể vừa sửa giỏ; mọi lần sửa giỏ
+    ghi đè giá trị trong cache bằng cart_changed().
+    """
+    if not cart_id:
+        return 0, 0
+    return tuple(cache.get_or_set(namespace, cart_id,
+                                  lambda: read_cart_summary(cart_id, catalog),
+                                  version=catalog.price_stamp, ttl=CART_SUMMARY_TTL, local=False))
+
+def cart_changed(cart_id, catalog, namespace):
+    """Ghi tổng mới của giỏ vào cache sau khi giỏ đổi"""
+    cache.set(namespace, cart_id, read_cart_summary(cart_id, catalog),
+              version=catalog.price_stamp, ttl=CART_SUMMARY_TTL, local=False)
+
+def cart_payload(cart, catalog):
+    lines = list(cart_lines(cart, catalog))
+    return dict(
+        items=[dict(product_id=product['id'], name=product['name'], price=product['price'],
+                    quantity=quantity, line_total=line_total)
+               for product, quantity, line_total in lines],
+        count=sum(quantity for _, quantity, _ in lines),
+        total=sum(line_total for _, _, line_total in lines),
+        version=catalog.stamp,
+    )
+
+def plan_cart(cart, operations, catalog):
+    """Áp lô thao tác lên bản sao giỏ hàng, trả về số lượng mới của các sản phẩm bị đổi
+
+    Raise ValueError (kèm vị trí thao tác) nếu có thao tác không hợp lệ; khi đó giỏ không đổi gì.
+    """
+    target = dict(cart)
+    for index, operation in enumerate(operations):
+        if not isinstance(operation, dict):
+            raise ValueError(f'operations[{index}]: phải là object')
+        op = operation.get('op', 'increment')
+        if op not in CART_OPERATIONS:
+            raise ValueError(f'operations[{index}]: op không hợp lệ: {op}')
+        product = catalog.get(operation.get('product_id'))
+        if product is None:
+            raise ValueError(f'operations[{index}]: không có sản phẩm {operation.get("product_id")}')
+        product_id = str(product['id'])
+        quantity = operation.get('quantity', 1 if op == 'increment' else 0)
+        if op != 'remove' and (type(quantity) is not int or (op == 'set' and quantity < 0)):
+            raise ValueError(f'operations[{index}]: quantity không hợp lệ')
+        if op == 'set':
+            target[product_id] = quantity
+        elif op == 'increment':
+            target[product_id] = max(target.get(product_id, 0) + quantity, 0)
+        else:
+            target[product_id] = 0
+        if target[product_id] > MAX_QUANTITY:
+            raise ValueError(f'operations[{index}]: tối đa {MAX_QUANTITY} mỗi sản phẩm')
+    if sum(target.values()) > MAX_CART_QUANTITY:
+        raise ValueError(f'tối đa {MAX_CART_QUANTITY} món mỗi giỏ hàng')
+    return {product_id: quantity for product_id, quantity in target.items()
+            if quantity != cart.get(product_id, 0)}
+
+@app.route('/api/cart')
+def api_cart():
+    return jsonify(cart_payload(load_cart(), current_catalog()))
+
+@app.route('/api/cart/summary')
+def api_cart_summary():
+    """Phần theo phiên của trang chủ shell: số món và tạm tính của giỏ"""
+    count, total = cart_summary(get_cart_id(), current_catalog(), cart_namespace())
+    response = jsonify(count=count, total=total)
+    response.cache_control.private = True
+    response.cache_control.no_store = True
+    return response
+
+@app.route('/api/cart', methods=['POST'])
+def api_update_cart():
+    """Sửa giỏ theo lô: {"operations": [{"op": "set|increment|remove", "product_id": 1, "quantity": 2}]}
+
+    Header Idempotency-Key (tùy chọn): gửi lại cùng key trả về đúng kết quả lần đầu
+    mà không áp thao tác lần nữa.
+    """
+    body = request.get_json(silent=True)
+    operations = body.get('operations') if isinstance(body, dict) else None
+    if not isinstance(operations, list) or not operations:
+        return jsonify(error='cần operations là danh sách thao tác'), 400
+    if len(operations) > MAX_CART_OPERATIONS:
+        return jsonify(error=f'tối đa {MAX_CART_OPERATIONS} thao tác mỗi request'), 400
+    catalog = current_catalog()
+    cart_id = get_cart_id(create=True)
+
+    key = request.headers.get('Idempotency-Key')
+    if key is not None:
+        if not 0 < len(key) <= 255:
+            return jsonify(error='Idempotency-Key không hợp lệ'), 400
+        fingerprint = hashlib.sha256(json.dumps(operations, sort_keys=True).encode('utf-8')).hexdigest()
+        previous = cart_store.claim_request(cart_id, key, fingerprint)
+        if previous is not None:
+            if previous[0] != fingerprint:
+                return jsonify(error='Idempotency-Key đã dùng cho một lô thao tác khác'), 422
+            if previous[1] is None:
+                return jsonify(error='request cùng Idempotency-Key đang được xử lý'), 409
+            response = app.response_class(previous[1], mimetype='application/json')
+            response.headers['Idempotent-Replayed'] = 'true'
+            return response
+
+    try:
+        response = update_cart(cart_id, catalog, operations)
+    except BaseException:
+        if key is not None:
+            cart_store.forget_request(cart_id, key)
+        raise
+    if key is not None:
+        if response.status_code == 200:
+            cart_store.finish_request(cart_id, key, response.get_data(as_text=True))
+        else:
+            # Lỗi (dữ liệu sai, hết hàng) không được nhớ: sửa lại rồi gửi cùng key vẫn được
+            cart_store.forget_request(cart_id, key)
+    return response
+
+def update_cart(cart_id, catalog, operations):
+    cart = cart_store.get(cart_id)
+    try:
+        changes = plan_cart(cart, operations, catalog)
+    except ValueError as error:
+        return make_response(jsonify(error=str(error)), 400)
+    if not changes:
+        return jsonify(cart_payload(cart, catalog))
+
+    # Giữ hàng cho các sản phẩm có quản lý tồn kho trước khi ghi giỏ, tất cả hoặc không gì cả
+    tracked = [catalog.get(product_id) for product_id in changes]
+    tracked = [product for product in tracked if product.get('stock_quantity') is not None]
+    if tracked:
+        try:
+            inventory.hold(cart_id, {str(product['id']): changes[str(product['id'])] for product in tracked},
+                           {str(product['id']): product['stock_quantity'] for product in tracked})
+        except OutOfStock as error:
+            payload = cart_payload(cart, catalog)
+            payload.update(error='không đủ hàng', out_of_stock=[int(sku) for sku in error.skus])
+            return make_response(jsonify(payload), 409)
+    # Ghi số lượng cuối cùng (không phải phép cộng) nên lô gửi sau cùng quyết định trạng thái giỏ
+    prices = {product_id: catalog.get(product_id)['price'] for product_id in changes}
+    cart = cart_store.set_many(cart_id, changes, prices, catalog.price_stamp)
+    cart_changed(cart_id, catalog, cart_namespace())
+    return jsonify(cart_payload(cart, catalog))
+
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(key, ensure_ascii=False).encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    try:
+        key, product_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, TypeError, UnicodeError):
+        return None
+    return key, product_id
+
+@app.route('/api/products')
+def api_products():
+    """Catalog dạng JSON: ?sort=price|-price|name|-name&min_price=&max_price=&limit=&cursor="""
+    sort = request.args.get('sort', 'price')
+    field = sort.lstrip('-')
+    if field not in SORT_KEYS:
+        return jsonify(error=f'sort không hợp lệ: {sort}'), 400
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+    min_price = request.args.get('min_price', type=int)
+    max_price = request.args.get('max_price', type=int)
+    after = None
+    if request.args.get('cursor'):
+        after = decode_cursor(request.args['cursor'])
+        if after is None:
+            return jsonify(error='cursor không hợp lệ'), 400
+
+    catalog = current_catalog()
+    try:
+        items, last = catalog.page(field, descending=sort.startswith('-'), min_price=min_price,
+                                   max_price=max_price, after=after, limit=limit)
+    except TypeError:
+        # Cursor tạo từ một kiểu sắp xếp khác
+        return jsonify(error='cursor không khớp với sort'), 400
+    return jsonify(
+        items=items,
+        next_cursor=encode_cursor(last) if last else None,
+        version=catalog.stamp,
+    )
+
+@app.route('/api/search')
+def api_search():
+    """Tìm sản phẩm theo tên/mô tả, gõ không dấu được: ?q=pho bo&limit="""
+    query = request.args.get('q', '')
+    limit = min(max(request.args.get('limit', 10, type=int), 1), 50)
+    catalog = current_catalog()
+    # Query đã chuẩn hóa làm khóa ("Phở  Bò" và "pho bo" dùng chung một kết quả), giữ khoảng trắng cuối
+    # vì nó quyết định từ cuối có được khớp theo tiền tố hay không
+    normalized = ' '.join(tokenize(query)) + (' ' if query[-1:].isspace() else '')
+    ids = cache.get_or_set(cache_namespace(current_store()), f'search:{limit}:{normalized}',
+                           lambda: catalog.search_index.search(query, limit), version=catalog.stamp)
+    return jsonify(query=query, items=[product for product in map(catalog.get, ids) if product is not None])
+
+@app.route('/images/<int:product_id>/<variant>-<int:density>x.<fmt>')
+def product_image(product_id, variant, density, fmt):
+    return images.serve(product_id, variant, density, fmt)
+
+@app.route('/metrics')
+def prometheus_metrics():
+    return metrics.render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
 
 @app.route('/health')
 def health():
+    """200 khi worker đã warm-up xong, 503 (kèm tiến độ) khi đang khởi động hoặc warm-up lỗi"""
+    if not warmup.ready:
+        return jsonify(warmup.status()), 503
     return 'OK', 200
 
+@warmup.step
+def load_catalog():
+    catalog_source.load()
+
+@warmup.step
+def compile_templates():
+    # Bytecode cache (JINJA_BYTECODE_CACHE_DIR) làm bước này nhanh hơn ở các lần khởi động sau
+    for template_name in app.jinja_env.list_templates(extensions=['html']):
+        app.jinja_env.get_template(template_name)
+
+@warmup.step
+def render_home():
+    catalog = catalog_source.catalog
+    if not should_stream(len(catalog)):
+        with app.test_request_context('/'):
+            g.store = None
+            home_page(DEFAULT_STORE, catalog)
+
+# CLI commands
+@app.cli.command()
+def vendor_assets_command():
+    """Tải Bootstrap về static/vendor để không phụ thuộc CDN"""
+    try:
+        assets.vendor()
+    except OSError as error:
+        print(f'⚠️  Không tải được thư viện, trang sẽ tiếp tục dùng CDN: {error}')
+
+@app.cli.command()
+@click.argument('path')
+def export_catalog_command(path):
+    """Xuất catalog mặc định ra PATH (.json/.csv/.bin) để dùng làm CATALOG_PATH"""
+    catalog = catalog_source.catalog
+    export_products(path, list(catalog))
+    print(f'✅ Đã xuất {len(catalog)} sản phẩm ra {path}')
+
+@app.cli.command()
+def snapshot_catalog_command():
+    """Dựng catalog mặc định và ghi snapshot (CATALOG_SNAPSHOT) để worker khởi động nhanh"""
+    if not catalog_source.snapshot_path:
+        print('⚠️  CATALOG_SNAPSHOT đang tắt, không ghi snapshot')
+        return
+    try:
+        catalog = catalog_source.load()
+    except (OSError, ValueError, KeyError, TypeError) as error:
+        # Nguồn catalog chưa có lúc build (vd: volume chỉ gắn khi chạy): worker sẽ tự dựng khi khởi động
+        print(f'⚠️  Không dựng được catalog, bỏ qua snapshot: {error}')
+        return
+    print(f'✅ Snapshot {len(catalog)} sản phẩm: {catalog_source.snapshot_path}')
+
+@app.cli.command()
+def worker_command():
+    """Chạy worker xử lý job nền (dùng khi JOB_WORKERS=0 trong process web)"""
+    workers = max(JOB_WORKERS, 1)
+    jobs.start(workers)
+    print(f'⚙️  {workers} worker đang xử lý job từ {jobs.path}')
+    threading.Event().wait()
+
+@app.cli.command()
+def init_db_command():
+    """Khởi tạo database với dữ liệu mẫu"""
+    from models import db
+    from models.store import Store
+    from models.product import ProductCategory, Product
+    from models.user import User
+
+    # Tạo tables
+    db.create_all()
+
+    # Tạo store mẫu
+    demo_store = Store.query.filter_by(slug='demo').first()
+    if not demo_store:
+        demo_store = Store(
+            name='Cửa hàng Demo',
+            slug='demo',
+            description='Cửa hàng demo cho hệ thống bán hàng đa tenant',
+            phone='0123456789',
+            email='demo@example.com',
+            address='123 Đường ABC, Quận XYZ, TP.HCM',
+            primary_color='#007bff',
+            secondary_color='#6c757d'
+        )
+
+        # Tạo admin user
+        admin_user = User(
+            username='admin',
+            email='admin@demo.com',
+            full_name='Quản trị viên',
+            role='admin'
+        )
+        admin_user.set_password('admin123')
+        demo_store.users.append(admin_user)
+
+        # Tạo danh mục mẫu
+        categories = [
+            {'name': 'Đồ ăn', 'slug': 'do-an', 'description': 'Các món ăn ngon'},
+            {'name': 'Đồ uống', 'slug': 'do-uong', 'description': 'Các loại đồ uống'},
+            {'name': 'Tráng miệng', 'slug': 'trang-mieng', 'description': 'Món tráng miệng'}
+        ]
+
+        for i, cat_data in enumerate(categories):
+            category = ProductCategory(
+                store=demo_store,
+                name=cat_data['name'],
+                slug=cat_data['slug'],
+                description=cat_data['description'],
+                sort_order=i
+            )
+
+            # Tạo sản phẩm mẫu cho mỗi danh mục
+            products = [
+                {'name': f'{cat_data["name"]} 1', 'price': 50000},
+                {'name': f'{cat_data["name"]} 2', 'price': 75000},
+                {'name': f'{cat_data["name"]} 3', 'price': 100000}
+            ]
+
+            for j, prod_data in enumerate(products):
+                category.products.append(Product(
+                    store=demo_store,
+                    name=prod_data['name'],
+                    slug=f"{cat_data['slug']}-{j+1}",
+                    description=f'Mô tả chi tiết cho {prod_data["name"]}',
+                    short_description=f'Mô tả ngắn cho {prod_data["name"]}',
+                    price=prod_data['price'],
+                    stock_quantity=100,
+                    sort_order=j,
+                    is_featured=(j == 0)  # Sản phẩm đầu tiên là featured
+                ))
+
+        # Không flush từng dòng: commit một lần để SQLAlchemy gom INSERT theo bảng
+        db.session.add(demo_store)
+        db.session.commit()
+        print('✅ Đã khởi tạo database với dữ liệu mẫu')
+        print('🔑 Tài khoản admin: admin / admin123')
+        print('🏪 Store demo: http://localhost:5000?store=demo')
+    else:
+        print('⚠️  Database đã được khởi tạo trước đó')
+
+@app.cli.command()
+def create_store():
+    """Tạo store mới"""
+    from models import db
+    from models.store import Store
+    from models.user import User
+
+    name = input('Tên cửa hàng: ')
+    slug = input('Slug (URL): ')
+    email = input('Email: ')
+    phone = input('Số điện thoại: ')
+    address = input('Địa chỉ: ')
+
+    # Kiểm tra slug trùng
+    existing = Store.query.filter_by(slug=slug).first()
+    if existing:
+        print('❌ Slug đã tồn tại')
+        return
+
+    store = Store(
+        name=name,
+        slug=slug,
+        email=email,
+        phone=phone,
+        address=address
+    )
+    db.session.add(store)
+    db.session.flush()
+
+    # Tạo admin user cho store
+    admin_username = input('Username admin: ')
+    admin_password = input('Password admin: ')
+    admin_email = input('Email admin: ')
+
+    admin_user = User(
+        store_id=store.id,
+        username=admin_username,
+        email=admin_email,
+        full_name='Quản trị viên',
+        role='admin'
+    )
+    admin_user.set_password(admin_password)
+    db.session.add(admin_user)
+
+    db.session.commit()
+    print(f'✅ Đã tạo store: {name}')
+    print(f'🔗 URL: http://localhost:5000?store={slug}')
+    print(f'👤 Admin: {admin_username} / {admin_password}')
+
+# Bắt đầu warm-up ngay khi nạp app cho server; lệnh CLI (flask vendor-assets...) thì không
+if click.get_current_context(silent=True) is None:
+    warmup.start()
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
     app.run(host='0.0.0.0', port=port, debug=False)
@@ -0,0 +1,19 @@
+"""
+Chạy app ở chế độ ASGI với các view async
+
+    uvicorn asgi:app --workers 4
+
+Flask là app WSGI nên a2wsgi chạy mỗi request trong một thread của pool
+(ASGI_THREADS); các view async chạy trên event loop chung của process và chờ
+catalog, giỏ hàng song song (xem async_io.py).
+"""
+
+import os
+
+os.environ.setdefault('ASYNC_VIEWS', '1')
+
+from a2wsgi import WSGIMiddleware  # noqa: E402
+
+from app import app as flask_app  # noqa: E402
+
+app = WSGIMiddleware(flask_app, workers=int(os.environ.get('ASGI_THREADS', 16)))
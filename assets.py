@@ -0,0 +1,138 @@
+"""
+CSS/JS tự host: tên file theo hash nội dung, nén sẵn gzip/brotli, cache vĩnh viễn
+
+Nguồn nằm trong static/ (css/, js/, vendor/). Khi khởi động, mỗi file được
+băm và ghi ra static/dist/<tên>.<hash>.<đuôi> kèm bản .gz/.br, sau đó phục vụ
+từ memory qua /assets/<tên đã băm> với Cache-Control: immutable.
+"""
+
+import gzip
+import hashlib
+import mimetypes
+import os
+
+from flask import abort, current_app, request
+
+try:
+    import brotli
+except ImportError:  # brotli là tùy chọn, thiếu thì chỉ có gzip
+    brotli = None
+
+# Thư viện bên thứ ba: tải về static/vendor bằng `flask vendor-assets`,
+# chưa tải thì trang vẫn dùng CDN
+VENDOR = {
+    'vendor/bootstrap.min.css': 'https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/css/bootstrap.min.css',
+    'vendor/bootstrap.bundle.min.js': 'https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/js/bootstrap.bundle.min.js',
+}
+
+SOURCE_EXTENSIONS = ('.css', '.js')
+CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+class Asset:
+    def __init__(self, name, digest, mimetype, variants):
+        self.name = name
+        self.digest = digest
+        self.mimetype = mimetype
+        self.variants = variants  # content-encoding -> bytes
+
+
+class Assets:
+    """Quản lý và phục vụ các file tĩnh đã fingerprint"""
+
+    def __init__(self, app=None):
+        self._urls = {}    # tên gốc -> URL
+        self._files = {}   # tên đã băm -> Asset
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.source_dir = app.static_folder
+        self.build_dir = os.path.join(app.static_folder, 'dist')
+        self.build()
+        app.add_url_rule('/assets/<path:filename>', 'asset', self.serve)
+        app.jinja_env.globals['asset_url'] = self.url
+
+    def build(self):
+        """Băm và nén sẵn mọi file nguồn; file đã có trong dist/ thì không ghi lại"""
+        urls, files = {}, {}
+        for root, dirs, filenames in os.walk(self.source_dir):
+            dirs[:] = [d for d in dirs if os.path.join(root, d) != self.build_dir]
+            for filename in sorted(filenames):
+                if not filename.endswith(SOURCE_EXTENSIONS):
+                    continue
+                path = os.path.join(root, filename)
+                name = os.path.relpath(path, self.source_dir).replace(os.sep, '/')
+                asset = self._build_file(name, path)
+                hashed = fingerprint(name, asset.digest)
+                files[hashed] = asset
+                urls[name] = f'/assets/{hashed}'
+        self._urls, self._files = urls, files
+
+    def _build_file(self, name, path):
+        with open(path, 'rb') as f:
+            data = f.read()
+        digest = hashlib.sha256(data).hexdigest()[:12]
+        variants = {'identity': data, 'gzip': gzip.compress(data, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            variants['br'] = brotli.compress(data, quality=11)
+
+        # Ghi ra dist/ để nginx/CDN có thể dùng lại; thư mục chỉ đọc thì vẫn phục vụ từ memory
+        target = os.path.join(self.build_dir, fingerprint(name, digest))
+        suffixes = {'identity': '', 'gzip': '.gz', 'br': '.br'}
+        try:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            for encoding, content in variants.items():
+                if not os.path.exists(target + suffixes[encoding]):
+                    with open(target + suffixes[encoding], 'wb') as f:
+                        f.write(content)
+        except OSError:
+            pass
+        mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        return Asset(name, digest, mimetype, variants)
+
+    @property
+    def digest(self):
+        """Dấu của toàn bộ asset, đổi khi có file bất kỳ đổi"""
+        return hashlib.sha256(repr(sorted(self._urls.items())).encode('utf-8')).hexdigest()[:12]
+
+    def url(self, name):
+        """URL đã fingerprint của một file trong static/, hoặc CDN nếu thư viện chưa được tải"""
+        url = self._urls.get(name)
+        if url is None:
+            url = VENDOR[name]
+        return url
+
+    def serve(self, filename):
+        asset = self._files.get(filename)
+        if asset is None:
+            abort(404)
+        encoding = request.accept_encodings.best_match(
+            [e for e in ('br', 'gzip') if e in asset.variants], default='identity')
+        response = current_app.response_class(asset.variants[encoding], mimetype=asset.mimetype)
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+        response.headers['Cache-Control'] = CACHE_CONTROL
+        response.headers['Vary'] = 'Accept-Encoding'
+        response.set_etag(f'{asset.digest}-{encoding}')
+        return response.make_conditional(request)
+
+    def vendor(self):
+        """Tải các thư viện bên thứ ba về static/vendor rồi build lại"""
+        import urllib.request
+
+        for name, url in VENDOR.items():
+            path = os.path.join(self.source_dir, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with urllib.request.urlopen(url, timeout=30) as response:
+                data = response.read()
+            with open(path, 'wb') as f:
+                f.write(data)
+            print(f'⬇️  {url} -> static/{name} ({len(data):,} bytes)')
+        self.build()
+
+
+def fingerprint(name, digest):
+    base, ext = os.path.splitext(name)
+    return f'{base}.{digest}{ext}'
+
@@ -0,0 +1,105 @@
+"""
+Hạ tầng cho các view async
+
+Mặc định Flask tạo một event loop mới cho mỗi lần gọi view async (qua asgiref),
+nên không client async nào giữ được kết nối giữa các request. Ở đây mọi view
+async chạy trên một event loop sống suốt đời process (EventLoopThread), còn các
+lời gọi blocking (SQLite, SQLAlchemy) chạy trong một thread pool dùng chung
+(IOPool): số thread của pool cũng là số kết nối tối đa tới cart store/DB.
+"""
+
+import asyncio
+import concurrent.futures
+import contextvars
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class EventLoopThread:
+    """Một event loop chạy trong thread nền, tạo lại sau khi fork (gunicorn preload)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loop = None
+        self._pid = None
+
+    @property
+    def loop(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._loop = asyncio.new_event_loop()
+                    threading.Thread(target=self._loop.run_forever, name='async-views', daemon=True).start()
+                    self._pid = os.getpid()
+        return self._loop
+
+    def run(self, coroutine):
+        """Chạy coroutine trên loop chung và chờ kết quả; coroutine thấy contextvars
+        của thread gọi (request context của Flask)"""
+        future = concurrent.futures.Future()
+
+        def start():
+            # Task được tạo trong `context` nên kế thừa bản sao của nó
+            task = asyncio.ensure_future(coroutine)
+            task.add_done_callback(functools.partial(copy_result, future))
+
+        self.loop.call_soon_threadsafe(start, context=contextvars.copy_context())
+        return future.result()
+
+    def async_to_sync(self, func):
+        """Thay cho Flask.async_to_sync"""
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return self.run(func(*args, **kwargs))
+        return wrapper
+
+
+def copy_result(future, task):
+    if task.cancelled():
+        future.cancel()
+    elif task.exception() is not None:
+        future.set_exception(task.exception())
+    else:
+        future.set_result(task.result())
+
+
+class IOPool:
+    """Thread pool dùng chung, mỗi lời gọi chạy trong app context của app"""
+
+    def __init__(self, app, max_workers=32):
+        self.app = app
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='io')
+
+    async def run(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(self._call, fn, args, kwargs))
+
+    def _call(self, fn, args, kwargs):
+        # db.session của Flask-SQLAlchemy cần app context
+        with self.app.app_context():
+            return fn(*args, **kwargs)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+class AsyncCartStore:
+    """Giao diện async cho một CartStore bất kỳ"""
+
+    def __init__(self, store, pool):
+        self.store = store
+        self.pool = pool
+
+    async def get(self, cart_id):
+        return await self.pool.run(self.store.get, cart_id)
+
+    async def count(self, cart_id):
+        return await self.pool.run(self.store.count, cart_id)
+
+    async def incr(self, cart_id, product_id, amount=1, price=None, stamp=None):
+        return await self.pool.run(self.store.incr, cart_id, product_id, amount, price, stamp)
+
+    async def remove(self, cart_id, product_id):
+        return await self.pool.run(self.store.remove, cart_id, product_id)
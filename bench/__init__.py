@@ -0,0 +1,6 @@
+"""
+Benchmark cho các route của cửa hàng
+
+    python -m bench.routes run --products 10000 --cart 20 -o results.json
+    python -m bench.routes compare base.json results.json
+"""
@@ -0,0 +1,272 @@
+"""
+So sánh view đồng bộ (WSGI) với view async (WSGI và ASGI) khi I/O có độ trễ
+
+Catalog và giỏ hàng được thay bằng bản giả lập có độ trễ cố định mỗi lời gọi,
+giống khi chúng nằm trong database/cache ở máy khác. Mỗi chế độ chạy server
+trong một process riêng, client là nhiều thread gửi request đồng thời.
+
+    python -m bench.async_io run --latency-ms 20 --concurrency 64 --threads 16 -o async.json
+
+Chế độ:
+    wsgi        view đồng bộ, server WSGI với --threads thread (như gunicorn gthread)
+    wsgi-async  view async, cùng server WSGI
+    asgi        view async, uvicorn + a2wsgi với --threads thread (như asgi.py)
+"""
+
+import argparse
+import http.client
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bench.routes import percentile
+from bench.synthetic import make_cart, make_products
+
+MODES = ('wsgi', 'wsgi-async', 'asgi')
+ROUTES = {
+    'home': ('GET', '/?store=bench'),
+    'cart': ('GET', '/cart?store=bench'),
+}
+STORE = {'id': 1, 'slug': 'bench', 'name': 'Bench', 'description': '', 'phone': '', 'email': ''}
+
+
+class SlowCartStore:
+    """Cart store chờ `latency` giây mỗi lời gọi"""
+
+    def __init__(self, store, latency):
+        self.store = store
+        self.latency = latency
+
+    def __getattr__(self, name):
+        method = getattr(self.store, name)
+
+        def call(*args, **kwargs):
+            time.sleep(self.latency)
+            return method(*args, **kwargs)
+        return call
+
+
+class SlowStores:
+    """Thay StoreResolver: store lấy từ cache (không trễ), catalog mỗi lần tốn `latency` giây"""
+
+    def __init__(self, catalog, latency):
+        self._catalog = catalog
+        self.latency = latency
+
+    def store(self, slug):
+        return STORE if slug == STORE['slug'] else None
+
+    def catalog(self, store):
+        time.sleep(self.latency)
+        return self._catalog
+
+
+def serve(args):
+    """Chạy server của một chế độ (process con do `run` khởi động)"""
+    import logging
+
+    os.environ['CART_STORE_URL'] = 'memory://'
+    os.environ.setdefault('RATE_LIMITS', '')
+    import app as shop
+    from async_io import AsyncCartStore
+    from catalog import Catalog
+
+    latency = args.latency_ms / 1000
+    catalog = Catalog(make_products(args.products))
+    shop.stores = SlowStores(catalog, latency)
+    shop.cart_store = SlowCartStore(shop.cart_store, latency)
+    shop.async_cart_store = AsyncCartStore(shop.cart_store, shop.io_pool)
+    shop.use_async_views(args.mode != 'wsgi')
+
+    if args.mode == 'asgi':
+        import uvicorn
+        from a2wsgi import WSGIMiddleware
+
+        uvicorn.run(WSGIMiddleware(shop.app, workers=args.threads), host='127.0.0.1', port=args.port,
+                    log_level='warning')
+        return 0
+
+    from werkzeug.serving import BaseWSGIServer
+
+    class PooledWSGIServer(BaseWSGIServer):
+        """Server WSGI với số thread cố định, giống worker gthread của gunicorn"""
+
+        def __init__(self, *server_args, threads, **kwargs):
+            super().__init__(*server_args, **kwargs)
+            self.pool = ThreadPoolExecutor(max_workers=threads)
+
+        def process_request(self, request, client_address):
+            self.pool.submit(self._handle, request, client_address)
+
+        def _handle(self, request, client_address):
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = PooledWSGIServer('127.0.0.1', args.port, shop.app, threads=args.threads)
+    server.serve_forever()
+    return 0
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_ready(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f'Server không lên ở cổng {port}')
+
+
+def request(port, method, path, cookie=None, body=None):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    try:
+        headers = {'Cookie': cookie} if cookie else {}
+        if body is not None:
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        conn.request(method, path, body=body, headers=headers)
+        response = conn.getresponse()
+        response.read()
+        return response.status, response.getheader('Set-Cookie')
+    finally:
+        conn.close()
+
+
+def new_session(port, cart):
+    """Cookie của một session đã có giỏ hàng"""
+    cookie = None
+    for product_id, quantity in cart.items():
+        for _ in range(quantity):
+            _, set_cookie = request(port, 'POST', '/add-to-cart?store=bench', cookie,
+                                    f'product_id={product_id}')
+            if set_cookie:
+                cookie = set_cookie.split(';', 1)[0]
+    return cookie
+
+
+def load(port, method, path, cookies, requests):
+    """Mỗi client gửi tuần tự `requests` request, các client chạy đồng thời"""
+    latencies, errors = [], 0
+    lock = threading.Lock()
+
+    def client(cookie):
+        nonlocal errors
+        mine, failed = [], 0
+        for _ in range(requests):
+            start = time.perf_counter()
+            status, _ = request(port, method, path, cookie)
+            mine.append(time.perf_counter() - start)
+            failed += status != 200
+        with lock:
+            latencies.extend(mine)
+            errors += failed
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(cookie,)) for cookie in cookies]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        'rps': round(len(latencies) / elapsed, 1),
+    }
+
+
+def run(args):
+    results = {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'latency_ms': args.latency_ms,
+            'concurrency': args.concurrency,
+            'threads': args.threads,
+            'products': args.products,
+            'cart': args.cart,
+        },
+        'modes': {},
+    }
+    cart = make_cart(make_products(args.products), args.cart)
+    for mode in args.modes:
+        port = free_port()
+        server = subprocess.Popen([
+            sys.executable, '-m', 'bench.async_io', 'serve', '--mode', mode, '--port', str(port),
+            '--latency-ms', str(args.latency_ms), '--threads', str(args.threads),
+            '--products', str(args.products),
+        ], env={**os.environ, 'ASYNC_IO_POOL_SIZE': str(args.pool_size)})
+        try:
+            wait_ready(port)
+            with ThreadPoolExecutor(max_workers=16) as executor:
+                cookies = list(executor.map(lambda _: new_session(port, cart), range(args.concurrency)))
+            results['modes'][mode] = {}
+            for route in args.routes:
+                method, path = ROUTES[route]
+                load(port, method, path, cookies[:4], 5)  # warmup
+                line = results['modes'][mode][route] = load(port, method, path, cookies, args.requests)
+                print(f"{mode:<11} {route:<5} p50 {line['p50_ms']:>8.2f}ms  p95 {line['p95_ms']:>8.2f}ms  "
+                      f"p99 {line['p99_ms']:>8.2f}ms  {line['rps']:>8.1f} req/s  lỗi {line['errors']}")
+        finally:
+            server.terminate()
+            server.wait()
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f'Đã lưu kết quả: {args.output}')
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m bench.async_io')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='Chạy benchmark cho các chế độ')
+    run_parser.add_argument('--modes', nargs='+', choices=MODES, default=list(MODES))
+    run_parser.add_argument('--routes', nargs='+', choices=ROUTES, default=list(ROUTES))
+    run_parser.add_argument('--latency-ms', type=float, default=20.0, help='Độ trễ giả lập mỗi lời gọi I/O')
+    run_parser.add_argument('--concurrency', type=int, default=64, help='Số client đồng thời')
+    run_parser.add_argument('--requests', type=int, default=20, help='Số request mỗi client cho mỗi route')
+    run_parser.add_argument('--threads', type=int, default=16, help='Số thread của server WSGI')
+    run_parser.add_argument('--pool-size', type=int, default=32, help='ASYNC_IO_POOL_SIZE của server')
+    run_parser.add_argument('--products', type=int, default=100)
+    run_parser.add_argument('--cart', type=int, default=5)
+    run_parser.add_argument('-o', '--output', help='Lưu kết quả JSON')
+
+    serve_parser = commands.add_parser('serve', help='(nội bộ) chạy server của một chế độ')
+    serve_parser.add_argument('--mode', choices=MODES, required=True)
+    serve_parser.add_argument('--port', type=int, required=True)
+    serve_parser.add_argument('--latency-ms', type=float, default=20.0)
+    serve_parser.add_argument('--threads', type=int, default=16)
+    serve_parser.add_argument('--products', type=int, default=100)
+
+    args = parser.parse_args(argv)
+    return run(args) if args.command == 'run' else serve(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,149 @@
+"""
+Benchmark khởi động nguội: thời gian từ lúc chạy gunicorn tới request đầu tiên
+
+    python -m bench.cold_start --products 1000 100000 --runs 5 -o cold_start.json
+
+Mỗi lượt chạy `gunicorn app:app` (dùng gunicorn.conf.py, 1 worker) với catalog
+sinh sẵn trong CATALOG_PATH và đo:
+  - first_response: response đầu tiên, mã gì cũng được (503 của /health khi đang warm-up)
+  - first_request: --path đầu tiên trả 200 (mặc định /api/products, cần catalog;
+    trang chủ của catalog lớn là trang stream cả catalog, đo render chứ không đo khởi động)
+  - ready: /health đầu tiên trả 200 (warm-up xong)
+Với preload (mặc định), master warm-up xong mới fork nên ba số gần bằng nhau.
+Chế độ:
+    build       không snapshot, worker đọc file catalog và dựng index
+    snapshot    snapshot dựng sẵn bằng `flask snapshot-catalog` (như bước build trên Railway)
+"""
+
+import argparse
+import http.client
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from bench.async_io import free_port
+from bench.synthetic import make_products
+from catalog_source import export_products
+
+MODES = ('build', 'snapshot')
+
+
+def get(port, path):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    try:
+        conn.request('GET', path)
+        response = conn.getresponse()
+        response.read()
+        return response.status
+    finally:
+        conn.close()
+
+
+def poll(port, path, started, results, name, deadline):
+    """Gửi `path` liên tục tới khi được 200, ghi lại số giây kể từ `started`"""
+    while time.monotonic() < deadline:
+        try:
+            status = get(port, path)
+        except OSError:
+            time.sleep(0.005)
+            continue
+        results.setdefault('first_response', time.perf_counter() - started)
+        if status == 200:
+            results[name] = time.perf_counter() - started
+            return
+        time.sleep(0.005)
+
+
+def start_once(env, path, timeout):
+    port = free_port()
+    started = time.perf_counter()
+    server = subprocess.Popen([sys.executable, '-m', 'gunicorn', 'app:app', '--bind', f'127.0.0.1:{port}'],
+                              env={**env, 'PORT': str(port)},
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    results = {}
+    deadline = time.monotonic() + timeout
+    try:
+        pollers = [threading.Thread(target=poll, args=(port, target, started, results, name, deadline))
+                   for name, target in (('first_request', path), ('ready', '/health'))]
+        for poller in pollers:
+            poller.start()
+        for poller in pollers:
+            poller.join()
+    finally:
+        server.terminate()
+        server.wait()
+    if 'first_request' not in results or 'ready' not in results:
+        raise RuntimeError(f'Server không sẵn sàng sau {timeout}s')
+    return results
+
+
+def measure(count, mode, runs, directory, path, timeout, preload):
+    catalog_path = os.path.join(directory, f'catalog-{count}.bin')
+    if not os.path.exists(catalog_path):
+        export_products(catalog_path, make_products(count))
+    snapshot_path = os.path.join(directory, f'catalog-{count}.snapshot') if mode == 'snapshot' else ''
+    env = {
+        **os.environ,
+        'CATALOG_PATH': catalog_path,
+        'CATALOG_SNAPSHOT': snapshot_path,
+        'CART_STORE_URL': 'memory://',
+        'JOB_WORKERS': '0',
+        'RATE_LIMITS': '',
+        'WEB_CONCURRENCY': '1',
+        'GUNICORN_PRELOAD': '1' if preload else '0',
+        'STREAM_PAGES': 'auto',
+    }
+    if mode == 'snapshot' and not os.path.exists(snapshot_path):
+        subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', 'snapshot-catalog'], env=env, check=True,
+                       stdout=subprocess.DEVNULL)
+
+    samples = [start_once(env, path, timeout) for _ in range(runs)]
+    return {name: round(statistics.median(sample[name] for sample in samples) * 1000, 1)
+            for name in ('first_response', 'first_request', 'ready')}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m bench.cold_start')
+    parser.add_argument('--products', type=int, nargs='+', default=[1000, 100000])
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=list(MODES))
+    parser.add_argument('--runs', type=int, default=5, help='Số lần khởi động mỗi cấu hình (lấy trung vị)')
+    parser.add_argument('--path', default='/api/products', help='Request đo thời gian tới lần 200 đầu tiên')
+    parser.add_argument('--no-preload', action='store_true', help='Chạy với GUNICORN_PRELOAD=0')
+    parser.add_argument('--timeout', type=float, default=120.0)
+    parser.add_argument('-o', '--output', help='Lưu kết quả JSON')
+    args = parser.parse_args(argv)
+
+    results = {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'runs': args.runs,
+            'preload': not args.no_preload,
+            'path': args.path,
+        },
+        'results': [],
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        for count in args.products:
+            for mode in args.modes:
+                line = measure(count, mode, args.runs, directory, args.path, args.timeout, not args.no_preload)
+                results['results'].append({'products': count, 'mode': mode, **line})
+                print(f"{count:>7} sản phẩm  {mode:<8}  response đầu tiên {line['first_response']:>7.1f}ms  "
+                      f"request đầu tiên {line['first_request']:>7.1f}ms  sẵn sàng {line['ready']:>7.1f}ms")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f'Đã lưu kết quả: {args.output}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
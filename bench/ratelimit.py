@@ -0,0 +1,176 @@
+"""
+Benchmark chi phí rate limit mỗi request
+
+    python -m bench.ratelimit --processes 4 --threads 4 --seconds 3
+
+Đo ba thứ:
+  - check: thời gian một lần RateLimiter.check (2 bucket: client + phiên), một thread
+  - hook: thời gian before_request của rate limit trong một request context thật;
+    kèm chênh lệch end-to-end của POST /add-to-cart khi bật/tắt (test client, nhiễu hơn)
+  - contention: nhiều process x thread cùng check vào một file store, với nhiều key
+  - accuracy: các process cùng đánh vào một key với giới hạn thật, số lượt được nhận
+    không được vượt capacity + thời gian x tốc độ hồi
+Mục tiêu: chi phí thêm mỗi request dưới 50µs.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from bench.routes import percentile
+from ratelimit import Limit, RateLimiter
+
+# Đủ rộng để mọi lần check đều được phép (đo đường đi thường gặp), trừ khi --deny
+LIMITS = {'add_to_cart': Limit(10 ** 9, 1)}
+
+
+def measure_check(path, count, deny=False):
+    limits = {'add_to_cart': Limit(1, 3600)} if deny else LIMITS
+    limiter = RateLimiter(path, limits)
+    latencies = []
+    for index in range(count):
+        start = time.perf_counter()
+        limiter.check('add_to_cart', f'10.0.{index % 256}.{index % 7}', f'session-{index % 1000}')
+        latencies.append(time.perf_counter() - start)
+    return sorted(latencies)
+
+
+def measure_requests(path, count):
+    """Thời gian hook rate limit trong request context thật, và POST /add-to-cart khi tắt/bật
+
+    Hai chế độ chạy xen kẽ từng khối để độ trôi của máy không dồn vào một bên.
+    """
+    os.environ.update(CART_STORE_URL='memory://', JOB_WORKERS='0', RATE_LIMITS='')
+    import app as shop
+
+    limiter = RateLimiter(path, LIMITS)
+    hook, without, with_limiter = [], [], []
+    for index in range(count):
+        environ = {'REMOTE_ADDR': f'10.1.0.{index % 256}'}
+        with shop.app.test_request_context('/add-to-cart', method='POST', environ_base=environ):
+            shop.session['cart_id'] = f'session-{index % 1000}'
+            start = time.perf_counter()
+            limiter.check_request()
+            hook.append(time.perf_counter() - start)
+
+    funcs = shop.app.before_request_funcs.setdefault(None, [])
+    client = shop.app.test_client()
+    for block in range(count // 50):
+        enabled = block % 2 == 1
+        if enabled:
+            funcs.insert(0, limiter.check_request)
+        client = shop.app.test_client()
+        for index in range(50):
+            start = time.perf_counter()
+            client.post('/add-to-cart', data={'product_id': 1}, environ_base={'REMOTE_ADDR': f'10.2.0.{index}'})
+            (with_limiter if enabled else without).append(time.perf_counter() - start)
+        if enabled:
+            funcs.remove(limiter.check_request)
+    return sorted(hook), sorted(without), sorted(with_limiter)
+
+
+def contention_worker(path, limits, threads, seconds, seed, queue, shared_key=False):
+    limiter = RateLimiter(path, limits, client_factor=1)
+    results = []
+    started = time.time()
+
+    def loop(index):
+        latencies = []
+        deadline = time.monotonic() + seconds
+        count = 0
+        while time.monotonic() < deadline:
+            client = 'shared' if shared_key else f'10.{seed}.{index}.{count % 64}'
+            start = time.perf_counter()
+            allowed = not limiter.check('add_to_cart', client, None if shared_key else f'session-{seed}-{index}-{count % 512}')
+            latencies.append((time.perf_counter() - start, allowed))
+            count += 1
+        results.append(latencies)
+
+    pool = [threading.Thread(target=loop, args=(index,)) for index in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    queue.put((started, time.time(), [latency for latencies in results for latency in latencies]))
+
+
+def measure_contention(path, processes, threads, seconds, limits=LIMITS, shared_key=False):
+    """([(thời gian check, được nhận)] của mọi lượt check, số giây từ process đầu bắt đầu tới process cuối xong)"""
+    RateLimiter(path, limits)  # tạo file trước khi các process cùng mở
+    queue = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=contention_worker,
+                                       args=(path, limits, threads, seconds, seed, queue, shared_key))
+               for seed in range(processes)]
+    for worker in workers:
+        worker.start()
+    batches = [queue.get() for _ in workers]
+    for worker in workers:
+        worker.join()
+    window = max(finished for _, finished, _ in batches) - min(started for started, _, _ in batches)
+    return [result for *_, results in batches for result in results], window
+
+
+def summary(latencies):
+    return {
+        'count': len(latencies),
+        'p50_us': round(percentile(latencies, 50) * 1e6, 1),
+        'p95_us': round(percentile(latencies, 95) * 1e6, 1),
+        'p99_us': round(percentile(latencies, 99) * 1e6, 1),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m bench.ratelimit')
+    parser.add_argument('--checks', type=int, default=20000, help='Số lần check khi đo một thread')
+    parser.add_argument('--requests', type=int, default=3000, help='Số request mỗi lượt đo qua test client')
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=4, help='Số thread mỗi process khi đo tranh chấp')
+    parser.add_argument('--seconds', type=float, default=3.0)
+    parser.add_argument('--budget-us', type=float, default=50.0, help='Ngưỡng chi phí mỗi request (µs)')
+    parser.add_argument('-o', '--output', help='Lưu kết quả JSON')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory:
+        contention, _ = measure_contention(os.path.join(directory, 'shared.bin'),
+                                        args.processes, args.threads, args.seconds)
+        # Giới hạn 100/s: trong `window` giây tối đa 100 (dồn sẵn) + 100 x window lượt được nhận
+        limit = Limit(100, 1)
+        accuracy, window = measure_contention(os.path.join(directory, 'accuracy.bin'), args.processes, args.threads,
+                                      args.seconds, {'add_to_cart': limit}, shared_key=True)
+        result = {
+            'check': summary(measure_check(os.path.join(directory, 'check.bin'), args.checks)),
+            'check_denied': summary(measure_check(os.path.join(directory, 'deny.bin'), args.checks, deny=True)),
+            'contention': summary(sorted(latency for latency, _ in contention)),
+            'accuracy_allowed': sum(allowed for _, allowed in accuracy),
+            'accuracy_max': int(limit.capacity + window / limit.interval) + 1,
+        }
+        hook, without, with_limiter = measure_requests(os.path.join(directory, 'requests.bin'), args.requests)
+    result['hook'] = summary(hook)
+    result['request_without'] = summary(without)
+    result['request_with'] = summary(with_limiter)
+    result['request_overhead_p50_us'] = round((percentile(with_limiter, 50) - percentile(without, 50)) * 1e6, 1)
+    result['within_budget'] = result['hook']['p50_us'] <= args.budget_us
+    result['accurate'] = result['accuracy_allowed'] <= result['accuracy_max']
+
+    for name in ('check', 'check_denied', 'contention', 'hook', 'request_without', 'request_with'):
+        line = result[name]
+        print(f"{name:16} n={line['count']:>7}  p50 {line['p50_us']:>7}µs  p95 {line['p95_us']:>7}µs  "
+              f"p99 {line['p99_us']:>8}µs")
+    print(f"chi phí thêm mỗi request (hook, p50): {result['hook']['p50_us']}µs "
+          f"({'đạt' if result['within_budget'] else 'VƯỢT'} ngưỡng {args.budget_us}µs); "
+          f"chênh lệch end-to-end p50: {result['request_overhead_p50_us']}µs")
+    print(f"một key chung, {args.processes} process x {args.threads} thread: nhận {result['accuracy_allowed']} lượt "
+          f"(tối đa {result['accuracy_max']}): {'đúng' if result['accurate'] else 'VƯỢT GIỚI HẠN'}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    return 0 if result['within_budget'] and result['accurate'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
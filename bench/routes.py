@@ -0,0 +1,318 @@
+"""
+Đo latency, throughput và bộ nhớ cho từng route
+
+    python -m bench.routes run --products 10 1000 100000 --cart 20 -o after.json
+    python -m bench.routes run --server --products 1000          # qua HTTP, server cục bộ
+    python -m bench.routes run --url http://localhost:5000       # server đang chạy sẵn
+    python -m bench.routes compare before.json after.json --threshold 10
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+import urllib.error
+import urllib.parse
+import urllib.request
+from http.cookiejar import CookieJar
+
+from bench.synthetic import make_cart, make_products
+
+ROUTES = ('home', 'cart', 'add_to_cart', 'remove_from_cart', 'health')
+
+
+def load_app(cart_store_url=None):
+    # CART_STORE_URL phải có trước khi import app; tắt rate limit để đo được các route ghi giỏ
+    if cart_store_url:
+        os.environ['CART_STORE_URL'] = cart_store_url
+    os.environ.setdefault('RATE_LIMITS', '')
+    import app as shop
+    shop.warmup.wait()  # /health trả 503 cho tới khi warm-up xong
+    return shop
+
+
+class ClientTarget:
+    """Gọi app qua Flask test client, trong cùng process"""
+
+    measures_memory = True
+
+    def __init__(self, shop):
+        self.shop = shop
+        self.client = shop.app.test_client()
+
+    def request(self, method, path, data=None):
+        response = self.client.open(path, method=method, data=data)
+        response.get_data()
+        return response.status_code
+
+    def fill_cart(self, cart):
+        first = next(iter(cart))
+        self.request('POST', '/add-to-cart', {'product_id': first})
+        with self.client.session_transaction() as session:
+            cart_id = session['cart_id']
+        store = self.shop.cart_store
+        store.clear(cart_id)
+        for product_id, quantity in cart.items():
+            store.incr(cart_id, product_id, quantity)
+
+
+class HTTPTarget:
+    """Gọi server qua HTTP, giữ cookie session giữa các request"""
+
+    measures_memory = False
+
+    class NoRedirect(urllib.request.HTTPRedirectHandler):
+        def redirect_request(self, *args, **kwargs):
+            return None
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(CookieJar()), self.NoRedirect())
+
+    def request(self, method, path, data=None):
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        req = urllib.request.Request(self.base_url + path, data=body, method=method)
+        try:
+            with self.opener.open(req) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as error:
+            error.read()
+            return error.code
+
+    def fill_cart(self, cart):
+        for product_id, quantity in cart.items():
+            for _ in range(quantity):
+                self.request('POST', '/add-to-cart', {'product_id': product_id})
+
+
+def start_local_server(shop):
+    """Chạy app bằng werkzeug (đa luồng) trên cổng ngẫu nhiên, trong thread nền"""
+    from werkzeug.serving import make_server
+
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', 0, shop.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+
+def route_calls(route, cart, products, rng):
+    """(method, path, data, bước chuẩn bị không tính giờ) cho một lần gọi route"""
+    in_cart = list(cart)
+    # Sản phẩm ngoài giỏ: thêm (không tính giờ) rồi xóa, giỏ giữ nguyên sau mỗi lần
+    outside = [str(product['id']) for product in products if str(product['id']) not in cart][:100] or in_cart
+    if route == 'home':
+        return lambda: ('GET', '/', None, None)
+    if route == 'cart':
+        return lambda: ('GET', '/cart', None, None)
+    if route == 'add_to_cart':
+        # Thêm sản phẩm đã có trong giỏ để kích thước giỏ không đổi trong lúc đo
+        return lambda: ('POST', '/add-to-cart', {'product_id': rng.choice(in_cart)}, None)
+    if route == 'remove_from_cart':
+        def call():
+            product_id = rng.choice(outside)
+            return 'POST', f'/remove/{product_id}', {}, ('POST', '/add-to-cart', {'product_id': product_id})
+        return call
+    if route == 'health':
+        return lambda: ('GET', '/health', None, None)
+    raise ValueError(route)
+
+
+def fetch_products(target):
+    """Lấy toàn bộ catalog của server qua /api/products"""
+    products, cursor = [], None
+    while True:
+        query = {'limit': 100, **({'cursor': cursor} if cursor else {})}
+        with target.opener.open(f'{target.base_url}/api/products?{urllib.parse.urlencode(query)}') as response:
+            page = json.load(response)
+        products.extend(page['items'])
+        cursor = page['next_cursor']
+        if not cursor:
+            return products
+
+
+def percentile(values, pct):
+    """Percentile kiểu nearest-rank trên danh sách đã sắp xếp"""
+    index = max(0, min(len(values) - 1, round(pct / 100 * len(values)) - 1))
+    return values[index]
+
+
+def measure(target, next_call, requests, warmup, memory_samples):
+    for _ in range(warmup):
+        method, path, data, setup = next_call()
+        if setup:
+            target.request(*setup)
+        target.request(method, path, data)
+
+    latencies = []
+    statuses = {}
+    for _ in range(requests):
+        method, path, data, setup = next_call()
+        if setup:
+            target.request(*setup)
+        start = time.perf_counter()
+        status = target.request(method, path, data)
+        latencies.append(time.perf_counter() - start)
+        statuses[status] = statuses.get(status, 0) + 1
+
+    allocated = []
+    if target.measures_memory and memory_samples:
+        tracemalloc.start()
+        for _ in range(memory_samples):
+            method, path, data, setup = next_call()
+            if setup:
+                target.request(*setup)
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            target.request(method, path, data)
+            allocated.append(tracemalloc.get_traced_memory()[1] - before)
+        tracemalloc.stop()
+
+    latencies.sort()
+    return {
+        'requests': requests,
+        'statuses': {str(status): count for status, count in sorted(statuses.items())},
+        'p50_ms': round(percentile(latencies, 50) * 1000, 4),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 4),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 4),
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 4),
+        'rps': round(len(latencies) / sum(latencies), 1),
+        'alloc_peak_kb': round(sum(allocated) / len(allocated) / 1024, 2) if allocated else None,
+    }
+
+
+def peak_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux trả về KB, macOS trả về byte
+    return round(rss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def run(args):
+    from catalog import Catalog
+
+    shop = load_app(args.cart_store) if not args.url else None
+    server = None
+    results = {
+        'meta': {
+            'mode': 'url' if args.url else 'server' if args.server else 'client',
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'requests': args.requests,
+        },
+        'runs': [],
+    }
+    if args.server:
+        server, base_url = start_local_server(shop)
+
+    sizes = args.products
+    if args.url:
+        server_products = fetch_products(HTTPTarget(args.url))
+        sizes = [len(server_products)]
+
+    try:
+        for size in sizes:
+            products = server_products if args.url else make_products(size, seed=args.seed)
+            if shop is not None:
+                # Thay catalog mặc định bằng catalog giả lập (version mới nên cache tự render lại)
+                shop.catalog_source.catalog = Catalog(products)
+            if args.url:
+                target = HTTPTarget(args.url)
+            elif server is not None:
+                target = HTTPTarget(base_url)
+            else:
+                target = ClientTarget(shop)
+
+            cart = make_cart(products, args.cart, seed=args.seed)
+            target.fill_cart(cart)
+            rng = random.Random(args.seed)
+            run_result = {'products': size, 'cart': len(cart), 'routes': {}}
+            for route in args.routes:
+                run_result['routes'][route] = measure(
+                    target, route_calls(route, cart, products, rng), args.requests,
+                    args.warmup, args.memory_samples)
+                line = run_result['routes'][route]
+                print(f"{size:>7} sp  {route:<17} p50 {line['p50_ms']:>9.3f}ms  "
+                      f"p95 {line['p95_ms']:>9.3f}ms  p99 {line['p99_ms']:>9.3f}ms  "
+                      f"{line['rps']:>9.1f} req/s  alloc {line['alloc_peak_kb']} KB")
+            results['runs'].append(run_result)
+    finally:
+        if server is not None:
+            server.shutdown()
+
+    results['peak_rss_mb'] = peak_rss_mb() if shop is not None else None
+    print(f"peak RSS: {results['peak_rss_mb']} MB")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f'Đã lưu kết quả: {args.output}')
+    return 0
+
+
+def compare(args):
+    """So sánh hai file kết quả, trả về 1 nếu p95 của route nào tăng quá ngưỡng"""
+    with open(args.base, encoding='utf-8') as f:
+        base = json.load(f)
+    with open(args.new, encoding='utf-8') as f:
+        new = json.load(f)
+
+    base_runs = {(run['products'], run['cart']): run for run in base['runs']}
+    regressions = 0
+    for run in new['runs']:
+        old = base_runs.get((run['products'], run['cart']))
+        if old is None:
+            continue
+        for route, line in run['routes'].items():
+            before = old['routes'].get(route)
+            if before is None:
+                continue
+            change = {key: (line[key] - before[key]) / before[key] * 100 if before[key] else 0.0
+                      for key in ('p50_ms', 'p95_ms', 'p99_ms', 'rps')}
+            regressed = change['p95_ms'] > args.threshold
+            regressions += regressed
+            print(f"{run['products']:>7} sp  {route:<17} "
+                  f"p50 {change['p50_ms']:+7.1f}%  p95 {change['p95_ms']:+7.1f}%  "
+                  f"p99 {change['p99_ms']:+7.1f}%  rps {change['rps']:+7.1f}%"
+                  f"{'  <-- chậm hơn' if regressed else ''}")
+    return 1 if regressions else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m bench.routes')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='Chạy benchmark')
+    run_parser.add_argument('--products', type=int, nargs='+', default=[10, 1000, 10000],
+                            help='Các kích thước catalog cần đo')
+    run_parser.add_argument('--cart', type=int, default=10, help='Số dòng trong giỏ hàng')
+    run_parser.add_argument('--requests', type=int, default=500, help='Số request đo cho mỗi route')
+    run_parser.add_argument('--warmup', type=int, default=20)
+    run_parser.add_argument('--memory-samples', type=int, default=50,
+                            help='Số request đo bộ nhớ cấp phát bằng tracemalloc (chỉ chế độ test client)')
+    run_parser.add_argument('--routes', nargs='+', choices=ROUTES, default=list(ROUTES))
+    run_parser.add_argument('--cart-store', help='CART_STORE_URL dùng khi đo, vd memory://')
+    run_parser.add_argument('--seed', type=int, default=0)
+    run_parser.add_argument('--server', action='store_true', help='Đo qua HTTP với server werkzeug cục bộ')
+    run_parser.add_argument('--url', help='Đo server đang chạy sẵn (dùng catalog của server)')
+    run_parser.add_argument('-o', '--output', help='Lưu kết quả JSON')
+
+    compare_parser = commands.add_parser('compare', help='So sánh hai lần chạy')
+    compare_parser.add_argument('base')
+    compare_parser.add_argument('new')
+    compare_parser.add_argument('--threshold', type=float, default=10.0,
+                                help='Ngưỡng tăng p95 (%%) bị coi là chậm hơn')
+
+    args = parser.parse_args(argv)
+    return run(args) if args.command == 'run' else compare(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
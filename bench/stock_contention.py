@@ -0,0 +1,128 @@
+"""
+Benchmark tranh chấp tồn kho: nhiều process x nhiều thread cùng giữ/trả/mua một sku
+
+    python -m bench.stock_contention --processes 4 --threads 8 --seconds 5 --stock 500
+
+Mỗi vòng: giữ 1 đơn vị cho một giỏ riêng, rồi hoặc trả lại hoặc thanh toán
+(theo --checkout-ratio). Cuối cùng kiểm tra không bán quá tồn kho và số đang
+giữ khớp với bảng holds.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+from bench.routes import percentile
+from inventory import Inventory
+
+SKU = 'hot-sku'
+
+
+def worker(path, stock, threads, seconds, checkout_ratio, seed, queue):
+    inventory = Inventory(path)
+    results = []
+
+    def loop(index):
+        rng = random.Random(seed * 1000 + index)
+        latencies, reserved, rejected, sold = [], 0, 0, 0
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            cart_id = uuid.uuid4().hex
+            start = time.perf_counter()
+            ok = inventory.reserve(cart_id, SKU, 1, stock)
+            latencies.append(time.perf_counter() - start)
+            if not ok:
+                rejected += 1
+                continue
+            reserved += 1
+            if rng.random() < checkout_ratio:
+                inventory.commit(cart_id, {SKU: 1}, {SKU: stock}, cart_id)
+                sold += 1
+            else:
+                inventory.release(cart_id, SKU)
+        results.append((latencies, reserved, rejected, sold))
+
+    pool = [threading.Thread(target=loop, args=(index,)) for index in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    queue.put([(sorted(latencies), reserved, rejected, sold) for latencies, reserved, rejected, sold in results])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m bench.stock_contention')
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=8, help='Số thread mỗi process')
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--stock', type=int, default=100000, help='Tồn kho ban đầu của sku')
+    parser.add_argument('--checkout-ratio', type=float, default=0.1,
+                        help='Tỉ lệ lượt giữ hàng được thanh toán (còn lại trả lại)')
+    parser.add_argument('-o', '--output', help='Lưu kết quả JSON')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'inventory.sqlite3')
+        Inventory(path)  # tạo bảng trước khi các process cùng mở file
+        queue = multiprocessing.Queue()
+        processes = [
+            multiprocessing.Process(target=worker, args=(path, args.stock, args.threads, args.seconds,
+                                                         args.checkout_ratio, seed, queue))
+            for seed in range(args.processes)
+        ]
+        started = time.perf_counter()
+        for process in processes:
+            process.start()
+        batches = [queue.get() for _ in processes]
+        for process in processes:
+            process.join()
+        elapsed = time.perf_counter() - started
+
+        inventory = Inventory(path)
+        db = inventory._connect()
+        reserved, committed = db.execute('SELECT reserved, committed FROM stock WHERE sku = ?', (SKU,)).fetchone()
+        on_hand = args.stock - committed
+        held = db.execute('SELECT COALESCE(SUM(quantity), 0) FROM holds WHERE sku = ?', (SKU,)).fetchone()[0]
+
+    latencies = sorted(latency for batch in batches for latencies, *_ in batch for latency in latencies)
+    reserved_ok = sum(result[1] for batch in batches for result in batch)
+    rejected = sum(result[2] for batch in batches for result in batch)
+    sold = sum(result[3] for batch in batches for result in batch)
+    consistent = on_hand == args.stock - sold and reserved == held and on_hand >= 0 and reserved >= 0
+    result = {
+        'processes': args.processes,
+        'threads': args.threads,
+        'stock': args.stock,
+        'reserve_calls': len(latencies),
+        'reserved': reserved_ok,
+        'rejected': rejected,
+        'sold': sold,
+        'ops_per_second': round((len(latencies) + reserved_ok) / elapsed, 1),
+        'reserve_p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'reserve_p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'reserve_p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'final_on_hand': on_hand,
+        'final_reserved': reserved,
+        'consistent': consistent,
+    }
+    print(f"{args.processes} process x {args.threads} thread: {result['reserve_calls']} lượt giữ "
+          f"({result['rejected']} bị từ chối), bán {sold}/{args.stock}, {result['ops_per_second']} thao tác/s")
+    print(f"giữ hàng p50 {result['reserve_p50_ms']}ms  p95 {result['reserve_p95_ms']}ms  "
+          f"p99 {result['reserve_p99_ms']}ms")
+    print(f"tồn kho cuối {on_hand}, đang giữ {reserved} (holds {held}): "
+          f"{'nhất quán' if consistent else 'KHÔNG NHẤT QUÁN'}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    return 0 if consistent else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,37 @@
+"""
+Sinh catalog và giỏ hàng giả lập cho benchmark
+"""
+
+import random
+
+DISHES = ['Bánh mì', 'Phở', 'Bún', 'Cơm tấm', 'Hủ tiếu', 'Cháo', 'Miến', 'Bánh cuốn',
+          'Cà phê', 'Trà', 'Sinh tố', 'Chè', 'Xôi', 'Gỏi cuốn', 'Bánh xèo', 'Mì quảng']
+FLAVORS = ['bò', 'gà', 'heo', 'tôm', 'cua', 'chay', 'thịt nướng', 'sườn', 'đặc biệt',
+           'sữa đá', 'đen', 'dâu', 'xoài', 'thập cẩm', 'hải sản', 'chả cá']
+STYLES = ['truyền thống', 'thơm ngon', 'đậm đà', 'nước trong', 'giòn rụm', 'nóng hổi',
+          'mát lạnh', 'nhà làm', 'Sài Gòn', 'Hà Nội', 'Huế', 'miền Tây']
+CATEGORIES = ['do-an', 'do-uong', 'trang-mieng']
+
+
+def make_products(count, seed=0):
+    """Danh sách sản phẩm cùng định dạng với `products` trong app.py"""
+    rng = random.Random(seed)
+    products = []
+    for product_id in range(1, count + 1):
+        name = f'{rng.choice(DISHES)} {rng.choice(FLAVORS)} #{product_id}'
+        products.append({
+            'id': product_id,
+            'name': name,
+            'price': rng.randrange(10, 200) * 1000,
+            'image': f'https://images.unsplash.com/photo-{1540000000000 + product_id}?w=300&h=200&fit=crop',
+            'description': f'{name} {rng.choice(STYLES)}, {rng.choice(STYLES)}',
+            'category': rng.choice(CATEGORIES),
+        })
+    return products
+
+
+def make_cart(products, size, seed=0):
+    """{product_id (str): quantity} với `size` dòng khác nhau"""
+    rng = random.Random(seed)
+    picked = rng.sample(products, min(size, len(products)))
+    return {str(product['id']): rng.randint(1, 5) for product in picked}
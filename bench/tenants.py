@@ -0,0 +1,261 @@
+"""
+Benchmark nhiều store (tenant) trong một process
+
+    python -m bench.tenants --tenants 300 --big 2 --big-products 20000 -o tenants.json
+
+Sinh --tenants store nhỏ (10..500 sản phẩm, lệch về phía store nhỏ) và --big store
+lớn trong database SQLite tạm, chọn store theo subdomain (STORE_DOMAIN), rồi đo:
+  - memory: bộ nhớ thật (tracemalloc) của catalog mỗi store, so với ước lượng
+    StoreResolver dùng để tính quota
+  - lookup: resolve_store + current_catalog cho một store ngẫu nhiên, khi đã cache
+    (hot) và khi cache hết hạn (cold: 2 query + dựng catalog)
+  - isolation: mọi store nhỏ đã có catalog và trang chủ trong cache, sau đó store
+    lớn nạp catalog và gửi --searches truy vấn tìm kiếm khác nhau; đếm số store nhỏ
+    còn giữ catalog/trang chủ trong bộ nhớ, khi có quota theo store và khi không
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from bench.routes import load_app, percentile
+from bench.synthetic import DISHES, FLAVORS, make_products
+
+DOMAIN = 'bench.test'
+
+
+def tenant_sizes(tenants, big, big_products, seed=0):
+    """{slug: số sản phẩm}; số sản phẩm của store nhỏ phân bố log-uniform trong 10..500"""
+    rng = random.Random(seed)
+    sizes = {f'store{index}': int(10 * 50 ** rng.random()) for index in range(tenants)}
+    sizes.update({f'big{index}': big_products for index in range(big)})
+    return sizes
+
+
+def seed_database(shop, sizes):
+    from models import db
+    from models.product import Product
+    from models.store import Store
+
+    with shop.app.app_context():
+        db.create_all()
+        db.session.execute(db.insert(Store), [{'name': slug.title(), 'slug': slug} for slug in sizes])
+        ids = dict(db.session.execute(db.select(Store.slug, Store.id)).all())
+        for index, (slug, count) in enumerate(sizes.items()):
+            rows = [{
+                'store_id': ids[slug],
+                'name': product['name'],
+                'slug': f"sp-{product['id']}",
+                'price': product['price'],
+                'short_description': product['description'],
+                'image_url': product['image'],
+                'sort_order': product['id'],
+            } for product in make_products(count, seed=index)]
+            if rows:
+                db.session.execute(db.insert(Product), rows)
+        db.session.commit()
+
+
+def measure_memory(shop, sizes):
+    """[(số sản phẩm, byte đo được, byte ước lượng)] mỗi store: catalog dựng từ database"""
+    from catalog import Catalog
+    from tenants import deep_sizeof, load_store_products
+
+    results = []
+    with shop.app.app_context():
+        for slug, count in sizes.items():
+            store = shop.stores.store(slug)
+            gc.collect()
+            tracemalloc.start()
+            products = load_store_products(store['id'])
+            shop.db.session.remove()
+            catalog = Catalog(products)
+            del products
+            gc.collect()
+            measured = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            results.append((count, measured, deep_sizeof(catalog)))
+            del catalog
+    return results
+
+
+def lookup(shop, slug):
+    with shop.app.test_request_context('/', base_url=f'http://{slug}.{DOMAIN}'):
+        start = time.perf_counter()
+        shop.resolve_store()
+        shop.current_catalog()
+        return time.perf_counter() - start
+
+
+def measure_lookup(shop, slugs, count, seed=0):
+    """(thời gian khi đã cache, thời gian khi cache hết hạn), đã sắp xếp"""
+    rng = random.Random(seed)
+    shop.stores.invalidate()
+    cold = []
+    for slug in slugs:
+        shop.stores.invalidate(slug)
+        cold.append(lookup(shop, slug))
+    hot = [lookup(shop, rng.choice(slugs)) for _ in range(count)]
+    return sorted(hot), sorted(cold)
+
+
+def catalog_isolation(shop, small, big, quota):
+    """Số store nhỏ còn giữ catalog sau khi các store lớn được nạp
+
+    Ngân sách vừa đủ cho các store nhỏ cộng nửa store lớn đầu tiên; có quota thì mỗi
+    store tối đa 1/8 ngân sách khi hết chỗ, không quota thì store nào cũng như nhau.
+    """
+    resolver = shop.stores
+    resolver.invalidate()
+    resolver.catalog_bytes = resolver.tenant_catalog_bytes = 1 << 60
+    with shop.app.app_context():
+        small_stores = [resolver.store(slug) for slug in small]
+        for store in small_stores:
+            resolver.catalog(store)
+        big_stores = [resolver.store(slug) for slug in big]
+        for store in big_stores:
+            resolver.catalog(store)
+        usage = resolver.catalog_usage()
+        big_size = max((usage[store['id']] for store in big_stores), default=0)
+        small_total = sum(usage[store['id']] for store in small_stores)
+        budget = small_total + big_size // 2
+        resolver.invalidate()
+        resolver.catalog_bytes = budget
+        resolver.tenant_catalog_bytes = budget // 8 if quota else budget
+        for store in small_stores:
+            resolver.catalog(store)
+        started = time.perf_counter()
+        for store in big_stores:
+            resolver.catalog(store)
+        big_seconds = time.perf_counter() - started
+        usage = resolver.catalog_usage()
+    return {
+        'budget_mb': round(budget / 2 ** 20, 1),
+        'small_kept': sum(store['id'] in usage for store in small_stores),
+        'big_kept': sum(store['id'] in usage for store in big_stores),
+        'big_load_ms': round(big_seconds * 1000, 1),
+    }
+
+
+def cache_isolation(shop, small, big, searches, quota, seed=0):
+    """Số store nhỏ còn trang chủ trong LRU của worker sau khi store lớn dồn truy vấn tìm kiếm"""
+    rng = random.Random(seed)
+    cache = shop.cache
+    defaults = cache.namespace_size, cache.namespace_bytes
+    if not quota:
+        cache.namespace_size, cache.namespace_bytes = cache.local_size, cache.local_bytes
+    try:
+        shop.stores.invalidate()
+        cache.clear_local()
+        client = shop.app.test_client()
+        for slug in small:
+            client.get('/', base_url=f'http://{slug}.{DOMAIN}')
+        for index in range(searches):
+            query = f'{rng.choice(DISHES)} {rng.choice(FLAVORS)} {index}'
+            client.get('/api/search', query_string={'q': query}, base_url=f'http://{rng.choice(big)}.{DOMAIN}')
+        usage = cache.local_usage()
+        latencies = []
+        for slug in small:
+            start = time.perf_counter()
+            client.get('/', base_url=f'http://{slug}.{DOMAIN}')
+            latencies.append(time.perf_counter() - start)
+    finally:
+        cache.namespace_size, cache.namespace_bytes = defaults
+    return {
+        'small_kept': sum(f'store:{slug}' in usage for slug in small),
+        'big_keys': sum(usage.get(f'store:{slug}', (0, 0))[0] for slug in big),
+        'small_home_p50_us': round(percentile(sorted(latencies), 50) * 1e6, 1),
+    }
+
+
+def memory_summary(samples):
+    measured = [sample[1] for sample in samples]
+    return {
+        'tenants': len(samples),
+        'products': sum(sample[0] for sample in samples),
+        'total_mb': round(sum(measured) / 2 ** 20, 2),
+        'per_tenant_kb_p50': round(statistics.median(measured) / 1024, 1),
+        'per_tenant_kb_max': round(max(measured) / 1024, 1),
+        'bytes_per_product': round(statistics.median(sample[1] / sample[0] for sample in samples if sample[0])),
+        'estimate_ratio': round(statistics.median(sample[2] / sample[1] for sample in samples), 2),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m bench.tenants')
+    parser.add_argument('--tenants', type=int, default=300, help='Số store nhỏ')
+    parser.add_argument('--big', type=int, default=2, help='Số store lớn')
+    parser.add_argument('--big-products', type=int, default=20000)
+    parser.add_argument('--lookups', type=int, default=20000, help='Số lần tra store khi đã cache')
+    parser.add_argument('--searches', type=int, default=2000, help='Số truy vấn tìm kiếm của store lớn')
+    parser.add_argument('-o', '--output', help='Lưu kết quả JSON')
+    args = parser.parse_args(argv)
+
+    directory = tempfile.mkdtemp()
+    os.environ.update(
+        DATABASE_URL=f"sqlite:///{os.path.join(directory, 'tenants.sqlite3')}",
+        STORE_DOMAIN=DOMAIN,
+        TENANT_RATE_LIMIT='',
+        RATE_LIMIT_PATH=os.path.join(directory, 'ratelimit.bin'),
+        CACHE_URL='memory://',
+        CART_STORE_URL='memory://',
+        CATALOG_SNAPSHOT='',
+        JOB_WORKERS='0',
+    )
+    shop = load_app()
+    sizes = tenant_sizes(args.tenants, args.big, args.big_products)
+    small = [slug for slug in sizes if slug.startswith('store')]
+    big = [slug for slug in sizes if slug.startswith('big')]
+    seed_database(shop, sizes)
+
+    memory = measure_memory(shop, sizes)
+    hot, cold = measure_lookup(shop, small, args.lookups)
+    result = {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'tenants': args.tenants,
+            'big': args.big,
+            'big_products': args.big_products,
+        },
+        'memory_small': memory_summary([sample for sample, slug in zip(memory, sizes) if slug in small]),
+        'memory_big': memory_summary([sample for sample, slug in zip(memory, sizes) if slug in big]) if big else None,
+        'lookup_hot_us': {'p50': round(percentile(hot, 50) * 1e6, 1), 'p99': round(percentile(hot, 99) * 1e6, 1)},
+        'lookup_cold_us': {'p50': round(percentile(cold, 50) * 1e6, 1), 'p99': round(percentile(cold, 99) * 1e6, 1)},
+        'catalog_isolation': {mode: catalog_isolation(shop, small, big, mode == 'quota') for mode in ('quota', 'no_quota')},
+        'cache_isolation': {mode: cache_isolation(shop, small, big, args.searches, mode == 'quota')
+                            for mode in ('quota', 'no_quota')},
+    }
+
+    for name in ('memory_small', 'memory_big'):
+        line = result[name]
+        if line:
+            print(f"{name:12} {line['tenants']:>4} store  {line['products']:>7} sản phẩm  tổng {line['total_mb']:>7}MB  "
+                  f"mỗi store p50 {line['per_tenant_kb_p50']:>8}KB max {line['per_tenant_kb_max']:>9}KB  "
+                  f"{line['bytes_per_product']}B/sản phẩm  ước lượng/đo {line['estimate_ratio']}")
+    for name in ('lookup_hot_us', 'lookup_cold_us'):
+        print(f"{name:14} p50 {result[name]['p50']:>8}µs  p99 {result[name]['p99']:>8}µs")
+    for mode, line in result['catalog_isolation'].items():
+        print(f"catalog {mode:9} ngân sách {line['budget_mb']}MB: store nhỏ còn {line['small_kept']}/{len(small)}, "
+              f"store lớn còn {line['big_kept']}/{len(big)}, nạp store lớn {line['big_load_ms']}ms")
+    for mode, line in result['cache_isolation'].items():
+        print(f"LRU     {mode:9} store nhỏ còn trang chủ {line['small_kept']}/{len(small)}, "
+              f"khóa của store lớn {line['big_keys']}, trang chủ store nhỏ p50 {line['small_home_p50_us']}µs")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f'Đã lưu kết quả: {args.output}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
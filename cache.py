@@ -0,0 +1,391 @@
+"""
+Cache hai tầng dùng chung giữa các worker: LRU trong process, sau đó là shared cache
+
+Shared backend (CACHE_URL):
+    memory://                 trong process (dev, 1 worker, test)
+    sqlite:///duong/dan.db    dùng chung giữa các worker trên cùng máy
+    redis://host:6379/0       dùng chung giữa các máy (cần package redis)
+
+Khóa gồm namespace (vd: mỗi store một namespace), version và tên:
+`namespace:version:tên`. Version là dấu của dữ liệu nguồn (vd: Catalog.stamp),
+giống nhau giữa các worker, nên khi catalog đổi các worker tự chuyển sang khóa
+mới và không bao giờ đọc nhầm bản của catalog cũ; bản cũ hết hạn theo TTL.
+Tầng LRU chỉ dùng cho giá trị không đổi theo khóa (đã có version trong khóa),
+giá trị có thể bị worker khác sửa (tổng giỏ hàng) thì gọi với local=False.
+
+Chống dồn request (single-flight): khi trượt cache, trong một process chỉ một
+thread dựng giá trị, giữa các process thì worker giữ được lease (SET NX) dựng,
+các worker khác chờ đọc kết quả. Shared cache lỗi thì dựng tại chỗ, không lỗi request.
+
+Giá trị được pickle khi vào shared cache; giá trị trong LRU được dùng chung giữa
+các thread nên không được sửa sau khi lấy ra.
+
+LRU chia theo namespace (mỗi store một phần): một namespace giữ tối đa
+`namespace_size` khóa và `namespace_bytes` byte (tính theo kích thước đã pickle),
+vượt thì bỏ khóa cũ của chính namespace đó. Store lớn nhiều trang/kết quả tìm kiếm vì thế không đẩy được
+trang nóng của store nhỏ ra khỏi LRU; khi cả LRU vượt `local_size` khóa hoặc
+`local_bytes` byte thì namespace lâu không dùng nhất bị bớt trước.
+"""
+
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = 3600
+# Thời gian tối đa một worker giữ quyền dựng một khóa; worker chết giữa chừng thì worker khác dựng
+LEASE_TTL = 10
+
+_MISSING = object()
+
+
+class SharedCache:
+    """Giao diện backend: giá trị là bytes, TTL tính bằng giây"""
+
+    # Lỗi của backend mà Cache bỏ qua (coi như trượt cache)
+    errors = ()
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value, ttl):
+        raise NotImplementedError
+
+    def add(self, key, value, ttl):
+        """Ghi nếu khóa chưa có (hoặc đã hết hạn), True nếu đã ghi"""
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+
+class MemorySharedCache(SharedCache):
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._put(key, value, ttl)
+
+    def add(self, key, value, ttl):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] >= time.time():
+                return False
+            self._put(key, value, ttl)
+            return True
+
+    def _put(self, key, value, ttl):
+        self._entries[key] = (time.time() + ttl, value)
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+class SQLiteSharedCache(SharedCache):
+    """Bảng key/value trong file SQLite, an toàn giữa nhiều thread và worker"""
+
+    errors = (sqlite3.Error,)
+
+    # Dọn khóa hết hạn sau mỗi bấy nhiêu lần ghi
+    PURGE_EVERY = 500
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connect().executescript('''
+            CREATE TABLE IF NOT EXISTS cache (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                expires_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS ix_cache_expires_at ON cache (expires_at);
+        ''')
+
+    def _connect(self):
+        # Mỗi thread (và mỗi process sau khi fork) có connection riêng
+        db = getattr(self._local, 'db', None)
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self._local.db = db
+            self._local.pid = os.getpid()
+        return db
+
+    def get(self, key):
+        row = self._connect().execute('SELECT value FROM cache WHERE key = ? AND expires_at >= ?',
+                                      (key, time.time())).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, value, ttl):
+        db = self._connect()
+        db.execute('INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)',
+                   (key, value, time.time() + ttl))
+        self._maybe_purge(db)
+
+    def add(self, key, value, ttl):
+        db = self._connect()
+        now = time.time()
+        # Một câu lệnh (nguyên tử): chèn mới, hoặc ghi đè khóa đã hết hạn
+        added = db.execute(
+            'INSERT INTO cache (key, value, expires_at) VALUES (?, ?, ?) '
+            'ON CONFLICT (key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at '
+            'WHERE cache.expires_at < ?',
+            (key, value, now + ttl, now),
+        ).rowcount == 1
+        self._maybe_purge(db)
+        return added
+
+    def delete(self, key):
+        self._connect().execute('DELETE FROM cache WHERE key = ?', (key,))
+
+    def _maybe_purge(self, db):
+        self._writes += 1
+        if self._writes % self.PURGE_EVERY == 0:
+            db.execute('DELETE FROM cache WHERE expires_at < ?', (time.time(),))
+
+
+class RedisSharedCache(SharedCache):
+    """Redis (hoặc server tương thích giao thức Redis) qua package redis"""
+
+    def __init__(self, url):
+        import redis
+
+        self.errors = (redis.RedisError, OSError)
+        self._client = redis.Redis.from_url(url, socket_timeout=1, socket_connect_timeout=1)
+
+    def get(self, key):
+        return self._client.get(key)
+
+    def set(self, key, value, ttl):
+        self._client.set(key, value, px=int(ttl * 1000))
+
+    def add(self, key, value, ttl):
+        return bool(self._client.set(key, value, px=int(ttl * 1000), nx=True))
+
+    def delete(self, key):
+        self._client.delete(key)
+
+
+def create_shared_cache(url):
+    """Tạo backend từ URL: memory://, sqlite:///path hoặc redis://..."""
+    if url.startswith('memory://'):
+        return MemorySharedCache()
+    if url.startswith('sqlite:///'):
+        return SQLiteSharedCache(url[len('sqlite:///'):])
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisSharedCache(url)
+    raise ValueError(f'Không hỗ trợ cache: {url}')
+
+
+class _Partition:
+    """Các khóa của một namespace trong LRU, cùng một version"""
+
+    __slots__ = ('version', 'entries', 'bytes')
+
+    def __init__(self, version):
+        self.version = version
+        self.entries = OrderedDict()  # tên -> (giá trị, số byte)
+        self.bytes = 0
+
+
+class Cache:
+    """LRU trong process (`local_size` khóa, `local_bytes` byte, mỗi namespace
+    tối đa `namespace_size` khóa và `namespace_bytes` byte) trước shared cache"""
+
+    def __init__(self, shared, local_size=1024, prefix='shop', lease_ttl=LEASE_TTL,
+                 local_bytes=64 * 1024 * 1024, namespace_size=128, namespace_bytes=8 * 1024 * 1024):
+        self.shared = shared
+        self.local_size = local_size
+        self.local_bytes = local_bytes
+        self.namespace_size = min(namespace_size, local_size)
+        self.namespace_bytes = min(namespace_bytes, local_bytes)
+        self.prefix = prefix
+        self.lease_ttl = lease_ttl
+        self._lock = threading.Lock()
+        self._partitions = OrderedDict()  # namespace -> _Partition, namespace dùng gần nhất ở cuối
+        self._entries = 0
+        self._bytes = 0
+        self._flights = {}                # khóa -> lock của thread đang dựng
+
+    def _key(self, namespace, version, name):
+        return f'{self.prefix}:{namespace}:{version}:{name}'
+
+    def get(self, namespace, name, version='', local=True):
+        """Giá trị đã cache hoặc None"""
+        value = self._lookup(namespace, version, name, local)
+        return None if value is _MISSING else value
+
+    def set(self, namespace, name, value, version='', ttl=DEFAULT_TTL, local=True):
+        """Ghi đè giá trị (vd: sau khi dữ liệu gốc đổi)"""
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        self._shared_call('set', self._key(namespace, version, name), data, ttl)
+        if local:
+            self._remember(namespace, version, name, value, len(data))
+
+    def add(self, namespace, name, value, version='', ttl=DEFAULT_TTL):
+        """Ghi vào shared cache nếu khóa chưa có; True nếu đã ghi (shared cache lỗi cũng coi là True)
+
+        Dùng để chỉ một worker làm một việc (vd: purge CDN) dù mọi worker cùng thấy một thay đổi.
+        """
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        return self._shared_call('add', self._key(namespace, version, name), data, ttl) is not False
+
+    def delete(self, namespace, name, version=''):
+        with self._lock:
+            partition = self._partitions.get(namespace)
+            if partition is not None and partition.version == version:
+                self._drop(partition, name)
+        self._shared_call('delete', self._key(namespace, version, name))
+
+    def get_or_set(self, namespace, name, build, version='', ttl=DEFAULT_TTL, local=True):
+        """Giá trị đã cache, hoặc build() (chỉ một lần dù nhiều thread/worker cùng trượt)"""
+        value = self._lookup(namespace, version, name, local)
+        if value is not _MISSING:
+            return value
+        key = self._key(namespace, version, name)
+        with self._flight(key):
+            value = self._lookup(namespace, version, name, local)
+            if value is not _MISSING:
+                return value
+            leased, data = self._lease(key)
+            if data is None:
+                try:
+                    value = build()
+                    data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+                    # add: không đè lên giá trị mới hơn do request sửa dữ liệu ghi vào trong lúc dựng
+                    self._shared_call('add', key, data, ttl)
+                finally:
+                    if leased:
+                        self._shared_call('delete', f'{key}:lease')
+            else:
+                value = pickle.loads(data)
+            if local:
+                self._remember(namespace, version, name, value, len(data))
+            return value
+
+    def clear_local(self):
+        with self._lock:
+            self._partitions.clear()
+            self._entries = self._bytes = 0
+
+    def local_usage(self):
+        """{namespace: (số khóa, số byte)} của LRU trong process"""
+        with self._lock:
+            return {namespace: (len(partition.entries), partition.bytes)
+                    for namespace, partition in self._partitions.items()}
+
+    def _lookup(self, namespace, version, name, local):
+        if local:
+            with self._lock:
+                partition = self._partitions.get(namespace)
+                if partition is not None and partition.version == version:
+                    entry = partition.entries.get(name)
+                    if entry is not None:
+                        partition.entries.move_to_end(name)
+                        self._partitions.move_to_end(namespace)
+                        return entry[0]
+        data = self._shared_call('get', self._key(namespace, version, name))
+        if data is None:
+            return _MISSING
+        value = pickle.loads(data)
+        if local:
+            self._remember(namespace, version, name, value, len(data))
+        return value
+
+    def _remember(self, namespace, version, name, value, size):
+        if size > self.namespace_bytes:
+            # Lớn hơn cả phần của namespace: chỉ nằm trong shared cache
+            return
+        with self._lock:
+            partition = self._partitions.get(namespace)
+            if partition is None or partition.version != version:
+                if partition is not None:
+                    # Dữ liệu của namespace đã đổi version: bỏ ngay các bản cũ trong LRU
+                    self._entries -= len(partition.entries)
+                    self._bytes -= partition.bytes
+                partition = self._partitions[namespace] = _Partition(version)
+            self._partitions.move_to_end(namespace)
+            self._drop(partition, name)
+            partition.entries[name] = (value, size)
+            partition.bytes += size
+            self._entries += 1
+            self._bytes += size
+            # Vượt phần của namespace: chỉ bỏ khóa cũ của chính namespace này
+            while len(partition.entries) > self.namespace_size or partition.bytes > self.namespace_bytes:
+                self._drop(partition, next(iter(partition.entries)))
+            # Vượt giới hạn chung: bớt từ namespace lâu không dùng nhất
+            while self._entries > self.local_size or self._bytes > self.local_bytes:
+                oldest_namespace, oldest = next(iter(self._partitions.items()))
+                if oldest.entries:
+                    self._drop(oldest, next(iter(oldest.entries)))
+                if not oldest.entries:
+                    del self._partitions[oldest_namespace]
+
+    def _drop(self, partition, name):
+        entry = partition.entries.pop(name, None)
+        if entry is not None:
+            partition.bytes -= entry[1]
+            self._entries -= 1
+            self._bytes -= entry[1]
+
+    def _flight(self, key):
+        # Một lock cho mỗi khóa đang được dựng để các thread trượt cùng khóa chờ nhau
+        with self._lock:
+            if len(self._flights) > 1024:
+                self._flights = {key: lock for key, lock in self._flights.items() if lock.locked()}
+            return self._flights.setdefault(key, threading.Lock())
+
+    def _lease(self, key):
+        """(giữ được quyền dựng?, bytes do worker khác dựng xong trong lúc chờ hoặc None)
+
+        Shared cache lỗi hoặc chờ quá lease_ttl (worker giữ lease đã chết) thì tự dựng không cần lease.
+        """
+        deadline = time.monotonic() + self.lease_ttl
+        delay = 0.005
+        while True:
+            acquired = self._shared_call('add', f'{key}:lease', b'1', self.lease_ttl)
+            if acquired or acquired is None:
+                return bool(acquired), None
+            time.sleep(delay)
+            delay = min(delay * 2, 0.1)
+            data = self._shared_call('get', key)
+            if data is not None:
+                return False, data
+            if time.monotonic() > deadline:
+                return False, None
+
+    def _shared_call(self, method, *args):
+        """Gọi backend; lỗi thì log và trả về None (request vẫn chạy, chỉ mất cache)"""
+        try:
+            return getattr(self.shared, method)(*args)
+        except self.shared.errors:
+            logger.warning('Shared cache lỗi khi %s, bỏ qua', method, exc_info=True)
+            return None
@@ -0,0 +1,457 @@
+"""
+Lưu giỏ hàng phía server, cookie session chỉ giữ cart_id
+
+Backend:
+    memory://                 LRU trong process (dev, 1 worker)
+    sqlite:///duong/dan.db    dùng chung giữa các worker trên cùng máy
+
+Mỗi giỏ giữ sẵn tổng số món, tạm tính và đơn giá từng dòng, cập nhật ngay trong
+mỗi lần thêm/bớt, nên badge và tổng tiền đọc ra không phải duyệt lại cả giỏ.
+Tạm tính gắn với dấu bảng giá (Catalog.price_stamp) lúc tính; bảng giá đổi thì
+summary() trả về None và tổng được tính lại một lần bằng reprice().
+"""
+
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_TTL = 7 * 24 * 3600
+# Kết quả request theo idempotency key được nhớ bấy lâu để client gửi lại an toàn
+REQUEST_TTL = 24 * 3600
+# Request đang chạy giữ key bấy lâu; worker chết giữa chừng thì key được nhả ra
+REQUEST_LEASE = 60
+
+
+class CartStore:
+    """Giao diện chung: giỏ hàng là dict {product_id (str): quantity (int)}"""
+
+    def __init__(self, ttl=DEFAULT_TTL):
+        self.ttl = ttl
+
+    def new_id(self):
+        return secrets.token_urlsafe(16)
+
+    def get(self, cart_id):
+        raise NotImplementedError
+
+    def count(self, cart_id):
+        """Tổng số món trong giỏ"""
+        raise NotImplementedError
+
+    def summary(self, cart_id, stamp):
+        """(số món, tạm tính) nếu tạm tính theo đúng bảng giá `stamp`, None nếu cần reprice()"""
+        raise NotImplementedError
+
+    def reprice(self, cart_id, price_of, stamp):
+        """Tính lại đơn giá mọi dòng bằng price_of(product_id) (None: sản phẩm không còn bán),
+        trả về (số món, tạm tính)"""
+        raise NotImplementedError
+
+    def incr(self, cart_id, product_id, amount=1, price=None, stamp=None):
+        """Tăng số lượng một cách nguyên tử, trả về số lượng mới
+
+        price/stamp: đơn giá và dấu bảng giá của nó, để cập nhật tạm tính luôn;
+        thiếu thì tạm tính bị đánh dấu cần tính lại.
+        """
+        raise NotImplementedError
+
+    def decr(self, cart_id, product_id, amount=1):
+        """Giảm số lượng, xóa dòng khi về 0, trả về số lượng mới"""
+        return self.incr(cart_id, product_id, -amount)
+
+    def set_many(self, cart_id, quantities, prices=None, stamp=None):
+        """Đặt số lượng nhiều sản phẩm trong một lần (<= 0 là xóa), trả về giỏ hàng mới
+
+        prices: product_id -> đơn giá theo bảng giá `stamp`, như incr().
+        """
+        raise NotImplementedError
+
+    def remove(self, cart_id, product_id):
+        raise NotImplementedError
+
+    def clear(self, cart_id):
+        raise NotImplementedError
+
+    def claim_request(self, cart_id, key, fingerprint):
+        """Giữ idempotency key cho một request thay đổi giỏ hàng
+
+        Trả về None nếu key mới (request được chạy), ngược lại (fingerprint, response)
+        đã lưu của lần trước; response là None khi lần trước vẫn đang chạy.
+        """
+        raise NotImplementedError
+
+    def finish_request(self, cart_id, key, response):
+        """Lưu response (chuỗi) cho key đã giữ"""
+        raise NotImplementedError
+
+    def forget_request(self, cart_id, key):
+        """Nhả key khi request lỗi, để client gửi lại được"""
+        raise NotImplementedError
+
+
+class _Cart:
+    """Một giỏ trong MemoryCartStore: số lượng, đơn giá từng dòng và các tổng"""
+
+    __slots__ = ('items', 'prices', 'count', 'subtotal', 'stamp')
+
+    def __init__(self):
+        self.items = {}
+        self.prices = {}
+        self.count = 0
+        self.subtotal = 0
+        self.stamp = None
+
+    def put(self, product_id, quantity, price=None, stamp=None):
+        if not self.items:
+            self.subtotal, self.stamp = 0, stamp
+        elif stamp is not None and stamp != self.stamp:
+            self.stamp = None
+        if quantity > 0 and price is None:
+            self.stamp = None
+        old = self.items.pop(product_id, 0)
+        self.count += max(quantity, 0) - old
+        self.subtotal -= old * (self.prices.pop(product_id, None) or 0)
+        if quantity > 0:
+            self.items[product_id] = quantity
+            self.prices[product_id] = price
+            self.subtotal += quantity * (price or 0)
+
+
+class MemoryCartStore(CartStore):
+    """Giỏ hàng trong bộ nhớ process, giới hạn số giỏ bằng LRU"""
+
+    def __init__(self, ttl=DEFAULT_TTL, max_carts=100000):
+        super().__init__(ttl)
+        self.max_carts = max_carts
+        self._lock = threading.Lock()
+        self._carts = OrderedDict()  # cart_id -> (expires_at, _Cart)
+        self._requests = OrderedDict()  # (cart_id, key) -> (expires_at, fingerprint, response)
+
+    def _cart(self, cart_id, create=False):
+        now = time.time()
+        entry = self._carts.get(cart_id)
+        if entry is not None and entry[0] < now:
+            del self._carts[cart_id]
+            entry = None
+        if entry is None:
+            if not create:
+                return None
+            entry = (now + self.ttl, _Cart())
+        self._carts[cart_id] = (now + self.ttl, entry[1])
+        self._carts.move_to_end(cart_id)
+        while len(self._carts) > self.max_carts:
+            self._carts.popitem(last=False)
+        return entry[1]
+
+    def get(self, cart_id):
+        with self._lock:
+            cart = self._cart(cart_id)
+            return dict(cart.items) if cart else {}
+
+    def count(self, cart_id):
+        with self._lock:
+            cart = self._cart(cart_id)
+            return cart.count if cart else 0
+
+    def summary(self, cart_id, stamp):
+        with self._lock:
+            cart = self._cart(cart_id)
+            if not cart or not cart.items:
+                return 0, 0
+            if cart.stamp is None or cart.stamp != stamp:
+                return None
+            return cart.count, cart.subtotal
+
+    def reprice(self, cart_id, price_of, stamp):
+        with self._lock:
+            cart = self._cart(cart_id)
+            if not cart:
+                return 0, 0
+            cart.prices = {product_id: price_of(product_id) for product_id in cart.items}
+            cart.count = sum(cart.items.values())
+            cart.subtotal = sum(quantity * (cart.prices[product_id] or 0)
+                                for product_id, quantity in cart.items.items())
+            cart.stamp = stamp
+            return cart.count, cart.subtotal
+
+    def incr(self, cart_id, product_id, amount=1, price=None, stamp=None):
+        product_id = str(product_id)
+        with self._lock:
+            cart = self._cart(cart_id, create=True)
+            quantity = max(cart.items.get(product_id, 0) + amount, 0)
+            cart.put(product_id, quantity, price, stamp)
+            return quantity
+
+    def set_many(self, cart_id, quantities, prices=None, stamp=None):
+        prices = prices or {}
+        with self._lock:
+            cart = self._cart(cart_id, create=True)
+            for product_id, quantity in quantities.items():
+                cart.put(str(product_id), quantity, prices.get(product_id), stamp)
+            return dict(cart.items)
+
+    def remove(self, cart_id, product_id):
+        with self._lock:
+            cart = self._cart(cart_id)
+            if cart:
+                cart.put(str(product_id), 0)
+
+    def clear(self, cart_id):
+        with self._lock:
+            self._carts.pop(cart_id, None)
+
+    def claim_request(self, cart_id, key, fingerprint):
+        now = time.time()
+        with self._lock:
+            entry = self._requests.get((cart_id, key))
+            if entry is not None and entry[0] >= now:
+                return entry[1], entry[2]
+            self._requests[(cart_id, key)] = (now + REQUEST_LEASE, fingerprint, None)
+            self._requests.move_to_end((cart_id, key))
+            while len(self._requests) > self.max_carts:
+                self._requests.popitem(last=False)
+            return None
+
+    def finish_request(self, cart_id, key, response):
+        with self._lock:
+            entry = self._requests.get((cart_id, key))
+            if entry is not None:
+                self._requests[(cart_id, key)] = (time.time() + REQUEST_TTL, entry[1], response)
+
+    def forget_request(self, cart_id, key):
+        with self._lock:
+            self._requests.pop((cart_id, key), None)
+
+
+class SQLiteCartStore(CartStore):
+    """Giỏ hàng trong file SQLite, an toàn giữa nhiều thread và worker"""
+
+    # Dọn giỏ hết hạn sau mỗi bấy nhiêu lần ghi
+    PURGE_EVERY = 500
+
+    def __init__(self, path, ttl=DEFAULT_TTL):
+        super().__init__(ttl)
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as db:
+            db.executescript('''
+                CREATE TABLE IF NOT EXISTS carts (
+                    cart_id TEXT PRIMARY KEY,
+                    expires_at REAL NOT NULL,
+                    item_count INTEGER NOT NULL DEFAULT 0,
+                    subtotal INTEGER NOT NULL DEFAULT 0,
+                    price_stamp TEXT
+                );
+                CREATE TABLE IF NOT EXISTS cart_items (
+                    cart_id TEXT NOT NULL,
+                    product_id TEXT NOT NULL,
+                    quantity INTEGER NOT NULL,
+                    unit_price INTEGER,
+                    PRIMARY KEY (cart_id, product_id)
+                );
+                CREATE INDEX IF NOT EXISTS ix_carts_expires_at ON carts (expires_at);
+                CREATE TABLE IF NOT EXISTS cart_requests (
+                    cart_id TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    fingerprint TEXT NOT NULL,
+                    response TEXT,
+                    expires_at REAL NOT NULL,
+                    PRIMARY KEY (cart_id, key)
+                );
+                CREATE INDEX IF NOT EXISTS ix_cart_requests_expires_at ON cart_requests (expires_at);
+            ''')
+            columns = {row[1] for row in db.execute('PRAGMA table_info(carts)')}
+            if 'item_count' not in columns:
+                # File tạo từ bản trước khi có tổng: thêm cột, đếm lại số món, tạm tính sẽ được reprice
+                db.executescript('''
+                    ALTER TABLE carts ADD COLUMN item_count INTEGER NOT NULL DEFAULT 0;
+                    ALTER TABLE carts ADD COLUMN subtotal INTEGER NOT NULL DEFAULT 0;
+                    ALTER TABLE carts ADD COLUMN price_stamp TEXT;
+                    ALTER TABLE cart_items ADD COLUMN unit_price INTEGER;
+                    UPDATE carts SET item_count = (SELECT COALESCE(SUM(quantity), 0) FROM cart_items
+                                                   WHERE cart_items.cart_id = carts.cart_id);
+                ''')
+
+    def _connect(self):
+        # Mỗi thread (và mỗi process sau khi fork) có connection riêng
+        db = getattr(self._local, 'db', None)
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self._local.db = db
+            self._local.pid = os.getpid()
+        return db
+
+    def _transaction(self, work):
+        db = self._connect()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            result = work(db)
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        return result
+
+    def _touch(self, db, cart_id):
+        # Giỏ đã hết hạn nhưng chưa bị dọn thì bắt đầu lại từ giỏ rỗng
+        row = db.execute('SELECT expires_at FROM carts WHERE cart_id = ?', (cart_id,)).fetchone()
+        if row is not None and row[0] < time.time():
+            db.execute('DELETE FROM cart_items WHERE cart_id = ?', (cart_id,))
+            db.execute('DELETE FROM carts WHERE cart_id = ?', (cart_id,))
+        db.execute(
+            'INSERT INTO carts (cart_id, expires_at) VALUES (?, ?) '
+            'ON CONFLICT (cart_id) DO UPDATE SET expires_at = excluded.expires_at',
+            (cart_id, time.time() + self.ttl),
+        )
+
+    def _maybe_purge(self, db):
+        self._writes += 1
+        if self._writes % self.PURGE_EVERY:
+            return
+        now = time.time()
+        db.execute('DELETE FROM cart_items WHERE cart_id IN '
+                   '(SELECT cart_id FROM carts WHERE expires_at < ?)', (now,))
+        db.execute('DELETE FROM carts WHERE expires_at < ?', (now,))
+        db.execute('DELETE FROM cart_requests WHERE expires_at < ?', (now,))
+
+    def get(self, cart_id):
+        db = self._connect()
+        row = db.execute('SELECT expires_at FROM carts WHERE cart_id = ?', (cart_id,)).fetchone()
+        if row is None or row[0] < time.time():
+            return {}
+        rows = db.execute('SELECT product_id, quantity FROM cart_items '
+                          'WHERE cart_id = ? ORDER BY rowid', (cart_id,))
+        return {product_id: quantity for product_id, quantity in rows}
+
+    def _put(self, db, cart_id, product_id, quantity, price=None, stamp=None):
+        """Đặt số lượng một dòng và cập nhật số món/tạm tính của giỏ theo chênh lệch"""
+        count, current = db.execute('SELECT item_count, price_stamp FROM carts WHERE cart_id = ?',
+                                    (cart_id,)).fetchone()
+        if count == 0:
+            db.execute('UPDATE carts SET subtotal = 0 WHERE cart_id = ?', (cart_id,))
+            current = stamp
+        elif (stamp is not None and stamp != current) or (quantity > 0 and price is None):
+            current = None
+        row = db.execute('SELECT quantity, unit_price FROM cart_items WHERE cart_id = ? AND product_id = ?',
+                         (cart_id, product_id)).fetchone()
+        old, old_price = row if row else (0, None)
+        quantity = max(quantity, 0)
+        if quantity <= 0:
+            db.execute('DELETE FROM cart_items WHERE cart_id = ? AND product_id = ?', (cart_id, product_id))
+        elif row:
+            db.execute('UPDATE cart_items SET quantity = ?, unit_price = ? WHERE cart_id = ? AND product_id = ?',
+                       (quantity, price, cart_id, product_id))
+        else:
+            db.execute('INSERT INTO cart_items (cart_id, product_id, quantity, unit_price) VALUES (?, ?, ?, ?)',
+                       (cart_id, product_id, quantity, price))
+        db.execute('UPDATE carts SET item_count = item_count + ?, subtotal = subtotal + ?, price_stamp = ? '
+                   'WHERE cart_id = ?',
+                   (quantity - old, quantity * (price or 0) - old * (old_price or 0), current, cart_id))
+        return quantity
+
+    def count(self, cart_id):
+        row = self._connect().execute('SELECT item_count FROM carts WHERE cart_id = ? AND expires_at >= ?',
+                                      (cart_id, time.time())).fetchone()
+        return row[0] if row else 0
+
+    def summary(self, cart_id, stamp):
+        row = self._connect().execute(
+            'SELECT item_count, subtotal, price_stamp FROM carts WHERE cart_id = ? AND expires_at >= ?',
+            (cart_id, time.time())).fetchone()
+        if row is None or row[0] == 0:
+            return 0, 0
+        if row[2] is None or row[2] != stamp:
+            return None
+        return row[0], row[1]
+
+    def reprice(self, cart_id, price_of, stamp):
+        def work(db):
+            row = db.execute('SELECT expires_at FROM carts WHERE cart_id = ?', (cart_id,)).fetchone()
+            if row is None or row[0] < time.time():
+                return 0, 0
+            lines = [(product_id, quantity, price_of(product_id)) for product_id, quantity in db.execute(
+                'SELECT product_id, quantity FROM cart_items WHERE cart_id = ?', (cart_id,))]
+            db.executemany('UPDATE cart_items SET unit_price = ? WHERE cart_id = ? AND product_id = ?',
+                           [(price, cart_id, product_id) for product_id, _, price in lines])
+            count = sum(quantity for _, quantity, _ in lines)
+            subtotal = sum(quantity * (price or 0) for _, quantity, price in lines)
+            db.execute('UPDATE carts SET item_count = ?, subtotal = ?, price_stamp = ? WHERE cart_id = ?',
+                       (count, subtotal, stamp, cart_id))
+            return count, subtotal
+        return self._transaction(work)
+
+    def incr(self, cart_id, product_id, amount=1, price=None, stamp=None):
+        product_id = str(product_id)
+
+        def work(db):
+            self._touch(db, cart_id)
+            row = db.execute('SELECT quantity FROM cart_items WHERE cart_id = ? AND product_id = ?',
+                             (cart_id, product_id)).fetchone()
+            quantity = self._put(db, cart_id, product_id, (row[0] if row else 0) + amount, price, stamp)
+            self._maybe_purge(db)
+            return quantity
+        return self._transaction(work)
+
+    def set_many(self, cart_id, quantities, prices=None, stamp=None):
+        prices = prices or {}
+
+        def work(db):
+            self._touch(db, cart_id)
+            for product_id, quantity in quantities.items():
+                self._put(db, cart_id, str(product_id), quantity, prices.get(product_id), stamp)
+            self._maybe_purge(db)
+            return dict(db.execute('SELECT product_id, quantity FROM cart_items '
+                                   'WHERE cart_id = ? ORDER BY rowid', (cart_id,)).fetchall())
+        return self._transaction(work)
+
+    def remove(self, cart_id, product_id):
+        def work(db):
+            if db.execute('SELECT 1 FROM carts WHERE cart_id = ?', (cart_id,)).fetchone():
+                self._put(db, cart_id, str(product_id), 0)
+        self._transaction(work)
+
+    def clear(self, cart_id):
+        def work(db):
+            db.execute('DELETE FROM cart_items WHERE cart_id = ?', (cart_id,))
+            db.execute('DELETE FROM carts WHERE cart_id = ?', (cart_id,))
+        self._transaction(work)
+
+    def claim_request(self, cart_id, key, fingerprint):
+        def work(db):
+            now = time.time()
+            db.execute('DELETE FROM cart_requests WHERE cart_id = ? AND key = ? AND expires_at < ?',
+                       (cart_id, key, now))
+            claimed = db.execute(
+                'INSERT OR IGNORE INTO cart_requests (cart_id, key, fingerprint, expires_at) VALUES (?, ?, ?, ?)',
+                (cart_id, key, fingerprint, now + REQUEST_LEASE),
+            ).rowcount == 1
+            if claimed:
+                return None
+            return db.execute('SELECT fingerprint, response FROM cart_requests WHERE cart_id = ? AND key = ?',
+                              (cart_id, key)).fetchone()
+        return self._transaction(work)
+
+    def finish_request(self, cart_id, key, response):
+        self._connect().execute('UPDATE cart_requests SET response = ?, expires_at = ? WHERE cart_id = ? AND key = ?',
+                                (response, time.time() + REQUEST_TTL, cart_id, key))
+
+    def forget_request(self, cart_id, key):
+        self._connect().execute('DELETE FROM cart_requests WHERE cart_id = ? AND key = ?', (cart_id, key))
+
+
+def create_cart_store(url, ttl=DEFAULT_TTL):
+    """Tạo backend từ URL: memory:// hoặc sqlite:///path"""
+    if url.startswith('memory://'):
+        return MemoryCartStore(ttl=ttl)
+    if url.startswith('sqlite:///'):
+        return SQLiteCartStore(url[len('sqlite:///'):], ttl=ttl)
+    raise ValueError(f'Không hỗ trợ cart store: {url}')
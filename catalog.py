@@ -0,0 +1,228 @@
+"""
+Catalog sản phẩm với các index tra cứu nhanh
+"""
+
+import bisect
+import hashlib
+import itertools
+import marshal
+import threading
+
+from search import SearchIndex
+
+# Version dùng chung cho mọi Catalog để hai catalog khác nhau không trùng version
+_versions = itertools.count(1)
+
+# Khóa sắp xếp cho các thứ tự tính sẵn
+SORT_KEYS = {
+    'price': lambda product: product['price'],
+    'name': lambda product: product['name'].casefold(),
+}
+
+
+class Catalog:
+    """Danh sách sản phẩm kèm index theo id, giá và danh mục
+
+    Mọi thay đổi (add/remove) đều cập nhật index và đổi `version`
+    để các cache phụ thuộc catalog biết cần render lại.
+
+    Pickle được (snapshot): giữ nguyên mọi index đã dựng, nạp lại nhận `version` mới.
+    """
+
+    def __init__(self, products=()):
+        self._lock = threading.RLock()
+        self._by_id = {}
+        self._by_price = []      # [(price, id)] luôn được sắp xếp
+        self._by_category = {}   # category -> {id: product}
+        self._orderings = {}     # field -> (version, ((key, id), ...))
+        self._stamps = {}        # tên -> (version, dấu)
+        self.search_index = SearchIndex()
+        # Dựng index một lượt rồi sắp xếp một lần, thay vì chèn có thứ tự từng sản phẩm
+        for product in products:
+            self._discard(product['id'])
+            self._by_id[product['id']] = product
+            self._by_category.setdefault(product.get('category'), {})[product['id']] = product
+        self._by_price = sorted((product['price'], product_id) for product_id, product in self._by_id.items())
+        self.search_index.add_many(self._by_id.values())
+        self.version = next(_versions)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+        # Version chỉ có nghĩa trong process đã tạo ra nó; cache tính theo version cũ vẫn đúng với dữ liệu này
+        old, self.version = self.version, next(_versions)
+        self._orderings = {field: (self.version, entries)
+                           for field, (version, entries) in self._orderings.items() if version == old}
+        self._stamps = {name: (self.version, stamp)
+                        for name, (version, stamp) in self._stamps.items() if version == old}
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def __iter__(self):
+        return iter(list(self._by_id.values()))
+
+    def __contains__(self, product_id):
+        return self.get(product_id) is not None
+
+    def get(self, product_id):
+        """Tra sản phẩm theo id (int hoặc chuỗi), trả về None nếu không có"""
+        try:
+            return self._by_id.get(int(product_id))
+        except (TypeError, ValueError):
+            return None
+
+    def by_category(self, category):
+        return list(self._by_category.get(category, {}).values())
+
+    def categories(self):
+        return list(self._by_category)
+
+    def price_range(self, min_price=None, max_price=None):
+        """Sản phẩm có giá trong [min_price, max_price], sắp xếp theo giá"""
+        entries = self._by_price
+        start = 0 if min_price is None else bisect.bisect_left(entries, (min_price, -1))
+        if max_price is None:
+            end = len(entries)
+        else:
+            end = bisect.bisect_right(entries, (max_price, float('inf')))
+        return [self._by_id[product_id] for _, product_id in entries[start:end]]
+
+    def search(self, query, limit=20):
+        """Sản phẩm khớp query (không dấu, khớp tiền tố từ cuối), xếp theo độ liên quan"""
+        found = (self._by_id.get(product_id) for product_id in self.search_index.search(query, limit))
+        return [product for product in found if product is not None]
+
+    def ordering(self, field):
+        """Các cặp (key, id) sắp xếp tăng dần theo field, chỉ tính lại khi version đổi"""
+        version = self.version
+        cached = self._orderings.get(field)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        with self._lock:
+            version = self.version
+            if field == 'price':
+                entries = tuple(self._by_price)
+            else:
+                key = SORT_KEYS[field]
+                entries = tuple(sorted((key(product), product_id)
+                                       for product_id, product in self._by_id.items()))
+            self._orderings[field] = (version, entries)
+            return entries
+
+    @property
+    def price_stamp(self):
+        """Dấu của bảng giá (id, giá), tính lại khi version đổi
+
+        Khác `version` (đếm riêng trong từng process), hai worker có cùng bảng giá
+        cho cùng một dấu, nên dùng được cho dữ liệu lưu chung như tổng tiền giỏ hàng.
+        """
+        return self._stamp('price', lambda: self._by_price)
+
+    @property
+    def stamp(self):
+        """Dấu của toàn bộ dữ liệu catalog, như price_stamp nhưng đổi cả khi tên/mô tả/ảnh đổi
+
+        Dùng làm version cho cache dùng chung giữa các worker (trang render sẵn, kết quả tìm kiếm).
+        """
+        return self._stamp('content', lambda: list(self._by_id.values()))
+
+    def _stamp(self, name, data):
+        cached = self._stamps.get(name)
+        if cached is not None and cached[0] == self.version:
+            return cached[1]
+        with self._lock:
+            version = self.version
+            # marshal bản 2 không ghi tham chiếu giữa các object: cùng dữ liệu luôn cho cùng bytes
+            stamp = hashlib.blake2b(marshal.dumps(data(), 2), digest_size=8).hexdigest()
+            self._stamps[name] = (version, stamp)
+            return stamp
+
+    def prepare(self):
+        """Tính sẵn mọi thứ tự sắp xếp và các dấu, để request đầu tiên không phải tính"""
+        for field in SORT_KEYS:
+            self.ordering(field)
+        return self.price_stamp, self.stamp
+
+    def page(self, sort='price', descending=False, min_price=None, max_price=None,
+             after=None, limit=20):
+        """Một trang sản phẩm theo thứ tự `sort`, lọc theo khoảng giá
+
+        `after` là khóa (key, id) của sản phẩm cuối trang trước. Trả về
+        (danh sách sản phẩm, khóa cho trang sau hoặc None).
+        """
+        entries = self.ordering(sort)
+        low, high = 0, len(entries)
+        if sort == 'price':
+            # Thứ tự theo giá: thu hẹp khoảng bằng bisect thay vì lọc từng dòng
+            if min_price is not None:
+                low = bisect.bisect_left(entries, (min_price, -1))
+            if max_price is not None:
+                high = bisect.bisect_right(entries, (max_price, float('inf')))
+        if descending:
+            if after is not None:
+                high = min(high, bisect.bisect_left(entries, tuple(after)))
+            positions = range(high - 1, low - 1, -1)
+        else:
+            if after is not None:
+                low = max(low, bisect.bisect_right(entries, tuple(after)))
+            positions = range(low, high)
+
+        items = []
+        last = None
+        for position in positions:
+            key, product_id = entries[position]
+            product = self._by_id.get(product_id)
+            if product is None:
+                continue
+            if min_price is not None and product['price'] < min_price:
+                continue
+            if max_price is not None and product['price'] > max_price:
+                continue
+            if len(items) == limit:
+                return items, last
+            items.append(product)
+            last = (key, product_id)
+        return items, None
+
+    def add(self, product):
+        """Thêm hoặc thay thế sản phẩm (theo id)"""
+        with self._lock:
+            self._discard(product['id'])
+            self._insert(product)
+            self.version = next(_versions)
+
+    def remove(self, product_id):
+        with self._lock:
+            product = self._discard(int(product_id))
+            if product is not None:
+                self.version = next(_versions)
+            return product
+
+    def _insert(self, product):
+        product_id = product['id']
+        self._by_id[product_id] = product
+        bisect.insort(self._by_price, (product['price'], product_id))
+        self._by_category.setdefault(product.get('category'), {})[product_id] = product
+        self.search_index.add(product)
+
+    def _discard(self, product_id):
+        product = self._by_id.pop(product_id, None)
+        if product is None:
+            return None
+        entry = (product['price'], product_id)
+        index = bisect.bisect_left(self._by_price, entry)
+        if index < len(self._by_price) and self._by_price[index] == entry:
+            del self._by_price[index]
+        category = self._by_category.get(product.get('category'))
+        if category is not None:
+            category.pop(product_id, None)
+            if not category:
+                del self._by_category[product.get('category')]
+        self.search_index.remove(product_id)
+        return product
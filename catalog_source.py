@@ -0,0 +1,310 @@
+"""
+Nạp catalog mặc định từ file và tự nạp lại khi file đổi
+
+Định dạng theo đuôi file:
+    .json   danh sách sản phẩm, hoặc {"products": [...]}
+    .csv    cột id,name,price,image,description,category[,stock_quantity]
+    .bin    bản xuất nhị phân gọn (write_binary), đọc qua mmap cho catalog lớn
+
+Một thread nền mỗi process kiểm tra mtime/kích thước file; khi đổi thì đọc file
+và dựng Catalog mới cùng mọi index ngay trong thread đó, rồi thay tham chiếu
+`catalog` bằng một phép gán. Request đang chạy vẫn dùng catalog cũ đã lấy ra
+(không bị sửa), request sau thấy catalog mới với `version` mới nên các cache
+theo version tự render lại. File lỗi thì giữ catalog cũ.
+
+Nên ghi file mới ra file tạm rồi rename đè lên để không bị đọc dở.
+
+Snapshot: Catalog đã dựng xong mọi index được pickle ra `snapshot_path`, kèm
+dấu của nguồn (đường dẫn, mtime, kích thước file hoặc băm catalog trong code).
+Process khởi động sau chỉ cần nạp snapshot (qua mmap) thay vì đọc file và dựng
+lại index; nguồn đổi thì dựng lại và ghi snapshot mới. Snapshot là pickle nên
+chỉ đặt ở chỗ chỉ app ghi được (mặc định instance/).
+"""
+
+import csv
+import hashlib
+import json
+import logging
+import mmap
+import os
+import pickle
+import struct
+import threading
+import time
+
+from catalog import Catalog
+
+logger = logging.getLogger(__name__)
+
+# Bản xuất nhị phân: header, bảng bản ghi số cố định, rồi các chuỗi UTF-8 nối bằng \0
+# (4 chuỗi mỗi sản phẩm, theo BINARY_STRINGS) để giải mã cả vùng một lần
+BINARY_MAGIC = b'CTLG'
+BINARY_HEADER = struct.Struct('<4sHI')  # magic, phiên bản định dạng, số sản phẩm
+BINARY_RECORD = struct.Struct('<qqq')   # id, price, stock_quantity (-1: không theo dõi)
+BINARY_STRINGS = ('name', 'description', 'image', 'category')
+BINARY_VERSION = 1
+
+# Snapshot: header, dấu nguồn (JSON), rồi pickle của Catalog
+SNAPSHOT_MAGIC = b'CTLGSNAP'
+SNAPSHOT_HEADER = struct.Struct('<8sHI')  # magic, phiên bản định dạng, độ dài dấu nguồn
+SNAPSHOT_VERSION = 2
+
+CSV_FIELDS = ('id', 'name', 'price', 'image', 'description', 'category', 'stock_quantity')
+
+
+def normalize(record):
+    """Sản phẩm cùng dạng với catalog trong code: id/price là int, stock_quantity int hoặc None"""
+    stock = record.get('stock_quantity')
+    return {
+        'id': int(record['id']),
+        'name': str(record['name']),
+        'price': int(record['price']),
+        'image': record.get('image') or '',
+        'description': record.get('description') or '',
+        'category': record.get('category') or None,
+        'stock_quantity': int(stock) if stock not in (None, '') else None,
+    }
+
+
+def read_json(path):
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        data = data['products']
+    return [normalize(record) for record in data]
+
+
+def read_csv(path):
+    with open(path, encoding='utf-8', newline='') as f:
+        return [normalize(record) for record in csv.DictReader(f)]
+
+
+def read_binary(path):
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        magic, version, count = BINARY_HEADER.unpack_from(data, 0)
+        if magic != BINARY_MAGIC or version != BINARY_VERSION:
+            raise ValueError(f'{path}: không phải bản xuất catalog v{BINARY_VERSION}')
+        end = BINARY_HEADER.size + count * BINARY_RECORD.size
+        with memoryview(data) as view:
+            records = list(BINARY_RECORD.iter_unpack(view[BINARY_HEADER.size:end]))
+        strings = data[end:].decode('utf-8').split('\0') if count else []
+    if len(strings) != count * len(BINARY_STRINGS):
+        raise ValueError(f'{path}: bản xuất catalog bị cắt cụt')
+    return [
+        {'id': product_id, 'name': name, 'price': price, 'image': image, 'description': description,
+         'category': category or None, 'stock_quantity': stock if stock >= 0 else None}
+        for (product_id, price, stock), name, description, image, category
+        in zip(records, strings[0::4], strings[1::4], strings[2::4], strings[3::4])
+    ]
+
+
+def write_binary(path, products):
+    strings = [product.get(name) or '' for product in products for name in BINARY_STRINGS]
+    if any('\0' in value for value in strings):
+        raise ValueError('Chuỗi trong catalog không được chứa ký tự \\0')
+    with open(path, 'wb') as f:
+        f.write(BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, len(products)))
+        for product in products:
+            stock = product.get('stock_quantity')
+            f.write(BINARY_RECORD.pack(product['id'], product['price'], -1 if stock is None else stock))
+        f.write('\0'.join(strings).encode('utf-8'))
+
+
+def write_csv(path, products):
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, CSV_FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(products)
+
+
+def write_json(path, products):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(products, f, ensure_ascii=False, indent=2)
+
+
+READERS = {'.json': read_json, '.csv': read_csv, '.bin': read_binary}
+WRITERS = {'.json': write_json, '.csv': write_csv, '.bin': write_binary}
+
+
+def load_products(path):
+    reader = READERS.get(os.path.splitext(path)[1].lower())
+    if reader is None:
+        raise ValueError(f'Không hỗ trợ định dạng catalog: {path}')
+    return reader(path)
+
+
+def export_products(path, products):
+    """Ghi products ra path (định dạng theo đuôi file), qua file tạm rồi rename"""
+    writer = WRITERS.get(os.path.splitext(path)[1].lower())
+    if writer is None:
+        raise ValueError(f'Không hỗ trợ định dạng catalog: {path}')
+    temporary = f'{path}.tmp{os.getpid()}'
+    writer(temporary, [normalize(product) for product in products])
+    os.replace(temporary, path)
+
+
+def read_snapshot_source(path):
+    """Dấu nguồn ghi trong snapshot (chỉ đọc header), None nếu không có/không đọc được"""
+    try:
+        with open(path, 'rb') as f:
+            magic, version, size = SNAPSHOT_HEADER.unpack(f.read(SNAPSHOT_HEADER.size))
+            if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+                return None
+            return json.loads(f.read(size))
+    except (OSError, ValueError, struct.error):
+        return None
+
+
+def read_snapshot(path, source):
+    """Catalog trong snapshot nếu snapshot được dựng từ đúng `source`, ngược lại None"""
+    if read_snapshot_source(path) != source:
+        return None
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        size = SNAPSHOT_HEADER.unpack_from(data, 0)[2]
+        # Unpickle thẳng từ vùng nhớ của file, không đọc cả file ra bytes trước
+        with memoryview(data) as view:
+            return pickle.loads(view[SNAPSHOT_HEADER.size + size:])
+
+
+def write_snapshot(path, catalog, source):
+    """Ghi snapshot qua file tạm rồi rename, process khác không bao giờ thấy file ghi dở"""
+    key = json.dumps(source).encode('utf-8')
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temporary = f'{path}.tmp{os.getpid()}'
+    with open(temporary, 'wb') as f:
+        f.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(key)))
+        f.write(key)
+        pickle.dump(catalog, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temporary, path)
+
+
+class CatalogSource:
+    """Catalog hiện hành, nạp từ `path` (hoặc `fallback` nếu không có path) và theo dõi thay đổi
+
+    Catalog được nạp lần đầu khi cần (load() hoặc truy cập `catalog`), từ snapshot
+    nếu có `snapshot_path` và snapshot còn khớp với nguồn. `on_change(cũ, mới)` được
+    gọi sau mỗi lần nạp lại làm đổi dữ liệu.
+    """
+
+    def __init__(self, path=None, fallback=(), poll_interval=2.0, snapshot_path=None, on_change=None):
+        self.path = path
+        self.fallback = list(fallback)
+        self.poll_interval = poll_interval
+        self.snapshot_path = snapshot_path
+        self.on_change = on_change
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._watcher_pid = None
+        self._seen = None
+        self._catalog = None
+
+    @property
+    def catalog(self):
+        catalog = self._catalog
+        return catalog if catalog is not None else self.load()
+
+    @catalog.setter
+    def catalog(self, catalog):
+        self._catalog = catalog
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _source(self, stat):
+        """Dấu của nguồn catalog, ghi kèm snapshot để biết snapshot còn dùng được không"""
+        if not self.path:
+            data = json.dumps(self.fallback, sort_keys=True, ensure_ascii=False).encode('utf-8')
+            return ['fallback', hashlib.blake2b(data, digest_size=16).hexdigest()]
+        return [os.path.abspath(self.path), *stat] if stat else None
+
+    def load(self):
+        """Nạp catalog nếu chưa có; các thread gọi cùng lúc chờ chung một lần nạp"""
+        with self._load_lock:
+            if self._catalog is not None:
+                return self._catalog
+            stat = self._stat() if self.path else None
+            source = self._source(stat)
+            catalog = self._read_snapshot(source)
+            if catalog is None:
+                catalog = Catalog(load_products(self.path) if self.path else self.fallback)
+                catalog.prepare()
+                self._write_snapshot(catalog, source)
+            self._seen = stat
+            self._catalog = catalog
+            return catalog
+
+    def _read_snapshot(self, source):
+        if not self.snapshot_path or source is None:
+            return None
+        try:
+            catalog = read_snapshot(self.snapshot_path, source)
+        except Exception:
+            # Snapshot chỉ là cache: hỏng hoặc khác phiên bản code thì dựng lại từ nguồn
+            logger.warning('Không đọc được snapshot %s, dựng lại catalog', self.snapshot_path, exc_info=True)
+            return None
+        if catalog is not None:
+            logger.info('Nạp catalog từ snapshot %s: %d sản phẩm', self.snapshot_path, len(catalog))
+        return catalog
+
+    def _write_snapshot(self, catalog, source):
+        if not self.snapshot_path or source is None or read_snapshot_source(self.snapshot_path) == source:
+            return
+        try:
+            write_snapshot(self.snapshot_path, catalog, source)
+        except OSError:
+            logger.exception('Không ghi được snapshot catalog %s', self.snapshot_path)
+
+    def reload(self):
+        """Đọc lại file và thay catalog nếu dữ liệu đổi; True nếu đã thay"""
+        source = self._source(self._stat())
+        products = load_products(self.path)
+        current = self.catalog
+        if list(current) == products:
+            # Dữ liệu không đổi: giữ catalog cũ để cache theo version không bị bỏ
+            self._write_snapshot(current, source)
+            return False
+        catalog = Catalog(products)
+        catalog.prepare()
+        self.catalog = catalog
+        logger.info('Đã nạp lại catalog %s: %d sản phẩm, version %s', self.path, len(catalog), catalog.version)
+        self._write_snapshot(catalog, source)
+        if self.on_change is not None:
+            try:
+                self.on_change(current, catalog)
+            except Exception:
+                logger.exception('Lỗi khi xử lý catalog đổi %s', self.path)
+        return True
+
+    def check(self):
+        """Nạp lại nếu file đổi kể từ lần đọc trước"""
+        stat = self._stat()
+        if stat is None or stat == self._seen or self._catalog is None:
+            return False
+        # Ghi nhận cả khi lỗi: chỉ thử lại khi file đổi tiếp, không log lỗi mỗi vòng
+        self._seen = stat
+        try:
+            return self.reload()
+        except (OSError, ValueError, KeyError, TypeError, struct.error):
+            logger.exception('Không nạp được catalog %s, giữ bản cũ', self.path)
+            return False
+
+    def _watch(self):
+        while True:
+            time.sleep(self.poll_interval)
+            self.check()
+
+    def start(self):
+        """Khởi động thread theo dõi file, một lần cho mỗi process (kể cả worker gunicorn)"""
+        if not self.path or self.poll_interval <= 0 or self._watcher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._watcher_pid == os.getpid():
+                return
+            self._watcher_pid = os.getpid()
+        threading.Thread(target=self._watch, name='catalog-watcher', daemon=True).start()
@@ -0,0 +1,361 @@
+"""
+Middleware WSGI nén response (br / zstd / gzip) theo Accept-Encoding
+
+Response có độ dài biết trước được nén một lần cả body; response stream
+được nén từng chunk (flush sau mỗi chunk để không làm chậm byte đầu tiên).
+View có thể đánh dấu response dùng chung (không phụ thuộc session) bằng
+`request.environ[CACHEABLE] = True`: bản nén khi đó (kể cả của response stream,
+khi stream xong) được giữ lại theo ETag và dùng lại cho các request sau thay vì nén lại.
+
+Bản nén được cache lúc đầu nén ở mức thường như mọi response; chỉ khi được
+dùng lại nó mới được một thread nền nén lại ở mức cao nhất (br 11 nén trang
+1MB mất vài giây), request không bao giờ phải chờ bước này.
+"""
+
+import logging
+import os
+import queue
+import re
+import threading
+import zlib
+from collections import OrderedDict
+
+from werkzeug.http import parse_accept_header
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+CACHEABLE = 'shop.compress.cacheable'
+
+logger = logging.getLogger(__name__)
+
+COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/javascript', 'application/xml',
+                      'image/svg+xml')
+
+# Mức nén cho response nén theo từng request, và cho bản nén được cache nén lại ở thread nền
+DEFAULT_LEVELS = {'br': 4, 'zstd': 3, 'gzip': 6}
+CACHED_LEVELS = {'br': 11, 'zstd': 19, 'gzip': 9}
+
+ETAG_SUFFIX_RE = re.compile(r'-(?:br|zstd|gzip)"')
+
+
+class GzipStream:
+    def __init__(self, level):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+class BrotliStream:
+    def __init__(self, level):
+        self._compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data):
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+class ZstdStream:
+    def __init__(self, level):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data):
+        return (self._compressor.compress(data)
+                + self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK))
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+def available_encodings():
+    """Các encoding hỗ trợ, theo thứ tự ưu tiên của server"""
+    encodings = []
+    if brotli is not None:
+        encodings.append('br')
+    if zstandard is not None:
+        encodings.append('zstd')
+    encodings.append('gzip')
+    return encodings
+
+
+def compress(data, encoding, level):
+    if encoding == 'br':
+        return brotli.compress(data, quality=level)
+    if encoding == 'zstd':
+        return zstandard.ZstdCompressor(level=level).compress(data)
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    return compressor.compress(data) + compressor.flush()
+
+
+def decompress(data, encoding):
+    if encoding == 'br':
+        return brotli.decompress(data)
+    if encoding == 'zstd':
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    return zlib.decompress(data, 31)
+
+
+def stream_compressor(encoding, level):
+    return {'br': BrotliStream, 'zstd': ZstdStream, 'gzip': GzipStream}[encoding](level)
+
+
+class CompressedCache:
+    """LRU giới hạn theo tổng số byte: (etag, encoding) -> (body đã nén, đã nén ở mức cao nhất chưa)"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._size = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, data, final=False):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            self._store(key, data, final)
+
+    def replace(self, key, data):
+        """Thay bằng bản nén kỹ; key đã bị bỏ khỏi LRU thì thôi (không giữ lại trang không ai dùng)"""
+        with self._lock:
+            if key in self._entries and len(data) <= self.max_bytes:
+                self._store(key, data, True)
+
+    def _store(self, key, data, final):
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._size -= len(old[0])
+        self._entries[key] = (data, final)
+        self._size += len(data)
+        while self._size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted[0])
+
+
+class Recompressor:
+    """Thread nền nén lại ở CACHED_LEVELS các bản nén trong cache được dùng lại
+
+    Hàng đợi có giới hạn: khi đầy thì bỏ qua, lần dùng lại sau sẽ gửi lại. Thread
+    được tạo lúc cần lần đầu trong từng process (không chạy trong master gunicorn).
+    """
+
+    def __init__(self, cache, max_pending=16):
+        self.cache = cache
+        self._queue = queue.Queue(max_pending)
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._pid = None
+
+    def submit(self, key, body):
+        with self._lock:
+            if key in self._pending:
+                return
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                threading.Thread(target=self.work, name='recompress', daemon=True).start()
+            try:
+                self._queue.put_nowait((key, body))
+            except queue.Full:
+                return
+            self._pending.add(key)
+
+    def run_one(self, key, body):
+        encoding = key[1]
+        try:
+            self.cache.replace(key, compress(decompress(body, encoding), encoding, CACHED_LEVELS[encoding]))
+        finally:
+            with self._lock:
+                self._pending.discard(key)
+
+    def work(self):
+        while True:
+            key, body = self._queue.get()
+            try:
+                self.run_one(key, body)
+            except Exception:
+                logger.exception('Lỗi khi nén lại %s', key)
+
+
+class CompressionMiddleware:
+    def __init__(self, app, min_size=1024, levels=None, cache_bytes=32 * 1024 * 1024):
+        self.app = app
+        self.min_size = min_size
+        self.levels = {**DEFAULT_LEVELS, **(levels or {})}
+        self.encodings = available_encodings()
+        self.cache = CompressedCache(cache_bytes)
+        self.recompressor = Recompressor(self.cache)
+
+    def __call__(self, environ, start_response):
+        encoding = None
+        if environ.get('REQUEST_METHOD') != 'HEAD':
+            accept = parse_accept_header(environ.get('HTTP_ACCEPT_ENCODING', ''))
+            encoding = accept.best_match(self.encodings)
+        # ETag gửi lên mang hậu tố encoding; app chỉ biết ETag gốc
+        if_none_match = environ.get('HTTP_IF_NONE_MATCH', '')
+        for header in ('HTTP_IF_NONE_MATCH', 'HTTP_IF_MATCH'):
+            if header in environ:
+                environ[header] = ETAG_SUFFIX_RE.sub('"', environ[header])
+
+        captured = []
+
+        def capture(status, headers, exc_info=None):
+            captured[:] = [status, headers]
+            return write_unsupported
+
+        app_iter = self.app(environ, capture)
+        if not captured:
+            # App chỉ gọi start_response khi bắt đầu lặp body
+            rest = iter(app_iter)
+            app_iter = prepend(next(rest, b''), rest, app_iter)
+        status, headers = captured
+
+        if status.startswith('304') and encoding and f'-{encoding}"' in if_none_match:
+            # 304 cho bản nén mà client đang giữ: trả lại đúng ETag client đã gửi
+            start_response(status, add_vary(with_encoding(headers, encoding)[:-1]))
+            return app_iter
+        if not self._should_compress(status, headers):
+            if self._is_compressible_type(headers):
+                headers = add_vary(headers)
+            start_response(status, headers)
+            return app_iter
+
+        headers = add_vary(headers)
+        if encoding is None:
+            start_response(status, headers)
+            return app_iter
+
+        etag = get_header(headers, 'ETag')
+        key = (etag, encoding) if etag and not etag.startswith('W/') and environ.get(CACHEABLE) else None
+        entry = self.cache.get(key) if key else None
+        if entry is not None:
+            close(app_iter)
+            return self._send_cached(start_response, status, headers, key, entry, encoding)
+        length = get_header(headers, 'Content-Length')
+        if length is not None:
+            return self._compress_buffered(start_response, status, headers, app_iter, encoding, key)
+        headers = [(key, value) for key, value in headers if key.lower() != 'content-length']
+        headers = with_encoding(headers, encoding)
+        start_response(status, headers)
+        return self._compress_stream(app_iter, encoding, key)
+
+    def _send_cached(self, start_response, status, headers, key, entry, encoding):
+        body, final = entry
+        if not final:
+            # Được dùng lại: đáng nén kỹ, nhưng ở thread nền
+            self.recompressor.submit(key, body)
+        headers = [(name, value) for name, value in headers if name.lower() != 'content-length']
+        headers = with_encoding(headers, encoding) + [('Content-Length', str(len(body)))]
+        start_response(status, headers)
+        return [body]
+
+    def _compress_buffered(self, start_response, status, headers, app_iter, encoding, key):
+        try:
+            data = b''.join(app_iter)
+        finally:
+            close(app_iter)
+        body = compress(data, encoding, self.levels[encoding])
+        if key:
+            self.cache.put(key, body, final=self.levels[encoding] >= CACHED_LEVELS[encoding])
+        headers = [(name, value) for name, value in headers if name.lower() != 'content-length']
+        headers = with_encoding(headers, encoding) + [('Content-Length', str(len(body)))]
+        start_response(status, headers)
+        return [body]
+
+    def _compress_stream(self, app_iter, encoding, key=None):
+        """Nén từng chunk; có `key` thì giữ lại bản nén khi stream xong để request sau dùng lại"""
+        compressor = stream_compressor(encoding, self.levels[encoding])
+        body = [] if key else None
+        try:
+            for chunk in app_iter:
+                if chunk:
+                    chunk = compressor.compress(chunk)
+                    if body is not None:
+                        body.append(chunk)
+                    yield chunk
+            chunk = compressor.finish()
+            if body is not None:
+                body.append(chunk)
+                self.cache.put(key, b''.join(body))
+            yield chunk
+        finally:
+            close(app_iter)
+
+    def _is_compressible_type(self, headers):
+        content_type = get_header(headers, 'Content-Type') or ''
+        return content_type.startswith(COMPRESSIBLE_TYPES)
+
+    def _should_compress(self, status, headers):
+        if int(status.split(' ', 1)[0]) in (204, 206, 304) or int(status[0]) == 1:
+            return False
+        if get_header(headers, 'Content-Encoding') is not None:
+            return False
+        if 'no-transform' in (get_header(headers, 'Cache-Control') or ''):
+            return False
+        if not self._is_compressible_type(headers):
+            return False
+        length = get_header(headers, 'Content-Length')
+        return length is None or int(length) >= self.min_size
+
+
+def get_header(headers, name):
+    name = name.lower()
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+    return None
+
+
+def add_vary(headers):
+    vary = get_header(headers, 'Vary')
+    if vary is None:
+        return headers + [('Vary', 'Accept-Encoding')]
+    if 'accept-encoding' in vary.lower():
+        return headers
+    return [(key, f'{value}, Accept-Encoding' if key.lower() == 'vary' else value)
+            for key, value in headers]
+
+
+def with_encoding(headers, encoding):
+    """Thêm Content-Encoding, gắn hậu tố encoding vào ETag mạnh"""
+    result = []
+    for key, value in headers:
+        if key.lower() == 'etag' and value.endswith('"') and not value.startswith('W/'):
+            value = f'{value[:-1]}-{encoding}"'
+        result.append((key, value))
+    return result + [('Content-Encoding', encoding)]
+
+
+def write_unsupported(data):
+    raise RuntimeError('CompressionMiddleware không hỗ trợ write() của WSGI')
+
+
+def prepend(first, rest, app_iter):
+    try:
+        yield first
+        yield from rest
+    finally:
+        close(app_iter)
+
+
+def close(app_iter):
+    if hasattr(app_iter, 'close'):
+        app_iter.close()
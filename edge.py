@@ -0,0 +1,104 @@
+"""
+Cache dùng chung phía trước app (CDN hoặc reverse proxy): header và purge theo surrogate key
+
+Trang chủ được phục vụ dạng "shell": giống hệt nhau với mọi người dùng (không đọc
+cookie, không Set-Cookie), kèm `Cache-Control: public, s-maxage` để CDN giữ và trả
+lời thay worker. Phần theo người dùng (số món trong giỏ) được JavaScript lấy qua
+/api/cart/summary.
+
+Mỗi response cache được gắn surrogate key (header Surrogate-Key, cách nhau bởi
+khoảng trắng, như Fastly/Varnish xkey):
+    store:demo                      mọi trang của store
+    store:demo:catalog:<stamp>      trang dựng từ đúng bản catalog này
+    store:demo:product:<id>         trang có hiển thị sản phẩm này
+Khi catalog đổi, purge key của bản catalog cũ và của các sản phẩm đã đổi.
+"""
+
+import logging
+import threading
+import urllib.parse
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Giới hạn độ dài header Surrogate-Key của phần lớn CDN; trang nhiều sản phẩm hơn chỉ có key store/catalog
+MAX_HEADER_BYTES = 16384
+# Số header Surrogate-Key tính sẵn (mỗi namespace x bản catalog một header)
+MAX_HEADERS = 1024
+
+
+def changed_products(old, new):
+    """Id các sản phẩm được thêm, xóa hoặc sửa giữa hai catalog"""
+    changed = {product['id'] for product in old if new.get(product['id']) != product}
+    changed.update(product['id'] for product in new if old.get(product['id']) is None)
+    return sorted(changed)
+
+
+class EdgeCache:
+    """`ttl`: s-maxage (giây), 0 là tắt; `purge_url` chứa {key}, vd:
+    https://api.fastly.com/service/<id>/purge/{key}"""
+
+    def __init__(self, ttl=60, purge_url='', purge_method='POST', purge_headers=None,
+                 key_header='Surrogate-Key', timeout=5):
+        self.ttl = ttl
+        self.purge_url = purge_url
+        self.purge_method = purge_method
+        self.purge_headers = dict(purge_headers or {})
+        self.key_header = key_header
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._headers = OrderedDict()  # (namespace, catalog.stamp) -> giá trị header
+
+    @property
+    def enabled(self):
+        return self.ttl > 0
+
+    def keys(self, namespace, catalog):
+        """Surrogate key của một trang dựng từ `catalog` và hiển thị các sản phẩm của nó"""
+        keys = [namespace, f'{namespace}:catalog:{catalog.stamp}']
+        size = sum(len(key) + 1 for key in keys)
+        for product in catalog:
+            key = f"{namespace}:product:{product['id']}"
+            size += len(key) + 1
+            if size > MAX_HEADER_BYTES:
+                break
+            keys.append(key)
+        return keys
+
+    def changed_keys(self, namespace, old, new):
+        """Key cần purge khi catalog của namespace đổi từ `old` sang `new`"""
+        return [f'{namespace}:catalog:{old.stamp}',
+                *(f'{namespace}:product:{product_id}' for product_id in changed_products(old, new))]
+
+    def cacheable(self, response, namespace, catalog):
+        """Cho phép CDN giữ response `ttl` giây, gắn surrogate key; trình duyệt luôn hỏi lại (ETag)"""
+        response.cache_control.public = True
+        response.cache_control.max_age = 0
+        response.cache_control.s_maxage = self.ttl
+        response.headers[self.key_header] = self._header(namespace, catalog)
+        return response
+
+    def _header(self, namespace, catalog):
+        # Tính một lần cho mỗi bản catalog: duyệt catalog lớn mỗi request tốn cả mili giây
+        key = (namespace, catalog.stamp)
+        header = self._headers.get(key)
+        if header is None:
+            header = ' '.join(self.keys(namespace, catalog))
+            with self._lock:
+                self._headers[key] = header
+                if len(self._headers) > MAX_HEADERS:
+                    self._headers.popitem(last=False)
+        return header
+
+    def purge(self, keys):
+        """Gửi một request purge cho mỗi key; lỗi thì raise (job nền sẽ thử lại)"""
+        if not self.purge_url:
+            return
+        import urllib.request
+
+        for key in keys:
+            url = self.purge_url.format(key=urllib.parse.quote(key, safe=''))
+            request = urllib.request.Request(url, method=self.purge_method, headers=self.purge_headers)
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                response.read()
+        logger.info('Đã purge %d surrogate key: %s', len(keys), ' '.join(keys[:10]))
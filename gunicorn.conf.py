@@ -0,0 +1,53 @@
+"""
+Cấu hình Gunicorn cho môi trường production
+
+Chạy: gunicorn app:app  (file này được nạp tự động từ thư mục hiện tại)
+Reload không downtime: kill -HUP <pid master>
+"""
+
+import multiprocessing
+import os
+
+# Railway cấp cổng qua biến PORT, giống khối __main__ trong app.py
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+
+# Số process và số thread mỗi process
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+worker_class = 'gthread' if threads > 1 else 'sync'
+
+# Nạp app (và catalog) một lần trước khi fork các worker
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+
+# Keep-alive và timeout
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+
+# Thay worker định kỳ để tránh rò rỉ bộ nhớ, lệch nhau để không restart cùng lúc
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 200))
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+
+
+def on_starting(server):
+    # Xóa snapshot metrics của lần chạy trước để /metrics không cộng dồn số cũ
+    directory = os.environ.get('METRICS_DIR')
+    if directory and os.path.isdir(directory):
+        for name in os.listdir(directory):
+            if name.startswith('metrics-'):
+                os.remove(os.path.join(directory, name))
+
+
+def when_ready(server):
+    # preload_app: warm-up xong trong master rồi mới fork, worker dùng chung catalog/template
+    # đã dựng (copy-on-write). Thread nền (job, theo dõi catalog, metrics) chỉ khởi động ở
+    # request đầu tiên của mỗi worker nên master không có thread nào đang chạy dở lúc fork
+    if preload_app:
+        warmup = getattr(server.app.wsgi(), 'extensions', {}).get('warmup')
+        limit = float(os.environ.get('GUNICORN_WARMUP_TIMEOUT', 120))
+        if warmup is not None and not warmup.wait(limit):
+            server.log.warning('Warm-up chưa xong sau %ss, mỗi worker sẽ tự warm-up', limit)
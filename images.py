@@ -0,0 +1,208 @@
+"""
+Ảnh sản phẩm: tải ảnh gốc một lần, cắt đúng kích thước từng chỗ hiển thị,
+chuyển sang WebP/AVIF và lưu trong cache đĩa có giới hạn dung lượng (LRU)
+
+    /images/<product_id>/<variant>-<density>x.<format>?v=<hash ảnh gốc>
+"""
+
+import hashlib
+import io
+import os
+import tempfile
+import threading
+import time
+import urllib.parse
+
+from flask import abort, current_app, redirect, request, send_file
+from markupsafe import escape
+
+# Kích thước hiển thị (CSS px) của từng chỗ dùng ảnh
+VARIANTS = {
+    'card': (300, 200),
+    'thumb': (50, 50),
+}
+DENSITIES = (1, 2)
+FORMATS = {
+    'avif': ('AVIF', 'image/avif', {'quality': 55}),
+    'webp': ('WEBP', 'image/webp', {'quality': 80, 'method': 4}),
+}
+CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# Ảnh gốc tải lỗi thì không thử lại trong khoảng này (giây)
+FAILURE_TTL = 300
+
+
+class DiskCache:
+    """Cache file trên đĩa, xóa file ít dùng nhất (theo mtime) khi vượt max_bytes"""
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._size = sum(entry.stat().st_size for entry in os.scandir(directory) if entry.is_file())
+
+    def path(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            os.utime(path)  # đánh dấu vừa dùng
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, key, data):
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, self.path(key))
+        with self._lock:
+            self._size += len(data)
+            if self._size > self.max_bytes:
+                self._evict()
+        return self.path(key)
+
+    def _evict(self):
+        # Tính lại từ đĩa vì các worker khác cũng ghi vào cùng thư mục
+        entries = sorted((entry.stat().st_mtime, entry.stat().st_size, entry.path)
+                         for entry in os.scandir(self.directory)
+                         if entry.is_file() and not entry.name.endswith('.tmp'))
+        self._size = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        for _, size, path in entries:
+            if self._size <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self._size -= size
+
+
+class ImageProxy:
+    """Sinh và phục vụ các biến thể ảnh của sản phẩm"""
+
+    def __init__(self, get_product, cache_dir, max_bytes, timeout=10):
+        self.get_product = get_product
+        self.cache = DiskCache(cache_dir, max_bytes)
+        self.timeout = timeout
+        self._formats = None
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        self._failures = {}  # url ảnh gốc -> thời điểm được thử lại
+
+    @property
+    def formats(self):
+        """Định dạng Pillow ghi được; Pillow chỉ được import lần đầu cần (không làm chậm khởi động)"""
+        if self._formats is None:
+            try:
+                from PIL import features
+            except ImportError:  # Pillow là tùy chọn, thiếu thì trang dùng thẳng ảnh gốc
+                self._formats = []
+            else:
+                self._formats = [name for name in FORMATS if features.check(name)]
+        return self._formats
+
+    @property
+    def available(self):
+        return bool(self.formats)
+
+    def url(self, product, variant, density=1, fmt='webp', store=None):
+        """`store`: slug của store có sản phẩm ('' là store mặc định); trang lấy từ CDN không có
+        session nên URL phải mang store"""
+        version = source_version(product['image'])
+        url = f"/images/{product['id']}/{variant}-{density}x.{fmt}?v={version}"
+        if store is not None:
+            url += f'&store={urllib.parse.quote(store)}'
+        return url
+
+    def picture(self, product, variant, img_attrs, store=None):
+        """Thẻ <picture> với srcset AVIF/WebP, <img> dự phòng trỏ vào ảnh gốc
+
+        Giá trị lấy từ dữ liệu (ảnh, tên, store) đều được escape; `img_attrs` là chuỗi cố định từ template.
+        """
+        img = f'<img src="{escape(product["image"])}" alt="{escape(product.get("name", ""))}" {img_attrs}>'
+        if not self.available:
+            return img
+        sources = ''.join(
+            f'<source type="{FORMATS[fmt][1]}" srcset="'
+            + str(escape(', '.join(f'{self.url(product, variant, density, fmt, store)} {density}x'
+                                   for density in DENSITIES)))
+            + '">'
+            for fmt in self.formats
+        )
+        return f'<picture>{sources}{img}</picture>'
+
+    def serve(self, product_id, variant, density, fmt):
+        product = self.get_product(product_id)
+        if product is None or variant not in VARIANTS or density not in DENSITIES or fmt not in self.formats:
+            abort(404)
+        key = f"{product_id}-{source_version(product['image'])}-{variant}-{density}x.{fmt}"
+        path = self.cache.get(key)
+        if path is None:
+            if self._failures.get(product['image'], 0) > time.monotonic():
+                return redirect(product['image'])
+            with self._lock_for(key):
+                path = self.cache.get(key)
+                if path is None:
+                    try:
+                        source = self._source(product['image'])
+                        path = self.cache.put(key, render_variant(source, VARIANTS[variant], density, fmt))
+                    except (OSError, ValueError) as error:
+                        # Không lấy/xử lý được ảnh gốc: để trình duyệt tải thẳng ảnh gốc
+                        current_app.logger.warning('Không tạo được ảnh %s: %s', key, error)
+                        self._failures[product['image']] = time.monotonic() + FAILURE_TTL
+                        return redirect(product['image'])
+        response = send_file(path, mimetype=FORMATS[fmt][1], etag=key, conditional=True)
+        if request.args.get('v') == source_version(product['image']):
+            response.headers['Cache-Control'] = CACHE_CONTROL
+        return response
+
+    def _source(self, url):
+        """Bytes ảnh gốc, tải một lần rồi giữ trong cache đĩa"""
+        key = f'src-{hashlib.sha1(url.encode()).hexdigest()}'
+        path = self.cache.get(key)
+        if path is None:
+            if url.startswith(('http://', 'https://')):
+                import urllib.request
+
+                with urllib.request.urlopen(url, timeout=self.timeout) as response:
+                    data = response.read()
+            else:
+                # Đường dẫn cục bộ (tương đối so với static/), vd ảnh mẫu khi dev
+                with open(os.path.join(current_app.static_folder, url.lstrip('/')), 'rb') as f:
+                    data = f.read()
+            path = self.cache.put(key, data)
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def _lock_for(self, key):
+        # Một lock cho mỗi biến thể để nhiều request cùng lúc chỉ render một lần
+        with self._locks_guard:
+            if len(self._locks) > 1024:
+                self._locks.clear()
+            return self._locks.setdefault(key, threading.Lock())
+
+
+def source_version(url):
+    return hashlib.sha1(url.encode()).hexdigest()[:10]
+
+
+def render_variant(source, size, density, fmt):
+    """Cắt kiểu object-fit: cover về size * density (không phóng to quá ảnh gốc)"""
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(source)) as image:
+        image = ImageOps.exif_transpose(image)
+        width, height = size[0] * density, size[1] * density
+        scale = min(1.0, image.width / width, image.height / height)
+        width, height = max(1, round(width * scale)), max(1, round(height * scale))
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+        image = ImageOps.fit(image, (width, height), method=Image.Resampling.LANCZOS)
+        output = io.BytesIO()
+        pil_format, _, options = FORMATS[fmt]
+        image.save(output, pil_format, **options)
+        return output.getvalue()
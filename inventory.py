@@ -0,0 +1,225 @@
+"""
+Giữ hàng (reservation) cho sản phẩm có quản lý tồn kho
+
+Thêm vào giỏ thì giữ hàng trong một thời gian (RESERVATION_TTL), xóa khỏi giỏ
+hoặc hết hạn thì trả lại, thanh toán thì chuyển sang phần đã bán. Số liệu nằm trong
+SQLite: mỗi thao tác là một transaction BEGIN IMMEDIATE nên đúng cả khi nhiều
+thread và nhiều worker cùng giữ một sản phẩm.
+
+    stock:     sku -> reserved (đang được giữ), committed (đã bán, catalog chưa trừ)
+    holds:     (cart_id, sku) -> quantity, expires_at
+    committed: (reference, sku) -> quantity, settle_at
+
+Tồn kho thực luôn là stock_quantity của catalog (database là nơi duy nhất lưu tồn
+kho, nhập thêm hàng trong database là có hiệu lực khi catalog nạp lại); còn bán được
+= tồn kho thực - reserved - committed. Job trừ tồn kho trong database xong thì gọi
+settled(reference): phần đã bán của đơn còn được tính thêm `settle_ttl` giây (worker
+khác có thể vẫn giữ catalog cũ chưa trừ) rồi mới bỏ.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_TTL = 15 * 60
+
+
+class OutOfStock(Exception):
+    def __init__(self, skus):
+        super().__init__(f'Không đủ hàng: {", ".join(skus)}')
+        self.skus = skus
+
+
+class Inventory:
+    def __init__(self, path, ttl=DEFAULT_TTL, settle_ttl=60):
+        self.path = path
+        self.ttl = ttl
+        self.settle_ttl = settle_ttl
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        db = self._connect()
+        if 'on_hand' in {row[1] for row in db.execute('PRAGMA table_info(stock)')}:
+            # Bảng cũ còn giữ bản sao tồn kho: bỏ cột on_hand, giữ nguyên phần đang giữ
+            db.executescript('''
+                BEGIN IMMEDIATE;
+                ALTER TABLE stock RENAME TO stock_old;
+                CREATE TABLE stock (
+                    sku TEXT PRIMARY KEY,
+                    reserved INTEGER NOT NULL DEFAULT 0,
+                    committed INTEGER NOT NULL DEFAULT 0
+                );
+                INSERT INTO stock (sku, reserved) SELECT sku, reserved FROM stock_old;
+                DROP TABLE stock_old;
+                COMMIT;
+            ''')
+        db.executescript('''
+            CREATE TABLE IF NOT EXISTS stock (
+                sku TEXT PRIMARY KEY,
+                reserved INTEGER NOT NULL DEFAULT 0,
+                committed INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS holds (
+                cart_id TEXT NOT NULL,
+                sku TEXT NOT NULL,
+                quantity INTEGER NOT NULL,
+                expires_at REAL NOT NULL,
+                PRIMARY KEY (cart_id, sku)
+            );
+            CREATE INDEX IF NOT EXISTS ix_holds_sku_expires_at ON holds (sku, expires_at);
+            CREATE TABLE IF NOT EXISTS committed (
+                reference TEXT NOT NULL,
+                sku TEXT NOT NULL,
+                quantity INTEGER NOT NULL,
+                settle_at REAL,
+                PRIMARY KEY (reference, sku)
+            );
+            CREATE INDEX IF NOT EXISTS ix_committed_sku_settle_at ON committed (sku, settle_at);
+        ''')
+
+    def _connect(self):
+        # Mỗi thread (và mỗi process sau khi fork) có connection riêng
+        db = getattr(self._local, 'db', None)
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self._local.db = db
+            self._local.pid = os.getpid()
+        return db
+
+    def _transaction(self, work):
+        db = self._connect()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            result = work(db)
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        return result
+
+    def _expire(self, db, sku, now):
+        """Trả lại hàng của các lượt giữ đã hết hạn của sku, bỏ phần đã bán mà mọi catalog đã trừ"""
+        rows = db.execute('DELETE FROM holds WHERE sku = ? AND expires_at < ? RETURNING quantity',
+                          (sku, now)).fetchall()
+        if rows:
+            db.execute('UPDATE stock SET reserved = reserved - ? WHERE sku = ?',
+                       (sum(quantity for quantity, in rows), sku))
+        rows = db.execute('DELETE FROM committed WHERE sku = ? AND settle_at < ? RETURNING quantity',
+                          (sku, now)).fetchall()
+        if rows:
+            db.execute('UPDATE stock SET committed = committed - ? WHERE sku = ?',
+                       (sum(quantity for quantity, in rows), sku))
+
+    def _held(self, db, cart_id, sku):
+        row = db.execute('SELECT quantity FROM holds WHERE cart_id = ? AND sku = ?', (cart_id, sku)).fetchone()
+        return row[0] if row else 0
+
+    def _take(self, db, sku, quantity, on_hand):
+        """Tăng reserved nếu còn đủ hàng (một câu UPDATE có điều kiện); on_hand: tồn kho theo catalog"""
+        db.execute('INSERT OR IGNORE INTO stock (sku) VALUES (?)', (sku,))
+        return db.execute('UPDATE stock SET reserved = reserved + ? WHERE sku = ? AND ? - reserved - committed >= ?',
+                          (quantity, sku, on_hand, quantity)).rowcount == 1
+
+    def reserve(self, cart_id, sku, quantity, on_hand):
+        """Giữ thêm `quantity` cho giỏ hàng; False nếu không đủ hàng. Gia hạn lượt giữ hiện có."""
+        def work(db):
+            now = time.time()
+            self._expire(db, sku, now)
+            if not self._take(db, sku, quantity, on_hand):
+                return False
+            db.execute(
+                'INSERT INTO holds (cart_id, sku, quantity, expires_at) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT (cart_id, sku) DO UPDATE SET quantity = quantity + excluded.quantity, '
+                'expires_at = excluded.expires_at',
+                (cart_id, sku, quantity, now + self.ttl),
+            )
+            return True
+        return self._transaction(work)
+
+    def release(self, cart_id, sku):
+        """Trả lại toàn bộ hàng giỏ đang giữ của sku"""
+        def work(db):
+            row = db.execute('DELETE FROM holds WHERE cart_id = ? AND sku = ? RETURNING quantity',
+                             (cart_id, sku)).fetchone()
+            if row:
+                db.execute('UPDATE stock SET reserved = reserved - ? WHERE sku = ?', (row[0], sku))
+        self._transaction(work)
+
+    def _settle(self, db, cart_id, quantities, on_hand, now):
+        """Đưa phần đang giữ của giỏ về đúng quantities (giữ thêm hoặc trả bớt); thiếu hàng thì raise OutOfStock"""
+        missing = []
+        for sku, quantity in quantities.items():
+            self._expire(db, sku, now)
+            extra = quantity - self._held(db, cart_id, sku)
+            if extra > 0 and not self._take(db, sku, extra, on_hand[sku]):
+                missing.append(sku)
+            elif extra < 0:
+                db.execute('UPDATE stock SET reserved = reserved + ? WHERE sku = ?', (extra, sku))
+        if missing:
+            raise OutOfStock(missing)
+
+    def hold(self, cart_id, quantities, on_hand):
+        """Đặt số lượng giữ của giỏ cho nhiều sku cùng lúc (0 là trả hết), tất cả hoặc không gì cả
+
+        Dùng khi sửa giỏ theo lô; thiếu hàng thì raise OutOfStock và không thay đổi gì.
+        """
+        def work(db):
+            now = time.time()
+            self._settle(db, cart_id, quantities, on_hand, now)
+            for sku, quantity in quantities.items():
+                if quantity > 0:
+                    db.execute(
+                        'INSERT INTO holds (cart_id, sku, quantity, expires_at) VALUES (?, ?, ?, ?) '
+                        'ON CONFLICT (cart_id, sku) DO UPDATE SET quantity = excluded.quantity, '
+                        'expires_at = excluded.expires_at',
+                        (cart_id, sku, quantity, now + self.ttl),
+                    )
+                else:
+                    db.execute('DELETE FROM holds WHERE cart_id = ? AND sku = ?', (cart_id, sku))
+        self._transaction(work)
+
+    def commit(self, cart_id, quantities, on_hand, reference):
+        """Chuyển phần giữ của cả giỏ sang đã bán khi thanh toán, tất cả hoặc không gì cả
+
+        quantities: sku -> số lượng trong giỏ; on_hand: sku -> tồn kho theo catalog;
+        reference: mã đơn, để settled()/cancel() sau đó. Lượt giữ đã hết hạn được giữ
+        lại nếu còn hàng; thiếu hàng thì raise OutOfStock và không thay đổi gì.
+        """
+        def work(db):
+            self._settle(db, cart_id, quantities, on_hand, time.time())
+            for sku, quantity in quantities.items():
+                db.execute('UPDATE stock SET reserved = reserved - ?, committed = committed + ? WHERE sku = ?',
+                           (quantity, quantity, sku))
+                db.execute(
+                    'INSERT INTO committed (reference, sku, quantity) VALUES (?, ?, ?) '
+                    'ON CONFLICT (reference, sku) DO UPDATE SET quantity = quantity + excluded.quantity',
+                    (reference, sku, quantity),
+                )
+            db.execute('DELETE FROM holds WHERE cart_id = ?', (cart_id,))
+        self._transaction(work)
+
+    def cancel(self, reference):
+        """Trả lại phần đã bán của một đơn (vd: ghi đơn lỗi sau khi đã commit)"""
+        def work(db):
+            for sku, quantity in db.execute('DELETE FROM committed WHERE reference = ? RETURNING sku, quantity',
+                                            (reference,)).fetchall():
+                db.execute('UPDATE stock SET committed = committed - ? WHERE sku = ?', (quantity, sku))
+        self._transaction(work)
+
+    def settled(self, reference):
+        """Database đã trừ tồn kho cho đơn: bỏ phần đã bán của đơn sau settle_ttl (gọi lại nhiều lần không sao)"""
+        self._transaction(lambda db: db.execute(
+            'UPDATE committed SET settle_at = ? WHERE reference = ? AND settle_at IS NULL',
+            (time.time() + self.settle_ttl, reference)))
+
+    def available(self, sku, on_hand):
+        """Số có thể giữ thêm khi catalog có tồn kho on_hand"""
+        def work(db):
+            self._expire(db, sku, time.time())
+            return db.execute('SELECT reserved + committed FROM stock WHERE sku = ?', (sku,)).fetchone()
+        row = self._transaction(work)
+        return on_hand - (row[0] if row else 0)
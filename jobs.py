@@ -0,0 +1,150 @@
+"""
+Hàng đợi job nền lưu trong SQLite, chạy bởi một pool thread
+
+Request chỉ ghi một dòng vào hàng đợi (vài chục micro giây) rồi trả về; các
+bước chậm (gửi email, trừ tồn kho, render hóa đơn...) chạy trong worker. Worker
+chạy ngay trong process web (JOB_WORKERS thread) hoặc riêng bằng `flask worker`.
+Job lỗi được thử lại với thời gian chờ tăng dần; job của worker chết giữa chừng
+được nhận lại khi hết hạn giữ (lease).
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import traceback
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueue:
+    def __init__(self, path, max_attempts=5, retry_delay=5.0, lease=300.0, poll_interval=1.0):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.app = None
+        self._tasks = {}
+        self._local = threading.local()
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._workers_pid = None
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connect().executescript('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'queued',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                run_at REAL NOT NULL,
+                locked_until REAL,
+                error TEXT,
+                created_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS ix_jobs_status_run_at ON jobs (status, run_at);
+        ''')
+
+    def init_app(self, app):
+        """Job chạy trong app context của app (để dùng db.session, render_template...)"""
+        self.app = app
+
+    def _connect(self):
+        # Mỗi thread (và mỗi process sau khi fork) có connection riêng
+        db = getattr(self._local, 'db', None)
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self._local.db = db
+            self._local.pid = os.getpid()
+        return db
+
+    def task(self, name=None):
+        """Decorator đăng ký hàm xử lý job: handler(**payload)"""
+        def register(func):
+            self._tasks[name or func.__name__] = func
+            return func
+        return register
+
+    def enqueue(self, name, payload=None, delay=0):
+        if name not in self._tasks:
+            raise KeyError(f'Chưa đăng ký job: {name}')
+        now = time.time()
+        job_id = self._connect().execute(
+            'INSERT INTO jobs (name, payload, run_at, created_at) VALUES (?, ?, ?, ?)',
+            (name, json.dumps(payload or {}), now + delay, now),
+        ).lastrowid
+        self._wakeup.set()
+        return job_id
+
+    def claim(self):
+        """Nhận job đến hạn tiếp theo (hoặc job bị bỏ dở đã hết lease), None nếu không có"""
+        now = time.time()
+        return self._connect().execute(
+            "UPDATE jobs SET status = 'running', attempts = attempts + 1, locked_until = ? "
+            "WHERE id = (SELECT id FROM jobs WHERE (status = 'queued' AND run_at <= ?) "
+            "            OR (status = 'running' AND locked_until < ?) ORDER BY run_at, id LIMIT 1) "
+            'RETURNING id, name, payload, attempts',
+            (now + self.lease, now, now),
+        ).fetchone()
+
+    def run_one(self):
+        """Chạy một job nếu có; True nếu đã chạy"""
+        job = self.claim()
+        if job is None:
+            return False
+        job_id, name, payload, attempts = job
+        db = self._connect()
+        try:
+            handler = self._tasks[name]
+            if self.app is not None:
+                with self.app.app_context():
+                    handler(**json.loads(payload))
+            else:
+                handler(**json.loads(payload))
+        except Exception:
+            error = traceback.format_exc()
+            if attempts >= self.max_attempts:
+                logger.error('Job %s #%s lỗi lần %s, bỏ qua:\n%s', name, job_id, attempts, error)
+                db.execute("UPDATE jobs SET status = 'failed', error = ? WHERE id = ?", (error, job_id))
+            else:
+                delay = self.retry_delay * 2 ** (attempts - 1)
+                logger.warning('Job %s #%s lỗi lần %s, thử lại sau %.0fs', name, job_id, attempts, delay)
+                db.execute("UPDATE jobs SET status = 'queued', run_at = ?, error = ? WHERE id = ?",
+                           (time.time() + delay, error, job_id))
+        else:
+            db.execute('DELETE FROM jobs WHERE id = ?', (job_id,))
+        return True
+
+    def work(self):
+        """Vòng lặp của một worker thread"""
+        while True:
+            try:
+                if self.run_one():
+                    continue
+            except sqlite3.Error:
+                logger.exception('Lỗi hàng đợi job')
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    def start(self, workers):
+        """Khởi động `workers` thread nền, một lần cho mỗi process (kể cả worker gunicorn)"""
+        if workers <= 0 or self._workers_pid == os.getpid():
+            return
+        with self._lock:
+            if self._workers_pid == os.getpid():
+                return
+            self._workers_pid = os.getpid()
+        for index in range(workers):
+            threading.Thread(target=self.work, name=f'jobs-{index}', daemon=True).start()
+
+    def stats(self):
+        """Số job theo trạng thái"""
+        rows = self._connect().execute('SELECT status, COUNT(*) FROM jobs GROUP BY status')
+        return dict(rows.fetchall())
@@ -0,0 +1,205 @@
+"""
+Đo thời gian xử lý từng request và xuất metrics dạng Prometheus (text format)
+
+Mỗi thread ghi vào shard riêng nên đường nóng không cần lock; khi scrape
+các shard được cộng lại. Chạy nhiều worker (gunicorn) thì đặt METRICS_DIR:
+mỗi process định kỳ ghi snapshot vào đó và /metrics gộp tất cả các file.
+"""
+
+import bisect
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+
+from flask import g, request
+from flask.sessions import SecureCookieSessionInterface
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+HISTOGRAMS = {
+    'shop_request_duration_seconds': ('Thời gian xử lý request (tới khi lưu xong session)', LATENCY_BUCKETS),
+    'shop_render_duration_seconds': ('Thời gian chạy view và render response', LATENCY_BUCKETS),
+    'shop_session_save_duration_seconds': ('Thời gian serialize và ký cookie session', LATENCY_BUCKETS),
+    'shop_response_size_bytes': ('Kích thước body response (không tính response stream)', SIZE_BUCKETS),
+    'shop_session_cookie_size_bytes': ('Kích thước cookie session gửi lên', SIZE_BUCKETS),
+}
+COUNTERS = {
+    'shop_requests_total': 'Số request theo endpoint và mã trạng thái',
+}
+
+
+class Metrics:
+    """Bộ đếm và histogram, ghi theo shard từng thread"""
+
+    def __init__(self, directory=None, flush_interval=5.0):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._shards = []
+        self._flusher_pid = None
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = ({}, {})  # (histograms, counters)
+            with self._lock:
+                self._shards.append(shard)
+            self._start_flusher()
+        return shard
+
+    def _start_flusher(self):
+        # Mỗi process (kể cả worker fork từ master) có một thread ghi snapshot định kỳ
+        if not self.directory or self._flusher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+        threading.Thread(target=self._flush_forever, name='metrics-flusher', daemon=True).start()
+
+    def _flush_forever(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def observe(self, name, labels, value):
+        histograms = self._shard()[0]
+        key = (name, labels)
+        entry = histograms.get(key)
+        if entry is None:
+            # [đếm theo từng bucket..., +Inf, tổng giá trị, số lần]
+            entry = histograms[key] = [0] * (len(HISTOGRAMS[name][1]) + 3)
+        entry[bisect.bisect_left(HISTOGRAMS[name][1], value)] += 1
+        entry[-2] += value
+        entry[-1] += 1
+
+    def inc(self, name, labels, amount=1):
+        counters = self._shard()[1]
+        key = (name, labels)
+        counters[key] = counters.get(key, 0) + amount
+
+    def snapshot(self):
+        """Cộng các shard của process hiện tại"""
+        histograms, counters = {}, {}
+        with self._lock:
+            shards = list(self._shards)
+        for shard_histograms, shard_counters in shards:
+            for key, entry in list(shard_histograms.items()):
+                total = histograms.setdefault(key, [0] * len(entry))
+                for index, value in enumerate(entry):
+                    total[index] += value
+            for key, value in list(shard_counters.items()):
+                counters[key] = counters.get(key, 0) + value
+        return histograms, counters
+
+    def flush(self):
+        """Ghi snapshot của process ra METRICS_DIR (nguyên tử bằng os.replace)"""
+        if not self.directory:
+            return
+        histograms, counters = self.snapshot()
+        data = {
+            'histograms': [[name, list(labels), entry] for (name, labels), entry in histograms.items()],
+            'counters': [[name, list(labels), value] for (name, labels), value in counters.items()],
+        }
+        os.makedirs(self.directory, exist_ok=True)
+        fd, path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+        os.replace(path, os.path.join(self.directory, f'metrics-{os.getpid()}.json'))
+
+    def collect(self):
+        """Snapshot của mọi process (nếu có METRICS_DIR) hoặc của process hiện tại"""
+        if not self.directory:
+            return self.snapshot()
+        self.flush()
+        histograms, counters = {}, {}
+        for path in glob.glob(os.path.join(self.directory, 'metrics-*.json')):
+            try:
+                with open(path) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for name, labels, entry in data['histograms']:
+                total = histograms.setdefault((name, tuple(map(tuple, labels))), [0] * len(entry))
+                for index, value in enumerate(entry):
+                    total[index] += value
+            for name, labels, value in data['counters']:
+                key = (name, tuple(map(tuple, labels)))
+                counters[key] = counters.get(key, 0) + value
+        return histograms, counters
+
+    def render(self):
+        """Text format của Prometheus"""
+        histograms, counters = self.collect()
+        lines = []
+        for name, (help_text, buckets) in HISTOGRAMS.items():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} histogram')
+            for (metric, labels), entry in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip((*buckets, '+Inf'), entry):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{format_labels(labels + (("le", str(bound)),))} {cumulative}')
+                lines.append(f'{name}_sum{format_labels(labels)} {entry[-2]}')
+                lines.append(f'{name}_count{format_labels(labels)} {entry[-1]}')
+        for name, help_text in COUNTERS.items():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} counter')
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f'{name}{format_labels(labels)} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def init_app(self, app):
+        """Gắn các hook đo thời gian vào app"""
+        app.session_interface = TimedSessionInterface(self)
+
+        @app.before_request
+        def start_request_timer():
+            g.request_started = time.perf_counter()
+
+        @app.after_request
+        def record_request_metrics(response):
+            started = g.get('request_started')
+            if started is None:
+                return response
+            labels = (('endpoint', request.endpoint or 'unknown'),)
+            self.observe('shop_render_duration_seconds', labels, time.perf_counter() - started)
+            if not response.is_streamed and response.content_length is not None:
+                self.observe('shop_response_size_bytes', labels, response.content_length)
+            cookie = request.cookies.get(app.config['SESSION_COOKIE_NAME'])
+            if cookie:
+                self.observe('shop_session_cookie_size_bytes', labels, len(cookie))
+            self.inc('shop_requests_total', labels + (('status', str(response.status_code)),))
+            return response
+
+
+class TimedSessionInterface(SecureCookieSessionInterface):
+    """Cookie session như mặc định, đo thêm thời gian lưu session và tổng thời gian request"""
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+
+    def save_session(self, app, session, response):
+        start = time.perf_counter()
+        super().save_session(app, session, response)
+        finished = time.perf_counter()
+        if 'request_started' in g:
+            labels = (('endpoint', request.endpoint or 'unknown'),)
+            self.metrics.observe('shop_session_save_duration_seconds', labels, finished - start)
+            self.metrics.observe('shop_request_duration_seconds', labels, finished - g.request_started)
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for _, value in labels)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + '}'
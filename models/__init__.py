@@ -0,0 +1,59 @@
+"""
+Models SQLAlchemy cho hệ thống bán hàng đa store
+"""
+
+import os
+
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+
+db = SQLAlchemy()
+
+
+def database_uri(instance_path):
+    """DATABASE_URL nếu có, MySQL nếu khai báo MYSQL_HOST, ngược lại SQLite trong instance/"""
+    if os.environ.get('DATABASE_URL'):
+        return os.environ['DATABASE_URL']
+    if os.environ.get('MYSQL_HOST'):
+        return 'mysql+pymysql://{user}:{password}@{host}:{port}/{database}?charset=utf8mb4'.format(
+            user=os.environ.get('MYSQL_USER', 'root'),
+            password=os.environ.get('MYSQL_PASSWORD', ''),
+            host=os.environ['MYSQL_HOST'],
+            port=os.environ.get('MYSQL_PORT', 3306),
+            database=os.environ.get('MYSQL_DATABASE', 'multi_store_db'),
+        )
+    return 'sqlite:///' + os.path.join(instance_path, 'store.sqlite3')
+
+
+def engine_options(uri):
+    """Tùy chọn connection pool cho engine"""
+    if uri.startswith('sqlite'):
+        return {'connect_args': {'check_same_thread': False}}
+    return {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 5)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+        'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 10)),
+        # MySQL đóng connection idle sau wait_timeout (mặc định 8 giờ)
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': True,
+    }
+
+
+def init_app(app):
+    # Import đủ các model để relationship giữa chúng được cấu hình
+    from models import order, product, store, user  # noqa: F401
+
+    os.makedirs(app.instance_path, exist_ok=True)
+    uri = app.config.setdefault('SQLALCHEMY_DATABASE_URI', database_uri(app.instance_path))
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(uri))
+    app.config.setdefault('SQLALCHEMY_TRACK_MODIFICATIONS', False)
+    db.init_app(app)
+    if uri.startswith('sqlite'):
+        with app.app_context():
+            event.listen(db.engine, 'connect', sqlite_pragmas)
+
+
+def sqlite_pragmas(connection, record):
+    # WAL: đọc không chặn ghi, commit không phải fsync mỗi lần (ghi đơn hàng nhanh hơn)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA synchronous=NORMAL')
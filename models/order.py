@@ -0,0 +1,37 @@
+from datetime import datetime
+
+from models import db
+
+
+class Order(db.Model):
+    __tablename__ = 'orders'
+
+    id = db.Column(db.Integer, primary_key=True)
+    # Mã công khai dùng trong URL, không đoán được như id
+    code = db.Column(db.String(32), nullable=False, unique=True, index=True)
+    # None: store mặc định (catalog trong memory)
+    store_id = db.Column(db.Integer, db.ForeignKey('stores.id'), index=True)
+    customer_name = db.Column(db.String(120), nullable=False)
+    customer_phone = db.Column(db.String(20), nullable=False)
+    customer_email = db.Column(db.String(120))
+    total = db.Column(db.Integer, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending')
+    # Các bước xử lý nền đã chạy, để job chạy lại không làm lại lần nữa
+    stock_committed = db.Column(db.Boolean, nullable=False, default=False)
+    confirmation_sent_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    items = db.relationship('OrderItem', backref='order', lazy='select', cascade='all, delete-orphan')
+
+
+class OrderItem(db.Model):
+    __tablename__ = 'order_items'
+
+    id = db.Column(db.Integer, primary_key=True)
+    order_id = db.Column(db.Integer, db.ForeignKey('orders.id'), nullable=False, index=True)
+    # Không khóa ngoại: sản phẩm của store mặc định không nằm trong database
+    product_id = db.Column(db.Integer, nullable=False)
+    name = db.Column(db.String(200), nullable=False)
+    unit_price = db.Column(db.Integer, nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    line_total = db.Column(db.Integer, nullable=False)
@@ -0,0 +1,54 @@
+from datetime import datetime
+
+from models import db
+
+DEFAULT_IMAGE = 'https://placehold.co/300x200?text=No+Image'
+
+
+class ProductCategory(db.Model):
+    __tablename__ = 'product_categories'
+    __table_args__ = (db.UniqueConstraint('store_id', 'slug'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    store_id = db.Column(db.Integer, db.ForeignKey('stores.id'), nullable=False, index=True)
+    name = db.Column(db.String(200), nullable=False)
+    slug = db.Column(db.String(100), nullable=False)
+    description = db.Column(db.Text)
+    sort_order = db.Column(db.Integer, nullable=False, default=0)
+
+    products = db.relationship('Product', backref='category', lazy='select')
+
+
+class Product(db.Model):
+    __tablename__ = 'products'
+    __table_args__ = (
+        db.UniqueConstraint('store_id', 'slug'),
+        db.Index('ix_products_store_active_sort', 'store_id', 'is_active', 'sort_order'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    store_id = db.Column(db.Integer, db.ForeignKey('stores.id'), nullable=False)
+    category_id = db.Column(db.Integer, db.ForeignKey('product_categories.id'), index=True)
+    name = db.Column(db.String(200), nullable=False)
+    slug = db.Column(db.String(100), nullable=False)
+    description = db.Column(db.Text)
+    short_description = db.Column(db.String(255))
+    price = db.Column(db.Integer, nullable=False, default=0)
+    image_url = db.Column(db.String(500))
+    stock_quantity = db.Column(db.Integer, nullable=False, default=0)
+    sort_order = db.Column(db.Integer, nullable=False, default=0)
+    is_featured = db.Column(db.Boolean, nullable=False, default=False)
+    is_active = db.Column(db.Boolean, nullable=False, default=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def to_dict(self, category_slug=None):
+        """Dạng dict mà Catalog và các trang đang dùng"""
+        return {
+            'id': self.id,
+            'name': self.name,
+            'price': self.price,
+            'image': self.image_url or DEFAULT_IMAGE,
+            'description': self.short_description or self.description or '',
+            'category': category_slug,
+            'stock_quantity': self.stock_quantity,
+        }
@@ -0,0 +1,39 @@
+from datetime import datetime
+
+from models import db
+
+
+class Store(db.Model):
+    __tablename__ = 'stores'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(200), nullable=False)
+    slug = db.Column(db.String(100), nullable=False, unique=True, index=True)
+    description = db.Column(db.Text)
+    phone = db.Column(db.String(20))
+    email = db.Column(db.String(120))
+    address = db.Column(db.String(255))
+    primary_color = db.Column(db.String(7), default='#007bff')
+    secondary_color = db.Column(db.String(7), default='#6c757d')
+    is_active = db.Column(db.Boolean, nullable=False, default=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    categories = db.relationship('ProductCategory', backref='store', lazy='select',
+                                 order_by='ProductCategory.sort_order')
+    products = db.relationship('Product', backref='store', lazy='select')
+    users = db.relationship('User', backref='store', lazy='select')
+
+    def to_dict(self):
+        """Bản chụp dữ liệu store, dùng được ngoài session SQLAlchemy"""
+        return {
+            'id': self.id,
+            'slug': self.slug,
+            'name': self.name,
+            'description': self.description or '',
+            'phone': self.phone or '',
+            'email': self.email or '',
+            'address': self.address,
+            'primary_color': self.primary_color,
+            'secondary_color': self.secondary_color,
+        }
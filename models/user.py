@@ -0,0 +1,22 @@
+from werkzeug.security import generate_password_hash, check_password_hash
+
+from models import db
+
+
+class User(db.Model):
+    __tablename__ = 'users'
+    __table_args__ = (db.UniqueConstraint('store_id', 'username'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    store_id = db.Column(db.Integer, db.ForeignKey('stores.id'), nullable=False, index=True)
+    username = db.Column(db.String(80), nullable=False)
+    email = db.Column(db.String(120))
+    full_name = db.Column(db.String(200))
+    role = db.Column(db.String(20), nullable=False, default='staff')
+    password_hash = db.Column(db.String(255), nullable=False)
+
+    def set_password(self, password):
+        self.password_hash = generate_password_hash(password)
+
+    def check_password(self, password):
+        return check_password_hash(self.password_hash, password)
@@ -0,0 +1,125 @@
+"""
+Đặt hàng: ghi đơn trong một transaction, các bước sau đó chạy bằng job nền
+
+Request checkout chỉ ghi đơn và xếp một job `order_placed`; job này tách ra
+các bước trong POST_ORDER_TASKS, nên thêm bước mới không làm checkout chậm đi.
+"""
+
+import os
+import secrets
+from datetime import datetime
+from email.message import EmailMessage
+
+from flask import current_app, render_template
+
+from models import db
+from models.order import Order, OrderItem
+from models.product import Product
+
+# Các bước chạy nền sau khi đặt hàng, mỗi bước là một job riêng (thử lại độc lập)
+POST_ORDER_TASKS = ('decrement_stock', 'send_confirmation_email', 'render_receipt')
+
+_tables_ready = False
+
+
+def ensure_tables():
+    """Tạo bảng đơn hàng nếu chưa có (store mặc định chạy được khi chưa `flask init-db`)"""
+    global _tables_ready
+    if not _tables_ready:
+        db.metadata.create_all(db.engine, tables=[Order.__table__, OrderItem.__table__])
+        _tables_ready = True
+
+
+def new_code():
+    """Mã đơn hàng; tạo trước khi ghi đơn để inventory dùng làm mã phần đã bán"""
+    return secrets.token_urlsafe(12)
+
+
+def place_order(store, lines, customer, code=None):
+    """Ghi đơn hàng và các dòng trong một transaction; lines: (product, quantity, thành tiền)
+
+    Trả về (id, code) của đơn, lấy trước commit để không phải query lại sau đó.
+    """
+    ensure_tables()
+    order = Order(
+        code=code or new_code(),
+        store_id=store.get('id'),
+        customer_name=customer['name'],
+        customer_phone=customer['phone'],
+        customer_email=customer.get('email') or None,
+        total=sum(line_total for _, _, line_total in lines),
+    )
+    order.items = [
+        OrderItem(product_id=product['id'], name=product['name'], unit_price=product['price'],
+                  quantity=quantity, line_total=line_total)
+        for product, quantity, line_total in lines
+    ]
+    db.session.add(order)
+    try:
+        db.session.flush()
+        placed = order.id, order.code
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return placed
+
+
+def init_jobs(jobs, inventory=None):
+    """Đăng ký các job xử lý đơn hàng vào hàng đợi; `inventory` được báo khi database đã trừ tồn kho"""
+
+    @jobs.task()
+    def order_placed(order_id):
+        for name in POST_ORDER_TASKS:
+            jobs.enqueue(name, {'order_id': order_id})
+
+    @jobs.task()
+    def decrement_stock(order_id):
+        order = db.session.get(Order, order_id)
+        if order is None or order.store_id is None:
+            # Store mặc định: catalog không nằm trong database, phần đã bán chỉ được tính trong inventory
+            return
+        if not order.stock_committed:
+            # Cập nhật tồn kho và đánh dấu trong cùng transaction, chạy lại không trừ hai lần
+            for item in order.items:
+                db.session.execute(
+                    db.update(Product)
+                    .where(Product.id == item.product_id, Product.store_id == order.store_id)
+                    .values(stock_quantity=Product.stock_quantity - item.quantity)
+                )
+            order.stock_committed = True
+            db.session.commit()
+        if inventory is not None:
+            inventory.settled(order.code)
+
+    @jobs.task()
+    def send_confirmation_email(order_id):
+        order = db.session.get(Order, order_id)
+        if order is None or order.confirmation_sent_at is not None or not order.customer_email:
+            return
+        message = EmailMessage()
+        message['Subject'] = f'Xác nhận đơn hàng {order.code}'
+        message['From'] = os.environ.get('MAIL_FROM', 'no-reply@store.local')
+        message['To'] = order.customer_email
+        message.set_content(render_template('emails/order_confirmation.txt', order=order))
+        host = os.environ.get('SMTP_HOST')
+        if host:
+            import smtplib
+
+            with smtplib.SMTP(host, int(os.environ.get('SMTP_PORT', 25)), timeout=30) as smtp:
+                smtp.send_message(message)
+        else:
+            current_app.logger.info('Chưa cấu hình SMTP_HOST, bỏ qua email đơn %s', order.code)
+        order.confirmation_sent_at = datetime.utcnow()
+        db.session.commit()
+
+    @jobs.task()
+    def render_receipt(order_id):
+        order = db.session.get(Order, order_id)
+        if order is None:
+            return
+        directory = os.path.join(current_app.instance_path, 'receipts')
+        os.makedirs(directory, exist_ok=True)
+        html = render_template('receipt.html', order=order)
+        with open(os.path.join(directory, f'{order.code}.html'), 'w', encoding='utf-8') as f:
+            f.write(html)
@@ -0,0 +1,153 @@
+"""
+Giới hạn tần suất request bằng token bucket, dùng chung giữa các worker
+
+Mỗi route có một giới hạn dạng "30/10s" (30 request mỗi 10 giây, dồn tối đa 30),
+áp riêng cho từng phiên (cookie session) và cho từng client (IP, giới hạn gấp
+`client_factor` lần vì nhiều người có thể chung một IP). Vượt giới hạn thì
+trả 429 kèm Retry-After. `enforce` áp một giới hạn cho key bất kỳ (vd: quota
+request của mỗi store).
+
+Bucket tính theo GCRA (tương đương token bucket): mỗi key chỉ giữ `tat`, thời
+điểm bucket sẽ đầy trở lại nếu không có request mới. Request được nhận khi
+max(tat, now) + interval - now <= period, và tat tăng thêm interval.
+
+Các bucket nằm trong một bảng băm kích thước cố định trong file mmap dùng chung
+giữa các worker (MAP_SHARED): mỗi key có một cụm PROBE ô, khóa bằng fcntl.lockf
+trên đúng vùng byte đó (giữa các process) và một threading.Lock (giữa các thread).
+Một lần kiểm tra chỉ vài micro giây, không có transaction hay fsync nào. Bảng
+đầy thì bucket cũ nhất trong cụm bị thay, tức là giới hạn chỉ có thể lỏng hơn.
+"""
+
+import fcntl
+import hashlib
+import logging
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+
+from flask import request, session
+from werkzeug.exceptions import TooManyRequests
+
+logger = logging.getLogger(__name__)
+
+LIMIT_RE = re.compile(r'^\s*(\d+)\s*/\s*(\d*)\s*(s|m|h)\s*$')
+UNITS = {'s': 1, 'm': 60, 'h': 3600}
+
+SLOT = struct.Struct('<Qd')  # băm của key (0: ô trống), tat
+PROBE = 4                    # số ô mỗi cụm, một key luôn nằm trong cụm của nó
+THREAD_LOCKS = 64
+
+
+class Limit:
+    """`capacity` request tối đa dồn lại, hồi `capacity` token mỗi `period` giây"""
+
+    def __init__(self, capacity, period):
+        self.capacity = capacity
+        self.period = period
+        self.interval = period / capacity  # thời gian hồi một token
+
+    @classmethod
+    def parse(cls, text):
+        """'30/10s', '5/m', '1000/h'"""
+        match = LIMIT_RE.match(text)
+        if match is None or int(match.group(1)) <= 0:
+            raise ValueError(f'Giới hạn không hợp lệ: {text!r} (vd: 30/10s, 5/m)')
+        return cls(int(match.group(1)), int(match.group(2) or 1) * UNITS[match.group(3)])
+
+    def scaled(self, factor):
+        return Limit(self.capacity * factor, self.period)
+
+
+def parse_limits(text):
+    """'add_to_cart=30/10s, checkout=5/m' -> {endpoint: Limit}"""
+    limits = {}
+    for item in filter(None, (part.strip() for part in text.split(','))):
+        endpoint, _, limit = item.partition('=')
+        limits[endpoint.strip()] = Limit.parse(limit)
+    return limits
+
+
+class RateLimiter:
+    def __init__(self, path, limits=None, client_factor=4, slots=65536):
+        self.path = path
+        self.limits = dict(limits or {})
+        self.client_limits = {endpoint: limit.scaled(client_factor) for endpoint, limit in self.limits.items()}
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        # Các worker dùng chung một file: lấy kích thước lớn nhất nếu cấu hình lệch nhau
+        size = max(slots * SLOT.size, os.fstat(self._fd).st_size)
+        size -= size % (PROBE * SLOT.size)
+        if os.fstat(self._fd).st_size < size:
+            os.ftruncate(self._fd, size)
+        self._map = mmap.mmap(self._fd, size)
+        self._groups = size // (PROBE * SLOT.size)
+        self._locks = [threading.Lock() for _ in range(THREAD_LOCKS)]
+
+    def init_app(self, app):
+        app.before_request(self.check_request)
+
+    def hit(self, key, limit, period, now=None):
+        """Lấy một token của bucket `key`; trả về 0 nếu được phép, ngược lại số giây cần chờ"""
+        now = time.time() if now is None else now
+        digest = int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'little') or 1
+        group = digest % self._groups
+        start = group * PROBE * SLOT.size
+        with self._locks[group % THREAD_LOCKS]:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, PROBE * SLOT.size, start)
+            try:
+                # Ô của key, nếu không có thì ô trống/hết tác dụng (tat < now), cuối cùng là ô cũ nhất
+                chosen, tat = None, now
+                oldest, oldest_tat = start, float('inf')
+                for offset in range(start, start + PROBE * SLOT.size, SLOT.size):
+                    slot_digest, slot_tat = SLOT.unpack_from(self._map, offset)
+                    if slot_digest == digest:
+                        chosen, tat = offset, slot_tat
+                        break
+                    if slot_tat < oldest_tat:
+                        oldest, oldest_tat = offset, slot_tat
+                if chosen is None:
+                    chosen = oldest
+                tat = max(tat, now) + limit.interval
+                if tat - now > period:
+                    return tat - now - period
+                SLOT.pack_into(self._map, chosen, digest, tat)
+                return 0
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, PROBE * SLOT.size, start)
+
+    def check(self, endpoint, client, session_id=None):
+        """Số giây cần chờ nếu client/phiên đã vượt giới hạn của endpoint, 0 nếu được phép"""
+        limit = self.limits.get(endpoint)
+        if limit is None:
+            return 0
+        try:
+            wait = self.hit(f'{endpoint}:c:{client}', self.client_limits[endpoint], limit.period)
+            if not wait and session_id:
+                wait = self.hit(f'{endpoint}:s:{session_id}', limit, limit.period)
+        except OSError:
+            logger.exception('Lỗi store rate limit, cho request đi qua')
+            return 0
+        return wait
+
+    def enforce(self, key, limit):
+        """Lấy một token của bucket `key`, raise 429 (kèm Retry-After) nếu đã hết"""
+        try:
+            wait = self.hit(key, limit, limit.period)
+        except OSError:
+            logger.exception('Lỗi store rate limit, cho request đi qua')
+            return
+        if wait:
+            raise TooManyRequests(retry_after=max(int(wait + 0.999), 1))
+
+    def check_request(self):
+        """before_request: raise 429 (kèm Retry-After) khi vượt giới hạn của route"""
+        if request.endpoint not in self.limits:
+            return
+        wait = self.check(request.endpoint, request.remote_addr, session.get('cart_id'))
+        if wait:
+            raise TooManyRequests(retry_after=max(int(wait + 0.999), 1))
@@ -0,0 +1,73 @@
+"""
+Trang HTML render sẵn (lưu trong cache, xem cache.py) và cache các mảnh HTML dùng lại
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+# Ký tự đánh dấu chỗ cần ghép giá trị theo session (vd: số lượng giỏ hàng)
+SLOT = '\x00'
+
+
+class RenderedPage:
+    """Một trang đã render, tách thành các mảnh bytes quanh các SLOT"""
+
+    def __init__(self, version, html):
+        self.version = version
+        self.parts = tuple(part.encode('utf-8') for part in html.split(SLOT))
+        self.digest = hashlib.sha1(b''.join(self.parts)).hexdigest()[:20]
+        self.last_modified = int(time.time())
+
+    def render(self, *values):
+        """Ghép các giá trị động vào giữa các mảnh tĩnh"""
+        chunks = [self.parts[0]]
+        for value, part in zip(values, self.parts[1:]):
+            chunks.append(str(value).encode('utf-8'))
+            chunks.append(part)
+        return b''.join(chunks)
+
+    def stream(self, *values, size=64 * 1024):
+        """Như render nhưng trả về từng chunk tối đa `size` bytes (trang lớn gửi dần từ cache)"""
+        chunks = [self.parts[0]]
+        for value, part in zip(values, self.parts[1:]):
+            chunks.append(str(value).encode('utf-8'))
+            chunks.append(part)
+        for chunk in chunks:
+            for start in range(0, len(chunk), size):
+                yield chunk[start:start + size]
+
+    def etag(self, *values):
+        """ETag mạnh: digest phần tĩnh + các giá trị động"""
+        return '-'.join([self.digest, *map(str, values)])
+
+
+class FragmentCache:
+    """LRU cho các mảnh HTML dùng lại nhiều lần (vd: thẻ sản phẩm)
+
+    Khóa là chính dữ liệu đầu vào của mảnh nên không cần xóa khi dữ liệu đổi:
+    sản phẩm sửa giá/tên sẽ có khóa mới, khóa cũ tự bị đẩy ra khỏi LRU.
+    """
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._fragments = OrderedDict()
+
+    def get(self, key, build):
+        with self._lock:
+            fragment = self._fragments.get(key)
+            if fragment is not None:
+                self._fragments.move_to_end(key)
+                return fragment
+        fragment = build()
+        with self._lock:
+            self._fragments[key] = fragment
+            if len(self._fragments) > self.max_entries:
+                self._fragments.popitem(last=False)
+        return fragment
+
+    def clear(self):
+        with self._lock:
+            self._fragments.clear()
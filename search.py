@@ -0,0 +1,230 @@
+"""
+Tìm kiếm sản phẩm không dấu bằng inverted index trong memory
+"""
+
+import bisect
+import heapq
+import math
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+
+TOKEN_RE = re.compile(r'\w+')
+
+# Trọng số theo trường: khớp ở tên quan trọng hơn ở mô tả
+FIELD_WEIGHTS = (('name', 3), ('description', 1))
+
+# Số term tối đa mở rộng từ một tiền tố (gõ "b" không được quét cả từ điển)
+MAX_PREFIX_TERMS = 64
+
+# Số kết quả query gần đây được giữ lại (type-ahead lặp lại rất nhiều)
+RESULT_CACHE_SIZE = 1024
+
+
+def fold(text):
+    """Bỏ dấu tiếng Việt và chữ hoa: 'Phở bò đặc biệt' -> 'pho bo dac biet'"""
+    text = unicodedata.normalize('NFD', text.casefold().replace('đ', 'd'))
+    return ''.join(ch for ch in text if not unicodedata.combining(ch))
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(fold(text or ''))
+
+
+def term_weights(product):
+    """term -> tổng trọng số của term trong các trường của sản phẩm"""
+    weights = {}
+    for field, weight in FIELD_WEIGHTS:
+        for term in tokenize(product.get(field)):
+            weights[term] = weights.get(term, 0) + weight
+    return weights
+
+
+class SearchIndex:
+    """Inverted index term -> {product_id: trọng số}, cập nhật từng sản phẩm"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._postings = {}   # term -> {product_id: weight}
+        self._terms = []      # từ điển đã sắp xếp, để tìm theo tiền tố
+        self._doc_terms = {}  # product_id -> các term của sản phẩm
+        self._results = OrderedDict()  # (terms, prefix, limit) -> ids, xóa khi index đổi
+        self._ranked_terms = {}  # term -> thứ tự và các mức trọng số, xem _ranked()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock'], state['_results'], state['_ranked_terms']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+        self._results = OrderedDict()
+        self._ranked_terms = {}
+
+    def __len__(self):
+        return len(self._doc_terms)
+
+    def add(self, product):
+        weights = term_weights(product)
+        with self._lock:
+            self._results.clear()
+            self._remove(product['id'])
+            for term, weight in weights.items():
+                postings = self._postings.get(term)
+                if postings is None:
+                    postings = self._postings[term] = {}
+                    bisect.insort(self._terms, term)
+                postings[product['id']] = weight
+                self._ranked_terms.pop(term, None)
+            self._doc_terms[product['id']] = tuple(weights)
+
+    def add_many(self, products):
+        """Thêm nhiều sản phẩm một lần (dựng catalog mới): sắp xếp từ điển một lần ở cuối"""
+        with self._lock:
+            self._results.clear()
+            self._ranked_terms.clear()
+            for product in products:
+                weights = term_weights(product)
+                self._remove(product['id'])
+                for term, weight in weights.items():
+                    postings = self._postings.get(term)
+                    if postings is None:
+                        postings = self._postings[term] = {}
+                    postings[product['id']] = weight
+                self._doc_terms[product['id']] = tuple(weights)
+            self._terms = sorted(self._postings)
+
+    def remove(self, product_id):
+        with self._lock:
+            self._results.clear()
+            self._remove(product_id)
+
+    def _remove(self, product_id):
+        for term in self._doc_terms.pop(product_id, ()):
+            self._ranked_terms.pop(term, None)
+            postings = self._postings[term]
+            del postings[product_id]
+            if not postings:
+                del self._postings[term]
+                del self._terms[bisect.bisect_left(self._terms, term)]
+
+    def search(self, query, limit=20):
+        """Id sản phẩm khớp mọi từ trong query, xếp hạng theo điểm giảm dần
+
+        Từ cuối được khớp theo tiền tố (gõ dần), trừ khi query kết thúc bằng khoảng trắng.
+        """
+        terms = tokenize(query)
+        if not terms:
+            return []
+        prefix = None if query[-1:].isspace() else terms.pop()
+        key = (tuple(terms), prefix, limit)
+        with self._lock:
+            result = self._results.get(key)
+            if result is None:
+                result = self._search(terms, prefix, limit)
+                self._results[key] = result
+                if len(self._results) > RESULT_CACHE_SIZE:
+                    self._results.popitem(last=False)
+            else:
+                self._results.move_to_end(key)
+            return result
+
+    def _search(self, terms, prefix, limit):
+        # Mỗi từ trong query ứng với một nhóm term (nhiều term nếu là tiền tố)
+        groups = [[term] if term in self._postings else [] for term in terms]
+        if prefix is not None:
+            groups.append(self._prefix_terms(prefix))
+        if not all(groups):
+            return []
+
+        total = len(self._doc_terms)
+        # Điểm của sản phẩm = tổng theo nhóm của max(trọng số x idf) trên các term của nhóm
+        weighted = [[(term, math.log(1 + total / len(self._postings[term]))) for term in group]
+                    for group in groups]
+        if len(weighted) == 1:
+            return self._top_single(weighted[0], limit)
+        return self._top_levels(weighted, limit)
+
+    def _top_single(self, group, limit):
+        """`limit` kết quả tốt nhất của query một từ: đọc lần lượt các id theo điểm giảm dần
+        (gộp các term của tiền tố), dừng khi đủ, không phải chấm điểm mọi sản phẩm khớp"""
+        stream = heapq.merge(*(scored(self._postings[term], idf, self._ranked(term)[0]) for term, idf in group))
+        found = []
+        seen = set()
+        for _, product_id in stream:
+            if product_id not in seen:
+                seen.add(product_id)
+                found.append(product_id)
+                if len(found) == limit:
+                    break
+        return found
+
+    def _top_levels(self, groups, limit):
+        """`limit` kết quả tốt nhất của query nhiều từ
+
+        Trọng số chỉ có vài giá trị nên mỗi term chia posting thành vài mức (tập id cùng
+        trọng số). Duyệt các tổ hợp mức (một mức của một term mỗi nhóm) theo tổng điểm giảm
+        dần; id khớp tổ hợp là giao các tập id (tầng C), và tổ hợp đầu tiên chứa một id cho
+        đúng điểm của nó. Dừng khi tổ hợp tiếp theo kém hơn kết quả thứ `limit`.
+        """
+        groups = [sorted(((weight * idf, ids) for term, idf in group for weight, ids in self._ranked(term)[1]),
+                         key=lambda level: -level[0]) for group in groups]
+
+        def total(indexes):
+            score = 0
+            for levels, index in zip(groups, indexes):
+                score += levels[index][0]
+            return score
+
+        start = (0,) * len(groups)
+        heap = [(-total(start), start)]
+        queued = {start}
+        found = []  # (-điểm, id), tốt nhất ở đầu
+        while heap:
+            negative, indexes = heapq.heappop(heap)
+            if len(found) >= limit and negative > found[-1][0]:
+                break
+            sets = sorted((levels[index][1] for levels, index in zip(groups, indexes)), key=len)
+            ids = sets[0].intersection(*sets[1:])
+            if ids:
+                ids.difference_update(product_id for _, product_id in found)
+                found.extend((negative, product_id) for product_id in sorted(ids)[:limit])
+                found.sort()
+                del found[limit:]
+            for position, levels in enumerate(groups):
+                if indexes[position] + 1 < len(levels):
+                    following = indexes[:position] + (indexes[position] + 1,) + indexes[position + 1:]
+                    if following not in queued:
+                        queued.add(following)
+                        heapq.heappush(heap, (-total(following), following))
+        return [product_id for _, product_id in found]
+
+    def _ranked(self, term):
+        """(id theo trọng số giảm dần rồi id tăng dần, [(trọng số, tập id)] giảm dần) của term;
+        dựng lần đầu term được tìm, bỏ khi posting của term đổi"""
+        ranked = self._ranked_terms.get(term)
+        if ranked is None:
+            postings = self._postings[term]
+            levels = {}
+            for product_id, weight in postings.items():
+                levels.setdefault(weight, set()).add(product_id)
+            ranked = self._ranked_terms[term] = (
+                sorted(postings, key=lambda product_id: (-postings[product_id], product_id)),
+                sorted(levels.items(), key=lambda level: -level[0]))
+        return ranked
+
+    def _prefix_terms(self, prefix):
+        start = bisect.bisect_left(self._terms, prefix)
+        group = []
+        for term in self._terms[start:start + MAX_PREFIX_TERMS]:
+            if not term.startswith(prefix):
+                break
+            group.append(term)
+        return group
+
+
+def scored(postings, idf, ranked):
+    for product_id in ranked:
+        yield -postings[product_id] * idf, product_id
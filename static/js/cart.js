@@ -0,0 +1,95 @@
+// Thêm vào giỏ không tải lại trang: gom các lần bấm trong một khoảng ngắn thành
+// một request POST /api/cart. Không có JavaScript thì form vẫn gửi như cũ.
+// Trang chủ là bản chung cho mọi người dùng (CDN giữ được): số món trong giỏ lấy sau qua /api/cart/summary.
+(function () {
+    var DELAY = 200;
+    var pending = {};
+    var timer = null;
+    // Trang lấy từ CDN không đi qua session, request phải tự mang theo store đang xem;
+    // luôn gửi store (rỗng là store mặc định) để không rơi về store lưu trong session
+    var store = new URLSearchParams(location.search).get('store') || '';
+
+    function storeUrl(path) {
+        return path + '?store=' + encodeURIComponent(store);
+    }
+
+    function newKey() {
+        if (window.crypto && crypto.randomUUID) {
+            return crypto.randomUUID();
+        }
+        return Date.now().toString(36) + Math.random().toString(36).slice(2);
+    }
+
+    function updateBadge(count) {
+        document.querySelectorAll('[data-cart-count]').forEach(function (badge) {
+            badge.textContent = count;
+        });
+    }
+
+    function send(operations, key, retries) {
+        fetch(storeUrl('/api/cart'), {
+            method: 'POST',
+            credentials: 'same-origin',
+            headers: {'Content-Type': 'application/json', 'Idempotency-Key': key},
+            body: JSON.stringify({operations: operations})
+        }).then(function (response) {
+            if (response.status === 429 && retries > 0) {
+                // Bị giới hạn tần suất: chờ theo Retry-After rồi gửi lại cùng key
+                var wait = Number(response.headers.get('Retry-After')) || 1;
+                setTimeout(function () { send(operations, key, retries - 1); }, wait * 1000);
+                return;
+            }
+            return response.json().then(function (cart) {
+                if (cart.count !== undefined) {
+                    updateBadge(cart.count);
+                }
+                if (response.status === 409 && cart.out_of_stock) {
+                    alert('Sản phẩm vừa hết hàng, không thể thêm vào giỏ.');
+                }
+            });
+        }).catch(function () {
+            // Lỗi mạng: gửi lại cùng key, server không áp lô thao tác hai lần
+            if (retries > 0) {
+                setTimeout(function () { send(operations, key, retries - 1); }, 1000);
+            }
+        });
+    }
+
+    function flush() {
+        var operations = Object.keys(pending).map(function (productId) {
+            return {op: 'increment', product_id: Number(productId), quantity: pending[productId]};
+        });
+        pending = {};
+        timer = null;
+        send(operations, newKey(), 3);
+    }
+
+    document.addEventListener('submit', function (event) {
+        var form = event.target;
+        if (!form.matches('form[action^="/add-to-cart"]') || !window.fetch) {
+            return;
+        }
+        event.preventDefault();
+        var productId = form.elements.product_id.value;
+        pending[productId] = (pending[productId] || 0) + 1;
+        document.querySelectorAll('[data-cart-count]').forEach(function (badge) {
+            badge.textContent = Number(badge.textContent) + 1;
+        });
+        clearTimeout(timer);
+        timer = setTimeout(flush, DELAY);
+    });
+
+    // Badge để trống trong shell: điền số món của phiên này (trừ khi đã bấm thêm vào giỏ trong lúc chờ)
+    var badges = document.querySelectorAll('[data-cart-count]');
+    if (window.fetch && Array.prototype.some.call(badges, function (badge) { return badge.textContent === ''; })) {
+        fetch(storeUrl('/api/cart/summary'), {credentials: 'same-origin'}).then(function (response) {
+            return response.json();
+        }).then(function (summary) {
+            badges.forEach(function (badge) {
+                if (badge.textContent === '') {
+                    badge.textContent = summary.count;
+                }
+            });
+        }).catch(function () {});
+    }
+}());
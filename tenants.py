@@ -0,0 +1,203 @@
+"""
+Xác định store (tenant) của request và nạp catalog của store từ database
+
+Store được chọn theo subdomain (`demo.shop.vn` khi STORE_DOMAIN=shop.vn) hoặc
+`?store=demo`. Mỗi store có catalog (kèm index tìm kiếm) riêng, giữ trong bộ nhớ
+theo ngân sách chung `catalog_bytes`; catalog của một store vượt quota
+`tenant_catalog_bytes` chỉ được giữ khi còn chỗ trống và bị bỏ trước tiên khi
+store khác cần chỗ, nên một store lớn không đẩy được catalog của store nhỏ ra.
+Catalog vượt quota không còn chỗ được giữ trong `overflow_catalogs` slot riêng
+ngoài ngân sách (LRU), để store lớn không phải dựng lại catalog ở mỗi request; vài slot
+để hai ba store lớn xem xen kẽ không đẩy nhau ra rồi nạp lại toàn bộ catalog.
+"""
+
+import logging
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from catalog import Catalog
+
+logger = logging.getLogger(__name__)
+
+
+def tenant_slug(host, domain):
+    """Slug store từ Host: 'demo.shop.vn:8000' với domain 'shop.vn' -> 'demo'
+
+    None nếu không có domain, Host không phải subdomain một cấp của domain, hoặc là www.
+    """
+    if not domain:
+        return None
+    host = host.rsplit(':', 1)[0].lower()
+    suffix = '.' + domain.lower().strip('.')
+    if not host.endswith(suffix):
+        return None
+    slug = host[:-len(suffix)]
+    if not slug or '.' in slug or slug == 'www':
+        return None
+    return slug
+
+
+def deep_sizeof(obj):
+    """Ước lượng số byte của obj và mọi object nó trỏ tới (object dùng chung chỉ tính một lần)"""
+    seen = set()
+    stack = [obj]
+    total = 0
+    while stack:
+        item = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        total += sys.getsizeof(item)
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            stack.extend(item)
+        elif hasattr(item, '__dict__') and not isinstance(item, type):
+            stack.append(item.__dict__)
+    return total
+
+
+class StoreResolver:
+    """Cache store theo slug và catalog theo store để mỗi request không phải query lại
+
+    Khi cache hết hạn, một store tốn 1 query, catalog của store tốn 1 query
+    (products join categories), không phụ thuộc số sản phẩm. Cache store giữ tối
+    đa `max_stores` slug (kể cả slug không tồn tại), bỏ slug lâu không dùng nhất.
+    `on_change(store, cũ, mới)` được gọi khi nạp lại thấy dữ liệu catalog đã đổi.
+    """
+
+    def __init__(self, ttl=60, max_stores=10000, catalog_bytes=256 * 1024 * 1024,
+                 tenant_catalog_bytes=32 * 1024 * 1024, overflow_catalogs=4, on_change=None):
+        self.ttl = ttl
+        self.max_stores = max_stores
+        self.catalog_bytes = catalog_bytes
+        self.tenant_catalog_bytes = min(tenant_catalog_bytes, catalog_bytes)
+        self.overflow_catalogs = overflow_catalogs
+        self.on_change = on_change
+        self._lock = threading.Lock()
+        self._stores = OrderedDict()    # slug -> (expires_at, store dict hoặc None)
+        self._catalogs = OrderedDict()  # store id -> (expires_at, Catalog, số byte), dùng gần nhất ở cuối
+        self._catalog_total = 0
+        self._overflow = OrderedDict()  # như _catalogs, cho catalog vượt quota khi hết chỗ (ngoài ngân sách)
+        self._loading = {}              # store id -> lock của thread đang nạp catalog
+
+    def store(self, slug):
+        entry = self._stores.get(slug)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1]
+        from models.store import Store
+
+        store = Store.query.filter_by(slug=slug, is_active=True).first()
+        store = store.to_dict() if store else None
+        with self._lock:
+            self._stores[slug] = (time.monotonic() + self.ttl, store)
+            self._stores.move_to_end(slug)
+            if len(self._stores) > self.max_stores:
+                self._stores.popitem(last=False)
+        return store
+
+    def catalog(self, store):
+        catalog = self._cached_catalog(store['id'])
+        if catalog is not None:
+            return catalog
+        # Một thread nạp cho mỗi store, các thread khác của cùng store chờ rồi dùng kết quả
+        with self._load_lock(store['id']):
+            catalog = self._cached_catalog(store['id'])
+            if catalog is not None:
+                return catalog
+            products = load_store_products(store['id'])
+            entry = self._catalogs.get(store['id']) or self._overflow.get(store['id'])
+            if entry is not None and list(entry[1]) == products:
+                # Dữ liệu không đổi: giữ catalog cũ để cache trang không bị render lại
+                catalog, size = entry[1], entry[2]
+            else:
+                catalog = Catalog(products)
+                size = deep_sizeof(catalog)
+            self._keep(store['id'], catalog, size)
+        if entry is not None and catalog is not entry[1] and self.on_change is not None:
+            try:
+                self.on_change(store, entry[1], catalog)
+            except Exception:
+                logger.exception('Lỗi khi xử lý catalog đổi của store %s', store['id'])
+        return catalog
+
+    def catalog_usage(self, overflow=False):
+        """{store id: số byte ước lượng} của các catalog đang giữ trong ngân sách (hoặc trong slot riêng)"""
+        with self._lock:
+            catalogs = self._overflow if overflow else self._catalogs
+            return {store_id: entry[2] for store_id, entry in catalogs.items()}
+
+    def invalidate(self, slug=None):
+        with self._lock:
+            if slug is None:
+                self._stores.clear()
+                self._catalogs.clear()
+                self._overflow.clear()
+                self._catalog_total = 0
+                return
+            entry = self._stores.pop(slug, None)
+            if entry is not None and entry[1] is not None:
+                self._forget(entry[1]['id'])
+
+    def _cached_catalog(self, store_id):
+        catalogs = self._catalogs
+        entry = catalogs.get(store_id)
+        if entry is None:
+            catalogs = self._overflow
+            entry = catalogs.get(store_id)
+        if entry is None or entry[0] <= time.monotonic():
+            return None
+        with self._lock:
+            if store_id in catalogs:
+                catalogs.move_to_end(store_id)
+        return entry[1]
+
+    def _load_lock(self, store_id):
+        with self._lock:
+            if len(self._loading) > 1024:
+                self._loading = {key: lock for key, lock in self._loading.items() if lock.locked()}
+            return self._loading.setdefault(store_id, threading.Lock())
+
+    def _keep(self, store_id, catalog, size):
+        with self._lock:
+            self._forget(store_id)
+            if size > self.tenant_catalog_bytes and self._catalog_total + size > self.catalog_bytes:
+                # Vượt quota và hết chỗ trống: giữ trong slot riêng (bỏ store lâu không dùng nhất
+                # trong các slot), không lấy chỗ của catalog nào trong ngân sách
+                logger.warning('Catalog của store %s (%d byte) vượt quota %d byte, giữ ngoài ngân sách',
+                               store_id, size, self.tenant_catalog_bytes)
+                if self.overflow_catalogs > 0:
+                    self._overflow[store_id] = (time.monotonic() + self.ttl, catalog, size)
+                    while len(self._overflow) > self.overflow_catalogs:
+                        self._overflow.popitem(last=False)
+                return
+            self._catalogs[store_id] = (time.monotonic() + self.ttl, catalog, size)
+            self._catalog_total += size
+            while self._catalog_total > self.catalog_bytes:
+                # Bỏ catalog vượt quota trước, sau đó tới catalog lâu không dùng nhất
+                victim = next((key for key, entry in self._catalogs.items()
+                               if entry[2] > self.tenant_catalog_bytes), None)
+                self._forget(next(iter(self._catalogs)) if victim is None else victim)
+
+    def _forget(self, store_id):
+        self._overflow.pop(store_id, None)
+        entry = self._catalogs.pop(store_id, None)
+        if entry is not None:
+            self._catalog_total -= entry[2]
+
+
+def load_store_products(store_id):
+    """Tất cả sản phẩm đang bán của store, trong một query"""
+    from models import db
+    from models.product import Product, ProductCategory
+
+    rows = db.session.execute(
+        db.select(Product, ProductCategory.slug)
+        .outerjoin(ProductCategory, Product.category_id == ProductCategory.id)
+        .where(Product.store_id == store_id, Product.is_active.is_(True))
+        .order_by(Product.sort_order, Product.id)
+    )
+    return [product.to_dict(category_slug) for product, category_slug in rows]
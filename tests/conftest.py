@@ -0,0 +1,42 @@
+"""
+Cấu hình chung cho test: app chạy với database, cache, giỏ hàng trong thư mục tạm
+và không có job nền, rate limit, snapshot catalog
+"""
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_directory = tempfile.mkdtemp(prefix='shop-test-')
+os.environ.update(
+    DATABASE_URL=f"sqlite:///{os.path.join(_directory, 'shop.sqlite3')}",
+    CACHE_URL='memory://',
+    CART_STORE_URL='memory://',
+    CATALOG_SNAPSHOT='',
+    JOB_WORKERS='0',
+    JOB_QUEUE_PATH=os.path.join(_directory, 'jobs.sqlite3'),
+    INVENTORY_PATH=os.path.join(_directory, 'inventory.sqlite3'),
+    RATE_LIMITS='',
+    RATE_LIMIT_PATH=os.path.join(_directory, 'ratelimit.bin'),
+    TENANT_RATE_LIMIT='',
+    IMAGE_CACHE_DIR=os.path.join(_directory, 'images'),
+)
+
+
+@pytest.fixture(scope='session')
+def shop():
+    import app as shop
+
+    with shop.app.app_context():
+        shop.db.create_all()
+    return shop
+
+
+@pytest.fixture
+def client(shop):
+    return shop.app.test_client()
@@ -0,0 +1,49 @@
+import threading
+
+import pytest
+
+
+@pytest.fixture
+def async_views(shop):
+    shop.use_async_views(True)
+    yield shop
+    shop.use_async_views(False)
+
+
+def test_async_add_and_remove(async_views, client):
+    response = client.post('/add-to-cart', data={'product_id': '1'})
+    assert response.status_code == 302
+
+    summary = client.get('/api/cart/summary').get_json()
+    assert summary['count'] == 1
+
+    response = client.post('/remove/1')
+    assert response.status_code == 302
+    assert client.get('/api/cart/summary').get_json()['count'] == 0
+
+
+def test_sync_and_async_share_cart_summary(shop, client):
+    client.post('/add-to-cart', data={'product_id': '2'})
+    shop.use_async_views(True)
+    try:
+        client.post('/add-to-cart', data={'product_id': '2'})
+    finally:
+        shop.use_async_views(False)
+    assert client.get('/api/cart/summary').get_json()['count'] == 2
+
+
+@pytest.mark.parametrize('name, path', [('home_response', '/'), ('cart_response', '/cart')])
+@pytest.mark.parametrize('stream', ['0', '1'])
+def test_async_pages_render_in_io_pool(async_views, client, monkeypatch, name, path, stream):
+    threads = []
+    render = getattr(async_views, name)
+
+    def spy(*args):
+        threads.append(threading.current_thread().name)
+        return render(*args)
+    monkeypatch.setattr(async_views, name, spy)
+    monkeypatch.setattr(async_views, 'STREAM_PAGES', stream)
+    client.post('/add-to-cart', data={'product_id': '1'})
+    body = client.get(path).get_data(as_text=True)
+    assert threads[0].startswith('io')
+    assert 'store=' in body
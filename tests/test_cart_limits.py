@@ -0,0 +1,49 @@
+import pytest
+
+
+@pytest.fixture(scope='module')
+def product_id(shop):
+    from models import db
+    from models.product import Product
+    from models.store import Store
+
+    with shop.app.app_context():
+        store = Store(name='Giới hạn', slug='gioi-han')
+        db.session.add(store)
+        db.session.flush()
+        product = Product(store_id=store.id, name='Phở', slug='pho', price=50000, stock_quantity=100)
+        db.session.add(product)
+        db.session.commit()
+        product_id = product.id
+    shop.stores.invalidate()
+    return product_id
+
+
+def post(client, product_id, **operation):
+    return client.post('/api/cart?store=gioi-han', json={'operations': [dict(product_id=product_id, **operation)]})
+
+
+@pytest.mark.parametrize('quantity', [2 ** 62, 10 ** 30])
+def test_huge_quantity_is_rejected(product_id, client, quantity):
+    assert post(client, product_id, op='set', quantity=quantity).status_code == 400
+    assert post(client, product_id, op='increment', quantity=quantity).status_code == 400
+
+
+def test_line_limit(shop, product_id, client):
+    assert post(client, product_id, op='set', quantity=shop.MAX_QUANTITY + 1).status_code == 400
+    assert post(client, product_id, op='set', quantity=2).status_code == 200
+
+
+def test_cart_limit(shop):
+    catalog = {str(index): {'id': index} for index in range(20)}
+    operations = [{'op': 'set', 'product_id': str(index), 'quantity': shop.MAX_QUANTITY} for index in range(20)]
+    with pytest.raises(ValueError):
+        shop.plan_cart({}, operations, catalog)
+
+
+def test_form_add_respects_line_limit(shop, product_id, client):
+    assert client.post('/add-to-cart?store=gioi-han', data={'product_id': str(product_id)}).status_code == 302
+    with client.session_transaction() as session:
+        cart_id = f"{session['cart_id']}:gioi-han"
+    shop.cart_store.incr(cart_id, product_id, amount=shop.MAX_QUANTITY - 1)
+    assert client.post('/add-to-cart?store=gioi-han', data={'product_id': str(product_id)}).status_code == 400
@@ -0,0 +1,71 @@
+import zlib
+
+import pytest
+
+import compression
+from compression import CACHEABLE, CompressionMiddleware
+
+BODY = ('<p>Bánh mì thịt nướng 25.000đ</p>\n' * 2000).encode()
+
+
+def page(environ, start_response):
+    environ[CACHEABLE] = True
+    start_response('200 OK', [('Content-Type', 'text/html'), ('Content-Length', str(len(BODY))),
+                              ('ETag', '"home-1"')])
+    return [BODY]
+
+
+def get(middleware, encoding='gzip'):
+    captured = {}
+
+    def start_response(status, headers, exc_info=None):
+        captured.update(headers)
+
+    body = b''.join(middleware({'REQUEST_METHOD': 'GET', 'HTTP_ACCEPT_ENCODING': encoding}, start_response))
+    assert captured['Content-Encoding'] == encoding
+    return body
+
+
+@pytest.fixture
+def middleware(monkeypatch):
+    middleware = CompressionMiddleware(page)
+    levels = []
+    real_compress = compression.compress
+    monkeypatch.setattr(compression, 'compress', lambda data, encoding, level: (
+        levels.append(level), real_compress(data, encoding, level))[1])
+    middleware.levels_used = levels
+    return middleware
+
+
+def test_cache_miss_uses_default_level(middleware):
+    body = get(middleware)
+    assert zlib.decompress(body, 31) == BODY
+    assert middleware.levels_used == [compression.DEFAULT_LEVELS['gzip']]
+
+
+def test_reused_body_is_recompressed_off_the_request(middleware, monkeypatch):
+    submitted = []
+    monkeypatch.setattr(middleware.recompressor, 'submit', lambda key, body: submitted.append((key, body)))
+    first = get(middleware)
+    assert get(middleware) == first
+    assert middleware.levels_used == [compression.DEFAULT_LEVELS['gzip']]
+
+    (key, body), = submitted
+    middleware.recompressor.run_one(key, body)
+    assert middleware.levels_used[-1] == compression.CACHED_LEVELS['gzip']
+    assert zlib.decompress(get(middleware), 31) == BODY
+    assert middleware.cache.get(key)[1]
+    assert len(submitted) == 1
+
+
+def test_cacheable_stream_is_kept_after_first_request():
+    def streamed(environ, start_response):
+        environ[CACHEABLE] = True
+        start_response('200 OK', [('Content-Type', 'text/html'), ('ETag', '"home-2"')])
+        return iter([BODY[:1000], BODY[1000:]])
+
+    middleware = CompressionMiddleware(streamed)
+    first = get(middleware)
+    assert zlib.decompress(first, 31) == BODY
+    assert middleware.cache.get(('"home-2"', 'gzip')) is not None
+    assert zlib.decompress(get(middleware), 31) == BODY
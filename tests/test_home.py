@@ -0,0 +1,8 @@
+def test_personalized_home_has_no_last_modified(shop, client, monkeypatch):
+    monkeypatch.setattr(shop.edge, 'ttl', 0)
+    response = client.get('/')
+    assert response.headers['ETag']
+    assert 'Last-Modified' not in response.headers
+    client.post('/add-to-cart', data={'product_id': '1'})
+    modified = client.get('/', headers={'If-Modified-Since': 'Fri, 01 Jan 2100 00:00:00 GMT'})
+    assert modified.status_code == 200
@@ -0,0 +1,107 @@
+import io
+import os
+
+import pytest
+from flask import Flask
+
+import images
+from images import DiskCache, ImageProxy, render_variant
+
+Image = pytest.importorskip('PIL.Image')
+
+
+def png(width, height):
+    image = Image.new('RGB', (width, height))
+    for x in range(0, width, 10):
+        image.paste((x % 256, 80, 160), (x, 0, x + 10, height))
+    output = io.BytesIO()
+    image.save(output, 'PNG')
+    return output.getvalue()
+
+
+@pytest.fixture
+def static(tmp_path):
+    directory = tmp_path / 'static'
+    directory.mkdir()
+    (directory / 'photo.png').write_bytes(png(800, 400))
+    return directory
+
+
+@pytest.fixture
+def proxy(tmp_path, static):
+    products = {
+        1: {'id': 1, 'image': '/photo.png'},
+        2: {'id': 2, 'image': '/missing.png'},
+    }
+    app = Flask(__name__, static_folder=str(static))
+    proxy = ImageProxy(products.get, cache_dir=str(tmp_path / 'cache'), max_bytes=10 * 1024 * 1024)
+    if not proxy.formats:
+        pytest.skip('Pillow không ghi được WebP/AVIF')
+    app.add_url_rule('/images/<int:product_id>/<variant>-<int:density>x.<fmt>', 'image', proxy.serve)
+    proxy.client = app.test_client()
+    return proxy
+
+
+@pytest.mark.parametrize('variant, density, size', [
+    ('card', 1, (300, 200)),
+    ('card', 2, (600, 400)),
+    ('thumb', 1, (50, 50)),
+    ('thumb', 2, (100, 100)),
+])
+def test_render_variant_size_and_format(proxy, variant, density, size):
+    source = png(800, 400)
+    for fmt in proxy.formats:
+        with Image.open(io.BytesIO(render_variant(source, images.VARIANTS[variant], density, fmt))) as image:
+            assert image.format == images.FORMATS[fmt][0]
+            assert image.size == size
+
+
+def test_render_variant_does_not_upscale(proxy):
+    with Image.open(io.BytesIO(render_variant(png(200, 100), images.VARIANTS['card'], 2, 'webp'))) as image:
+        assert image.size == (150, 100)
+
+
+def test_disk_cache_evicts_least_recently_used(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=300)
+    for index, key in enumerate('abc'):
+        cache.put(key, b'x' * 100)
+        os.utime(cache.path(key), (1000 * (index + 1), 1000 * (index + 1)))
+    assert cache.get('a') is not None  # a vừa được dùng, b là lâu nhất
+    cache.put('d', b'x' * 100)
+    assert sorted(os.listdir(tmp_path)) == ['a', 'd']
+    assert cache.get('b') is None
+
+
+def test_serve_renders_and_caches(proxy):
+    response = proxy.client.get(proxy.url({'id': 1, 'image': '/photo.png'}, 'card', 2, 'webp'))
+    assert response.status_code == 200
+    assert response.mimetype == 'image/webp'
+    assert response.headers['Cache-Control'] == images.CACHE_CONTROL
+    with Image.open(io.BytesIO(response.data)) as image:
+        assert image.size == (600, 400)
+
+
+def test_serve_failed_source_redirects_without_retry(proxy, static, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(images.time, 'monotonic', lambda: now[0])
+    url = '/images/2/card-1x.webp'
+
+    response = proxy.client.get(url)
+    assert response.status_code == 302
+    assert response.headers['Location'] == '/missing.png'
+
+    # Ảnh gốc có lại nhưng chưa hết FAILURE_TTL: vẫn chuyển thẳng về ảnh gốc, không thử tải lại
+    (static / 'missing.png').write_bytes(png(400, 300))
+    now[0] += images.FAILURE_TTL - 1
+    assert proxy.client.get(url).status_code == 302
+
+    now[0] += 2
+    assert proxy.client.get(url).status_code == 200
+
+
+def test_picture_escapes_values(proxy):
+    product = {'id': 1, 'image': '/x.png" onerror="alert(1)', 'name': '<b>Phở</b>'}
+    html = proxy.picture(product, 'card', 'class="card-img-top"', store='a" onload="x')
+    assert 'onerror="' not in html and 'onload="' not in html
+    assert '&#34; onerror=&#34;' in html
+    assert 'alt="&lt;b&gt;Phở&lt;/b&gt;"' in html
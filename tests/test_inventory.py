@@ -0,0 +1,108 @@
+import sqlite3
+
+import pytest
+
+import inventory as inventory_module
+from inventory import Inventory, OutOfStock
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(inventory_module.time, 'time', lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def inventory(tmp_path, clock):
+    return Inventory(str(tmp_path / 'inventory.sqlite3'), ttl=60, settle_ttl=30)
+
+
+def test_stock_follows_catalog(inventory):
+    assert not inventory.reserve('cart', 'sku', 1, 0)
+    # Nhập thêm hàng trong database: catalog nạp lại mang tồn kho mới
+    assert inventory.reserve('cart', 'sku', 1, 10)
+    assert inventory.available('sku', 10) == 9
+
+
+def test_sold_stock_counts_until_catalog_catches_up(inventory, clock):
+    inventory.reserve('cart', 'sku', 3, 10)
+    inventory.commit('cart', {'sku': 3}, {'sku': 10}, 'order-1')
+    assert inventory.available('sku', 10) == 7
+
+    # Database đã trừ nhưng worker khác còn catalog cũ trong settle_ttl
+    inventory.settled('order-1')
+    clock[0] += 29
+    assert inventory.available('sku', 10) == 7
+    clock[0] += 2
+    assert inventory.available('sku', 7) == 7
+    assert inventory.available('sku', 10) == 10
+
+
+def test_cancel_returns_sold_stock(inventory):
+    inventory.reserve('cart', 'sku', 2, 2)
+    inventory.commit('cart', {'sku': 2}, {'sku': 2}, 'order-1')
+    with pytest.raises(OutOfStock):
+        inventory.hold('other', {'sku': 1}, {'sku': 2})
+    inventory.cancel('order-1')
+    assert inventory.available('sku', 2) == 2
+
+
+def test_old_schema_is_migrated(tmp_path, clock):
+    path = str(tmp_path / 'old.sqlite3')
+    db = sqlite3.connect(path)
+    db.executescript('''
+        CREATE TABLE stock (sku TEXT PRIMARY KEY, on_hand INTEGER NOT NULL, reserved INTEGER NOT NULL DEFAULT 0);
+        INSERT INTO stock VALUES ('sku', 0, 2);
+    ''')
+    db.close()
+    assert Inventory(path).available('sku', 10) == 8
+
+
+def test_restocked_product_can_be_added_again(shop, client):
+    from models import db
+    from models.product import Product
+    from models.store import Store
+
+    with shop.app.app_context():
+        store = Store(name='Kho', slug='kho')
+        db.session.add(store)
+        db.session.flush()
+        product = Product(store_id=store.id, name='Chè ba màu', slug='che', price=15000, stock_quantity=0)
+        db.session.add(product)
+        db.session.commit()
+        product_id = product.id
+    shop.stores.invalidate()
+    assert client.post('/add-to-cart?store=kho', data={'product_id': str(product_id)}).status_code == 409
+
+    with shop.app.app_context():
+        db.session.execute(db.update(Product).where(Product.id == product_id).values(stock_quantity=10))
+        db.session.commit()
+    shop.stores.invalidate()  # như khi cache catalog của store hết hạn
+    assert client.post('/add-to-cart?store=kho', data={'product_id': str(product_id)}).status_code == 302
+
+
+def test_checkout_then_stock_job_keeps_one_count(shop, client):
+    from models import db
+    from models.product import Product
+
+    with shop.app.app_context():
+        product_id = db.session.execute(db.select(Product.id).where(Product.slug == 'che')).scalar_one()
+    shop.stores.invalidate()
+    sku = str(product_id)
+    held = 10 - shop.inventory.available(sku, 10)  # giỏ của test trước
+    client.post('/add-to-cart?store=kho', data={'product_id': str(product_id)})
+    response = client.post('/checkout?store=kho', data={'total': 15000, 'name': 'An', 'phone': '0900000000'})
+    assert response.status_code == 302
+    assert shop.inventory.available(sku, 10) == 9 - held
+
+    with shop.app.app_context():
+        while shop.jobs.run_one():
+            pass
+        stock = db.session.get(Product, product_id).stock_quantity
+    assert stock == 9
+    # Trong settle_ttl catalog cũ (10) vẫn tính phần đã bán, catalog mới (9) thì tính một lần
+    assert shop.inventory.available(sku, 10) == 9 - held
+    with shop.inventory._connect() as connection:
+        connection.execute('UPDATE committed SET settle_at = 0')
+    assert shop.inventory.available(sku, 9) == 9 - held
@@ -0,0 +1,23 @@
+import os
+import subprocess
+import sys
+
+from conftest import ROOT
+
+CHECK = '''
+import threading
+import app
+before = sorted(thread.name for thread in threading.enumerate() if thread.name.startswith('jobs-'))
+app.app.test_client().get('/health')
+after = sorted(thread.name for thread in threading.enumerate() if thread.name.startswith('jobs-'))
+print(before, after)
+'''
+
+
+def test_job_workers_start_on_first_request_not_at_import():
+    # preload_app nạp app trong master gunicorn: import không được tạo thread job trước khi fork
+    env = dict(os.environ, JOB_WORKERS='2')
+    result = subprocess.run([sys.executable, '-c', CHECK], cwd=ROOT, env=env,
+                            capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.split('\n')[-2] == "[] ['jobs-0', 'jobs-1']"
@@ -0,0 +1,76 @@
+import math
+import random
+
+import pytest
+
+from bench.synthetic import DISHES, FLAVORS, STYLES, make_products
+from search import SearchIndex, term_weights, tokenize
+
+
+def brute_force(products):
+    """Hàm chấm điểm mọi sản phẩm như định nghĩa: tổng theo từ của max(trọng số x idf)"""
+    weights = {product['id']: term_weights(product) for product in products}
+    counts = {}
+    for terms in weights.values():
+        for term in terms:
+            counts[term] = counts.get(term, 0) + 1
+    idf = {term: math.log(1 + len(products) / count) for term, count in counts.items()}
+    vocabulary = sorted(counts)
+
+    def search(query, limit):
+        terms = tokenize(query)
+        prefix = None if query[-1:].isspace() else terms.pop()
+        groups = [[term] if term in counts else [] for term in terms]
+        if prefix is not None:
+            groups.append([term for term in vocabulary if term.startswith(prefix)][:64])
+        scores = {}
+        for product_id, found in weights.items():
+            score = 0
+            for group in groups:
+                matched = max((found.get(term, 0) * idf[term] for term in group), default=0)
+                if not matched:
+                    break
+                score += matched
+            else:
+                scores[product_id] = score
+        return sorted(scores, key=lambda product_id: (-scores[product_id], product_id))[:limit]
+    return search
+
+
+@pytest.fixture(scope='module')
+def products():
+    return make_products(3000)
+
+
+@pytest.fixture(scope='module')
+def index(products):
+    index = SearchIndex()
+    index.add_many(products)
+    return index
+
+
+def queries(count, seed=0):
+    rng = random.Random(seed)
+    words = DISHES + FLAVORS + STYLES
+    for _ in range(count):
+        query = ' '.join(tokenize(' '.join(rng.sample(words, rng.randint(1, 3)))))
+        yield query[:rng.randint(1, len(query))]
+
+
+@pytest.mark.parametrize('limit', [1, 5, 20])
+def test_ranking_matches_brute_force(products, index, limit):
+    expected = brute_force(products)
+    for query in ['b', 'banh', 'banh ', 'banh m', 'sua da', 'ca phe s', 'pho bo', 'khong co', *queries(100)]:
+        assert index.search(query, limit) == expected(query, limit), query
+
+
+def test_ranking_follows_updates(products):
+    index = SearchIndex()
+    index.add_many(products[:500])
+    index.search('pho b')
+    renamed = dict(products[10], name='Phở bò Phở bò đặc biệt')
+    index.add(renamed)
+    index.remove(products[11]['id'])
+    current = [renamed if product['id'] == renamed['id'] else product
+               for product in products[:500] if product['id'] != products[11]['id']]
+    assert index.search('pho b') == brute_force(current)('pho b', 20)
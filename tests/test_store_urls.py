@@ -0,0 +1,81 @@
+import pytest
+
+
+@pytest.fixture(scope='module')
+def demo(shop):
+    from models import db
+    from models.product import Product
+    from models.store import Store
+
+    with shop.app.app_context():
+        store = Store(name='Demo', slug='demo')
+        db.session.add(store)
+        db.session.flush()
+        product = Product(store_id=store.id, name='Bún chả Demo', slug='bun-cha', price=40000, stock_quantity=100,
+                          image_url='https://example.com/bun-cha.jpg')
+        db.session.add(product)
+        db.session.commit()
+        product_id = product.id
+    shop.stores.invalidate()
+    return product_id
+
+
+def test_add_to_cart_redirects_within_store(demo, client):
+    response = client.post('/add-to-cart?store=demo', data={'product_id': str(demo)})
+    assert response.status_code == 302
+    assert 'store=demo' in response.headers['Location']
+
+
+def test_remove_redirects_within_store(demo, client):
+    response = client.post(f'/remove/{demo}?store=demo')
+    assert response.status_code == 302
+    assert 'store=demo' in response.headers['Location']
+
+
+def test_cart_forms_keep_store(demo, client):
+    client.post('/add-to-cart?store=demo', data={'product_id': str(demo)})
+    body = client.get('/cart?store=demo').get_data(as_text=True)
+    assert f'/remove/{demo}?store=demo' in body
+    assert '/checkout?store=demo' in body
+
+
+def test_image_urls_keep_store(shop, demo, client):
+    if not shop.images.available:
+        pytest.skip('Pillow không ghi được WebP/AVIF')
+    body = client.get('/?store=demo').get_data(as_text=True)
+    assert f'/images/{demo}/card-1x.' in body
+    assert '&amp;store=demo' in body
+
+
+def test_default_shell_does_not_inherit_session_store(demo, client):
+    client.get('/cart?store=demo')  # session nhớ store demo
+    body = client.get('/').get_data(as_text=True)
+    assert '/add-to-cart?store=' in body and '/add-to-cart?store=demo' not in body
+
+    client.post('/add-to-cart?store=', data={'product_id': '1'})
+    assert client.get('/api/cart/summary?store=').get_json() == {'count': 1, 'total': 25000}
+
+
+@pytest.mark.parametrize('path', ['/health', '/metrics', '/api/products', '/api/products?store=demo',
+                                  '/api/search?q=bun&store=demo'])
+def test_catalog_endpoints_do_not_vary_on_cookie(demo, client, path):
+    client.get('/cart?store=demo')
+    response = client.get(path)
+    assert 'Cookie' not in response.headers.get('Vary', '')
+    assert 'Set-Cookie' not in response.headers
+
+
+def test_api_products_takes_store_from_url_only(demo, client):
+    client.get('/cart?store=demo')
+    names = [item['name'] for item in client.get('/api/products').get_json()['items']]
+    assert 'Bún chả Demo' not in names
+    names = [item['name'] for item in client.get('/api/products?store=demo').get_json()['items']]
+    assert names == ['Bún chả Demo']
+
+
+def test_cart_and_catalog_report_the_catalog_stamp(shop, demo, client):
+    version = client.get('/api/products?store=demo').get_json()['version']
+    assert version == shop.stores.catalog(shop.stores.store('demo')).stamp
+    operations = [{'product_id': demo, 'op': 'set', 'quantity': 1}]
+    response = client.post('/api/cart?store=demo', json={'operations': operations})
+    assert response.get_json()['version'] == version
@@ -0,0 +1,30 @@
+import pytest
+
+
+@pytest.fixture
+def streaming(shop, monkeypatch):
+    monkeypatch.setattr(shop, 'STREAM_PAGES', '1')
+    return shop
+
+
+def test_streamed_home_is_not_buffered(streaming, client):
+    response = client.get('/', buffered=False)
+    assert response.status_code == 200
+    assert response.is_streamed
+    assert 'Content-Length' not in response.headers
+    assert 'Bánh mì thịt nướng' in response.get_data(as_text=True)
+
+
+def test_streamed_cart_renders_store_urls(streaming, client):
+    client.post('/add-to-cart', data={'product_id': '1'})
+    response = client.get('/cart')
+    assert response.status_code == 200
+    assert 'Bánh mì thịt nướng' in response.get_data(as_text=True)
+
+
+def test_streamed_home_is_cached_and_conditional(streaming, client):
+    response = client.get('/', buffered=False)
+    etag = response.headers['ETag']
+    body = response.get_data()
+    assert client.get('/', buffered=False).get_data() == body
+    assert client.get('/', headers={'If-None-Match': etag}).status_code == 304
@@ -0,0 +1,66 @@
+import pytest
+
+import tenants
+from tenants import StoreResolver
+
+
+@pytest.fixture
+def loads(monkeypatch):
+    sizes = {1: 5, 2: 5, 3: 400, 4: 400}
+    calls = []
+
+    def load_store_products(store_id):
+        calls.append(store_id)
+        return [{'id': index, 'name': f'Món {index}', 'price': 1000, 'description': ''}
+                for index in range(1, sizes[store_id] + 1)]
+
+    monkeypatch.setattr(tenants, 'load_store_products', load_store_products)
+    return calls
+
+
+def resolver():
+    small = tenants.deep_sizeof(tenants.Catalog(tenants.load_store_products(1)))
+    # Đủ chỗ cho hai store nhỏ, store lớn vượt quota và không còn chỗ
+    return StoreResolver(catalog_bytes=2 * small + 100, tenant_catalog_bytes=small + 50)
+
+
+def test_over_quota_catalog_is_not_rebuilt_per_request(loads):
+    stores = resolver()
+    small = [stores.catalog({'id': 1}), stores.catalog({'id': 2})]
+    loads.clear()
+
+    big = stores.catalog({'id': 3})
+    assert stores.catalog({'id': 3}) is big
+    assert loads == [3]
+
+    # Store nhỏ vẫn giữ catalog trong ngân sách
+    assert set(stores.catalog_usage()) == {1, 2}
+    assert set(stores.catalog_usage(overflow=True)) == {3}
+    assert [stores.catalog({'id': 1}), stores.catalog({'id': 2})] == small
+    assert loads == [3]
+
+
+def test_over_quota_stores_do_not_evict_each_other(loads):
+    stores = resolver()
+    loads.clear()
+    for store_id in (1, 2, 3, 4, 3, 4, 3, 4):
+        stores.catalog({'id': store_id})
+    assert loads == [1, 2, 3, 4]
+    assert set(stores.catalog_usage(overflow=True)) == {3, 4}
+
+
+def test_overflow_slots_are_lru(loads):
+    stores = resolver()
+    stores.overflow_catalogs = 1
+    stores.catalog({'id': 1})
+    stores.catalog({'id': 2})
+    stores.catalog({'id': 3})
+    stores.catalog({'id': 4})
+    assert set(stores.catalog_usage(overflow=True)) == {4}
+
+    stores.overflow_catalogs = 0
+    stores.invalidate()
+    loads.clear()
+    stores.catalog({'id': 3})
+    stores.catalog({'id': 3})
+    assert loads == [3, 3]
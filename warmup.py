@@ -0,0 +1,110 @@
+"""
+Warm-up khi worker khởi động và trạng thái sẵn sàng cho /health
+
+Các bước (nạp catalog, biên dịch template, render sẵn trang chủ...) chạy trong một
+thread nền của mỗi process, theo thứ tự đăng ký. Worker nhận request ngay từ đầu;
+request cần thứ chưa có sẽ tự nạp (catalog nạp một lần, các thread chờ chung), chỉ
+/health trả 503 cho tới khi mọi bước xong để load balancer chưa chuyển traffic vào.
+
+Với gunicorn preload_app, gunicorn.conf.py chờ warm-up xong trong master rồi mới
+fork: các worker dùng chung catalog/template đã dựng (copy-on-write) và không chạy lại.
+"""
+
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Bước lỗi thì chờ chừng này giây mới thử lại (mỗi request đều gọi start)
+RETRY_INTERVAL = 5
+
+
+class Warmup:
+    def __init__(self):
+        self._steps = []
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._pid = None
+        self._running = False
+        self._failed_at = None
+        self.timings = {}  # tên bước -> số giây
+        self.error = None
+
+    def init_app(self, app):
+        app.extensions['warmup'] = self
+        app.before_request(self.start)
+
+    def step(self, func):
+        """Decorator đăng ký một bước warm-up (chạy theo thứ tự đăng ký)"""
+        self._steps.append(func)
+        return func
+
+    @property
+    def ready(self):
+        return self._done.is_set() and self.error is None
+
+    def status(self):
+        if self.ready:
+            state = 'ready'
+        elif self.error is not None and not self._running:
+            state = 'failed'
+        else:
+            state = 'starting'
+        return dict(status=state, steps={name: round(seconds, 3) for name, seconds in self.timings.items()},
+                    error=self.error)
+
+    def run(self):
+        """Chạy mọi bước trong thread hiện tại; lỗi ở một bước thì dừng và ghi vào `error`"""
+        self.error = None
+        try:
+            for step in self._steps:
+                start = time.perf_counter()
+                try:
+                    step()
+                except Exception as error:
+                    logger.exception('Warm-up lỗi ở bước %s', step.__name__)
+                    self.error = f'{step.__name__}: {error}'
+                    self._failed_at = time.monotonic()
+                    return False
+                self.timings[step.__name__] = time.perf_counter() - start
+            logger.info('Warm-up xong: %s', ', '.join(f'{name} {seconds:.3f}s'
+                                                       for name, seconds in self.timings.items()))
+            self._done.set()
+            return True
+        finally:
+            self._running = False
+
+    def start(self):
+        """Chạy warm-up nền, một lần cho mỗi process (kể cả worker fork ra khi master chưa xong)"""
+        if self._done.is_set() or not self._should_start():
+            return
+        with self._lock:
+            if not self._should_start():
+                return
+            self._pid = os.getpid()
+            self._running = True
+            # Worker fork ra giữa chừng: Event của master có thể không bao giờ được set ở đây
+            self._done = threading.Event()
+        threading.Thread(target=self.run, name='warmup', daemon=True).start()
+
+    def _should_start(self):
+        if self._done.is_set():
+            return False
+        if self._pid != os.getpid():
+            return True
+        if self._running:
+            return False
+        return self._failed_at is not None and time.monotonic() - self._failed_at >= RETRY_INTERVAL
+
+    def wait(self, timeout=None):
+        """Chờ warm-up xong; True nếu đã sẵn sàng"""
+        self.start()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self._done.wait(0.05):
+            if not self._running:
+                return False
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+        return self.ready